@@ -2,24 +2,40 @@ from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 from config import Config
+from app.access_buffer import AccessBuffer
+from app.cache import CounterCache
+from app.database import RoutingSession, configure_profile, install_profile
+from app.identity import IdentityCache
+from app.instrumentation import Instrumentation
+from app.passwords import PasswordHasher
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 login_manager = LoginManager()
+instrumentation = Instrumentation()
+counters = CounterCache()
+passwords = PasswordHasher()
+identities = IdentityCache()
+access_buffer = AccessBuffer()
 
-def create_app():
+def create_app(config_class=Config):
     app = Flask(__name__)
-    app.config.from_object(Config)
+    app.config.from_object(config_class)
+    sqlite_profile = configure_profile(app)
     
     # Initialize extensions
     db.init_app(app)
     login_manager.init_app(app)
+    instrumentation.init_app(app)
+    counters.init_app(app)
+    passwords.init_app(app)
+    identities.init_app(app)
+    access_buffer.init_app(app)
     login_manager.login_view = 'auth.login'
     login_manager.login_message = 'Please log in to access this page.'
     
     @login_manager.user_loader
     def load_user(user_id):
-        from app.models import User
-        return User.query.get(int(user_id))
+        return identities.load(int(user_id))
     
     # Register blueprints
     from app.auth import bp as auth_bp
@@ -34,9 +50,16 @@ def create_app():
     from app.main import bp as main_bp
     app.register_blueprint(main_bp)
     
-    # Create database tables
+    from app import cli
+    cli.register(app)
+    
+    # Create database tables and bring existing ones up to date
     with app.app_context():
+        if sqlite_profile:
+            install_profile(app, db)
         db.create_all()
+        from app.migrations import upgrade
+        upgrade(db.engine)
     
     return app
 
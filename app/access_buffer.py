@@ -0,0 +1,295 @@
+"""Write-behind counters for library resource accesses.
+
+Opening a resource used to read, increment and commit its ``library_access``
+row on every click, which serialises hot resources on the single SQLite
+writer. Clicks are now added to an in-process buffer of (student, resource)
+deltas instead. The buffer is written with one upsert per batch
+(``download_count = download_count + delta``). This happens when it holds
+``LIBRARY_ACCESS_FLUSH_SIZE`` clicks or when its oldest click is
+``LIBRARY_ACCESS_FLUSH_INTERVAL`` seconds old. A background thread flushes
+idle buffers on the same interval. It starts with the first click, and
+``shutdown()`` stops it and writes what is left; it runs at interpreter exit
+and when a test app is torn down. A size of 1 writes every click through,
+which tests use.
+
+Each flush also adds the clicks to the per-class daily opens. The
+background thread, never a request, refreshes the popularity and "also
+opened" lists of the classes and resources the flushes touched, every
+``LIBRARY_POPULARITY_REFRESH_INTERVAL`` seconds (see ``app/popularity.py``).
+With the interval set to None only ``refresh()`` and the daily rebuild do.
+
+``counts`` and ``totals`` add the unflushed deltas of this process to the
+stored counts. Other worker processes see the clicks once they are
+flushed. Clicks buffered by a process that crashes are lost; that is the
+price of taking them off the write path.
+"""
+import atexit
+import functools
+import threading
+import time
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import func, select
+
+class _Store:
+    def __init__(self, app, size, interval, refresh_interval):
+        self.app = app
+        self.size = size
+        self.interval = interval
+        self.refresh_interval = refresh_interval
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.daily = {}
+        self.dirty_classes = set()
+        self.dirty_readers = set()
+        self.last_refresh = None
+        self.pending_clicks = 0
+        self.oldest = None
+        self.flusher = None
+        self.stopping = None
+        self.at_exit = None
+        self.flushes = 0
+        self.flushed_rows = 0
+        self.flushed_clicks = 0
+        self.failures = 0
+        self.flush_time = 0.0
+        self.refreshes = 0
+        self.refresh_failures = 0
+
+    def take(self):
+        """Remove and return the pending deltas."""
+        with self.lock:
+            batch, daily, clicks = self.pending, self.daily, self.pending_clicks
+            self.pending, self.daily, self.pending_clicks, self.oldest = {}, {}, 0, None
+        return batch, daily, clicks
+
+    def put_back(self, batch, daily, clicks):
+        with self.lock:
+            for key, (count, last) in batch.items():
+                pending = self.pending.get(key)
+                self.pending[key] = (count, last) if pending is None else (pending[0] + count, max(pending[1], last))
+            for key, count in daily.items():
+                self.daily[key] = self.daily.get(key, 0) + count
+            self.pending_clicks += clicks
+            self.oldest = self.oldest or time.monotonic()
+
+class AccessBuffer:
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('LIBRARY_ACCESS_FLUSH_SIZE', 500)
+        app.config.setdefault('LIBRARY_ACCESS_FLUSH_INTERVAL', 5)
+        app.config.setdefault('LIBRARY_POPULARITY_REFRESH_INTERVAL', 300)
+        app.extensions['access_buffer'] = _Store(app, app.config['LIBRARY_ACCESS_FLUSH_SIZE'],
+                                                 app.config['LIBRARY_ACCESS_FLUSH_INTERVAL'],
+                                                 app.config['LIBRARY_POPULARITY_REFRESH_INTERVAL'])
+
+    def _store(self):
+        return current_app.extensions['access_buffer']
+
+    def record(self, student_id, resource_id, course=None, year=None):
+        """Count one access of ``resource_id`` by ``student_id``, in class ``course``/``year``.
+
+        May flush the buffer, which commits the current session.
+        """
+        store = self._store()
+        now = time.monotonic()
+        opened_at = datetime.utcnow()
+        with store.lock:
+            count, _ = store.pending.get((student_id, resource_id), (0, None))
+            store.pending[student_id, resource_id] = (count + 1, opened_at)
+            if course and year:
+                key = (resource_id, course, year, opened_at.date())
+                store.daily[key] = store.daily.get(key, 0) + 1
+            store.pending_clicks += 1
+            store.oldest = store.oldest or now
+            due = store.pending_clicks >= store.size or now - store.oldest >= store.interval
+            if store.flusher is None:
+                store.stopping = threading.Event()
+                store.flusher = threading.Thread(target=self._flush_idle, args=(store, store.stopping), daemon=True,
+                                                 name='library-access-flusher')
+                store.flusher.start()
+                if store.at_exit is None:
+                    store.at_exit = functools.partial(self.shutdown, store.app)
+                    atexit.register(store.at_exit)
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Write the pending deltas in one upsert and commit. Returns the rows written.
+
+        The popularity lists are left to ``refresh``.
+        """
+        from app import db
+        from app.attendance import upsert
+        from app.models import LibraryAccess, LibraryAccessDaily
+        store = self._store()
+        batch, daily, clicks = store.take()
+        if not batch:
+            return 0
+        table = LibraryAccess.__table__
+        stmt = upsert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['student_id', 'resource_id'],
+            set_={
+                'download_count': func.coalesce(table.c.download_count, 0) + stmt.excluded.download_count,
+                'access_date': stmt.excluded.access_date,
+            }
+        )
+        daily_table = LibraryAccessDaily.__table__
+        daily_stmt = upsert(daily_table)
+        daily_stmt = daily_stmt.on_conflict_do_update(
+            index_elements=['resource_id', 'course', 'year', 'day'],
+            set_={'opens': daily_table.c.opens + daily_stmt.excluded.opens}
+        )
+        started = time.perf_counter()
+        try:
+            # Only a student's first open of a resource changes the "also opened" lists
+            existing = set(map(tuple, db.session.execute(select(table.c.student_id, table.c.resource_id).where(
+                table.c.student_id.in_({student_id for student_id, _ in batch}),
+                table.c.resource_id.in_({resource_id for _, resource_id in batch}),
+            ))))
+            db.session.execute(stmt, [
+                {'student_id': student_id, 'resource_id': resource_id, 'download_count': count, 'access_date': last}
+                for (student_id, resource_id), (count, last) in sorted(batch.items())
+            ])
+            if daily:
+                db.session.execute(daily_stmt, [
+                    {'resource_id': resource_id, 'course': course, 'year': year, 'day': day, 'opens': count}
+                    for (resource_id, course, year, day), count in sorted(daily.items())
+                ])
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            store.put_back(batch, daily, clicks)
+            with store.lock:
+                store.failures += 1
+            current_app.logger.exception('Flushing %d library accesses failed; kept for the next flush', clicks)
+            return 0
+        with store.lock:
+            store.flushes += 1
+            store.flushed_rows += len(batch)
+            store.flushed_clicks += clicks
+            store.flush_time += time.perf_counter() - started
+            store.dirty_classes.update((course, year) for _, course, year, _ in daily)
+            store.dirty_readers.update(student_id for student_id, _ in batch.keys() - existing)
+        return len(batch)
+
+    def refresh(self, force=True):
+        """Refresh the popularity lists touched by earlier flushes.
+
+        Unless ``force``, waits ``LIBRARY_POPULARITY_REFRESH_INTERVAL`` seconds
+        between refreshes, and does nothing when that is None.
+        """
+        from app import db
+        from app.popularity import co_access_affected, refresh_co_access, refresh_popularity
+        store = self._store()
+        with store.lock:
+            if not force and not self._refresh_due(store):
+                return False
+            if not (store.dirty_classes or store.dirty_readers):
+                return False
+            classes, readers = store.dirty_classes, store.dirty_readers
+            store.dirty_classes, store.dirty_readers, store.last_refresh = set(), set(), time.monotonic()
+        try:
+            with db.engine.begin() as conn:
+                refresh_popularity(conn, classes)
+                if readers:
+                    refresh_co_access(conn, co_access_affected(conn, readers))
+        except Exception:
+            with store.lock:
+                store.dirty_classes |= classes
+                store.dirty_readers |= readers
+                store.refresh_failures += 1
+            current_app.logger.exception('Refreshing library popularity failed; retrying on the next refresh')
+            return False
+        with store.lock:
+            store.refreshes += 1
+        return True
+
+    def _refresh_due(self, store):
+        # Called with the lock held
+        if store.refresh_interval is None or not (store.dirty_classes or store.dirty_readers):
+            return False
+        return store.last_refresh is None or time.monotonic() - store.last_refresh >= store.refresh_interval
+
+    def shutdown(self, app=None):
+        """Stop the background thread and flush what is still buffered.
+
+        Recording again starts a new thread.
+        """
+        app = app or current_app._get_current_object()
+        store = app.extensions['access_buffer']
+        with store.lock:
+            flusher, stopping, at_exit = store.flusher, store.stopping, store.at_exit
+            store.flusher = store.stopping = store.at_exit = None
+        if flusher is not None:
+            stopping.set()
+            flusher.join()
+        if at_exit is not None:
+            atexit.unregister(at_exit)
+        if store.pending:
+            with app.app_context():
+                self.flush()
+
+    def _flush_idle(self, store, stopping):
+        from app import db
+        while not stopping.wait(store.interval):
+            with store.lock:
+                due = store.oldest is not None and time.monotonic() - store.oldest >= store.interval
+                stale = self._refresh_due(store)
+            if due or stale:
+                with store.app.app_context():
+                    if due:
+                        self.flush()
+                    self.refresh(force=False)
+                    db.session.remove()
+
+    def _pending(self, matches):
+        store = self._store()
+        with store.lock:
+            return [(key, count) for key, (count, _) in store.pending.items() if matches(key)]
+
+    def counts(self, student_id, resource_ids):
+        """``{resource_id: opens}`` for ``student_id``, including unflushed ones."""
+        from app import db
+        from app.models import LibraryAccess
+        resource_ids = set(resource_ids)
+        counts = dict(db.session.execute(select(LibraryAccess.resource_id, LibraryAccess.download_count).where(
+            LibraryAccess.student_id == student_id, LibraryAccess.resource_id.in_(resource_ids)
+        )).all())
+        for (_, resource_id), count in self._pending(lambda key: key[0] == student_id and key[1] in resource_ids):
+            counts[resource_id] = (counts.get(resource_id) or 0) + count
+        return counts
+
+    def totals(self, resource_ids):
+        """``{resource_id: opens by all students}``, including unflushed ones."""
+        from app import db
+        from app.models import LibraryAccess
+        resource_ids = set(resource_ids)
+        totals = dict(db.session.execute(select(
+            LibraryAccess.resource_id, func.sum(LibraryAccess.download_count)
+        ).where(LibraryAccess.resource_id.in_(resource_ids)).group_by(LibraryAccess.resource_id)).all())
+        for (_, resource_id), count in self._pending(lambda key: key[1] in resource_ids):
+            totals[resource_id] = (totals.get(resource_id) or 0) + count
+        return totals
+
+    def stats(self):
+        store = self._store()
+        with store.lock:
+            return {
+                'pending_rows': len(store.pending),
+                'pending_clicks': store.pending_clicks,
+                'flush_size': store.size,
+                'flush_interval': store.interval,
+                'flushes': store.flushes,
+                'flushed_rows': store.flushed_rows,
+                'flushed_clicks': store.flushed_clicks,
+                'failures': store.failures,
+                'avg_flush_ms': store.flush_time / store.flushes * 1000 if store.flushes else 0.0,
+                'popularity_refreshes': store.refreshes,
+                'popularity_refresh_failures': store.refresh_failures,
+                'dirty_classes': len(store.dirty_classes),
+            }
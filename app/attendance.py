@@ -0,0 +1,228 @@
+"""Attendance writes and the per-subject summaries maintained alongside them.
+
+Two derived tables are kept in step with ``attendance`` by ``mark_roster``:
+``attendance_summary`` with all-time counters per (student, subject), and
+``attendance_monthly`` with the same counters per calendar month, which
+the attendance chart reads. Bulk loads that bypass ``mark_roster`` rebuild
+both with ``flask rebuild attendance-summary``.
+"""
+from datetime import date, datetime
+from sqlalchemy import Date, case, cast, delete, func, insert, literal, select
+from sqlalchemy.dialects import postgresql, sqlite
+from app import db
+from app.models import Attendance, AttendanceMonthly, AttendanceSummary, Student
+
+CHART_MAX_MONTHS = 24
+
+ATTENDANCE_STATUSES = ('present', 'absent', 'late')
+
+def upsert(table):
+    """Return a dialect-specific INSERT supporting ``on_conflict_do_update``."""
+    if db.session.get_bind().dialect.name == 'postgresql':
+        return postgresql.insert(table)
+    return sqlite.insert(table)
+
+def _student_id(record):
+    """The record's ``student_id`` as an int, or None when it is missing or malformed.
+
+    Numeric strings such as ``"12"`` are accepted, as form-encoded clients send them.
+    """
+    student_id = record.get('student_id') if isinstance(record, dict) else None
+    if isinstance(student_id, int) and not isinstance(student_id, bool):
+        return student_id
+    if isinstance(student_id, str) and student_id.strip().isascii() and student_id.strip().isdigit():
+        return int(student_id)
+    return None
+
+def mark_roster(subject, attendance_date, records, marked_by):
+    """Mark attendance for a whole roster of one subject and date.
+
+    ``records`` is a list of ``{'student_id': ..., 'status': ..., 'remarks': ...}``
+    dicts. Valid rows are written with a single upsert on the
+    (student_id, subject, date) unique index, and the affected attendance
+    summaries and monthly rollups are refreshed in the same transaction;
+    the caller commits.
+    Returns one result dict per input record, in order; malformed records
+    get an error result rather than failing the roster.
+    """
+    student_ids = {_student_id(record) for record in records} - {None}
+    known = {student_id for (student_id,) in db.session.query(Student.id).filter(
+        Student.id.in_(student_ids)
+    )}
+    existing = {student_id for (student_id,) in db.session.query(Attendance.student_id).filter(
+        Attendance.student_id.in_(student_ids),
+        Attendance.subject == subject,
+        Attendance.date == attendance_date
+    )}
+
+    now = datetime.utcnow()
+    results = []
+    rows = []
+    seen = set()
+    for record in records:
+        if not isinstance(record, dict):
+            results.append({'student_id': None, 'result': 'error', 'error': 'Record must be an object'})
+            continue
+        student_id = _student_id(record)
+        status = record.get('status')
+        if student_id is None:
+            results.append({'student_id': None, 'result': 'error', 'error': 'student_id must be an integer'})
+        elif student_id not in known:
+            results.append({'student_id': student_id, 'result': 'error', 'error': 'Unknown student'})
+        elif status not in ATTENDANCE_STATUSES:
+            results.append({'student_id': student_id, 'result': 'error', 'error': f'Invalid status: {status}'})
+        elif student_id in seen:
+            results.append({'student_id': student_id, 'result': 'error', 'error': 'Duplicate entry in roster'})
+        else:
+            seen.add(student_id)
+            rows.append({
+                'student_id': student_id,
+                'subject': subject,
+                'date': attendance_date,
+                'status': status,
+                'marked_by': marked_by,
+                'marked_at': now,
+                'remarks': record.get('remarks'),
+            })
+            results.append({
+                'student_id': student_id,
+                'result': 'updated' if student_id in existing else 'created',
+                'status': status,
+            })
+
+    if rows:
+        stmt = upsert(Attendance.__table__)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['student_id', 'subject', 'date'],
+            set_={
+                'status': stmt.excluded.status,
+                'marked_by': stmt.excluded.marked_by,
+                'marked_at': stmt.excluded.marked_at,
+                'remarks': func.coalesce(stmt.excluded.remarks, Attendance.__table__.c.remarks),
+            }
+        )
+        db.session.execute(stmt, rows)
+        refresh_summaries(subject, [row['student_id'] for row in rows])
+        refresh_monthly(subject, attendance_date, [row['student_id'] for row in rows])
+
+    return results
+
+def _count_status(status):
+    return func.sum(case((Attendance.status == status, 1), else_=0))
+
+def _counters():
+    return [
+        func.count(Attendance.id),
+        _count_status('present'),
+        _count_status('late'),
+        _count_status('absent'),
+        func.current_timestamp(),
+    ]
+
+def _summary_select():
+    """Per-(student, subject) counters aggregated from the attendance rows."""
+    return select(
+        Attendance.student_id, Attendance.subject, *_counters()
+    ).group_by(Attendance.student_id, Attendance.subject)
+
+SUMMARY_COLUMNS = ['student_id', 'subject', 'total', 'present', 'late', 'absent', 'updated_at']
+
+def refresh_summaries(subject, student_ids):
+    """Recompute the summaries of ``student_ids`` for ``subject``.
+
+    Counters are recomputed from the attendance rows of just those keys
+    (an index range each) rather than adjusted by deltas, so they cannot
+    drift when two markers overwrite the same row concurrently.
+    """
+    query = _summary_select().where(
+        Attendance.subject == subject,
+        Attendance.student_id.in_(student_ids)
+    )
+    stmt = upsert(AttendanceSummary.__table__).from_select(SUMMARY_COLUMNS, query)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['student_id', 'subject'],
+        set_={column: stmt.excluded[column] for column in SUMMARY_COLUMNS[2:]}
+    )
+    db.session.execute(stmt)
+
+def rebuild_summaries(conn):
+    """Rebuild every attendance summary from scratch on ``conn``."""
+    conn.execute(delete(AttendanceSummary))
+    conn.execute(insert(AttendanceSummary).from_select(SUMMARY_COLUMNS, _summary_select()))
+
+MONTHLY_COLUMNS = ['student_id', 'subject', 'month', 'total', 'present', 'late', 'absent', 'updated_at']
+
+def month_start(day):
+    return day.replace(day=1)
+
+def add_months(day, months):
+    """First day of the month ``months`` after the month of ``day``."""
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+def refresh_monthly(subject, attendance_date, student_ids):
+    """Recompute the monthly rollups of ``student_ids`` for the month of ``attendance_date``."""
+    month = month_start(attendance_date)
+    query = select(
+        Attendance.student_id, Attendance.subject, literal(month, Date), *_counters()
+    ).where(
+        Attendance.subject == subject,
+        Attendance.student_id.in_(student_ids),
+        Attendance.date >= month,
+        Attendance.date < add_months(month, 1)
+    ).group_by(Attendance.student_id, Attendance.subject)
+    stmt = upsert(AttendanceMonthly.__table__).from_select(MONTHLY_COLUMNS, query)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['student_id', 'subject', 'month'],
+        set_={column: stmt.excluded[column] for column in MONTHLY_COLUMNS[3:]}
+    )
+    db.session.execute(stmt)
+
+def _month_of(column, dialect):
+    if dialect == 'postgresql':
+        return cast(func.date_trunc('month', column), Date)
+    return func.date(column, 'start of month')
+
+def rebuild_monthly(conn):
+    """Rebuild every monthly attendance rollup from scratch on ``conn``."""
+    month = _month_of(Attendance.date, conn.dialect.name)
+    query = select(
+        Attendance.student_id, Attendance.subject, month, *_counters()
+    ).group_by(Attendance.student_id, Attendance.subject, month)
+    conn.execute(delete(AttendanceMonthly))
+    conn.execute(insert(AttendanceMonthly).from_select(MONTHLY_COLUMNS, query))
+
+def attendance_chart(student_id, months, by_subject=False, today=None):
+    """Monthly attendance percentages of a student over the last ``months`` months.
+
+    Returns ``(data, last_modified)``. ``data`` lists the months that have
+    attendance and their overall percentages, plus one series per subject
+    (``None`` where the subject has no marks that month) when ``by_subject``.
+    ``last_modified`` is when the newest rollup in the window was written.
+    """
+    first = add_months(month_start(today or date.today()), 1 - months)
+    rollups = AttendanceMonthly.query.filter(
+        AttendanceMonthly.student_id == student_id,
+        AttendanceMonthly.month >= first
+    ).order_by(AttendanceMonthly.month, AttendanceMonthly.subject).all()
+
+    totals = {}
+    subjects = {}
+    for rollup in rollups:
+        total, present = totals.get(rollup.month, (0, 0))
+        totals[rollup.month] = (total + rollup.total, present + rollup.present)
+        subjects.setdefault(rollup.subject, {})[rollup.month] = rollup.percentage
+    month_list = sorted(totals)
+
+    data = {
+        'months': [month.strftime('%Y-%m') for month in month_list],
+        'percentages': [present / total * 100 if total else 0 for total, present in
+                        (totals[month] for month in month_list)],
+    }
+    if by_subject:
+        data['subjects'] = {
+            subject: [values.get(month) for month in month_list]
+            for subject, values in sorted(subjects.items())
+        }
+    last_modified = max((rollup.updated_at for rollup in rollups if rollup.updated_at), default=None)
+    return data, last_modified
@@ -3,7 +3,8 @@ from flask_login import login_user, logout_user, current_user
 from app.auth import bp
 from app.models import User
 from app.auth.forms import LoginForm, RegistrationForm
-from app import db
+from app import db, passwords
+from app.passwords import HashingBusy
 
 @bp.route('/login', methods=['GET', 'POST'])
 def login():
@@ -16,7 +17,17 @@ def login():
     form = LoginForm()
     if form.validate_on_submit():
         user = User.query.filter_by(username=form.username.data).first()
-        if user and user.check_password(form.password.data):
+        try:
+            authenticated = user is not None and user.check_password(form.password.data)
+            if authenticated and passwords.needs_rehash(user.password_hash):
+                # Upgrade hashes made with old parameters while the password is at hand
+                user.set_password(form.password.data)
+                db.session.commit()
+                passwords.record_rehash()
+        except HashingBusy:
+            flash('The server is busy signing in other users. Please try again in a moment.')
+            return render_template('auth/login.html', title='Sign In', form=form), 503
+        if authenticated:
             login_user(user, remember=form.remember_me.data)
             next_page = request.args.get('next')
             if not next_page:
@@ -41,7 +52,11 @@ def register():
     form = RegistrationForm()
     if form.validate_on_submit():
         user = User(username=form.username.data, email=form.email.data, role=form.role.data)
-        user.set_password(form.password.data)
+        try:
+            user.set_password(form.password.data)
+        except HashingBusy:
+            flash('The server is busy. Please try again in a moment.')
+            return render_template('auth/register.html', title='Register', form=form), 503
         db.session.add(user)
         db.session.commit()
         flash('Registration successful')
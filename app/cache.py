@@ -0,0 +1,110 @@
+"""In-process cache for dashboard counters and other cheap-to-store aggregates.
+
+Values are cached per worker process with a TTL and dropped explicitly
+when the tables they are computed from change. Each aggregate registers
+the models it depends on with ``invalidate_on``; inserts, updates and
+deletes of those models through the ORM invalidate it once the session
+commits. Writes that bypass the ORM (Core INSERT/UPDATE statements) must
+call ``invalidate`` or ``invalidate_after_commit`` themselves. Other workers see the change when their
+TTL expires.
+"""
+import threading
+import time
+from functools import wraps
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+class _Store:
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+class CounterCache:
+    def __init__(self, app=None):
+        self._dependencies = {}
+        event.listen(Session, 'after_commit', self._invalidate_after_commit)
+        event.listen(Session, 'after_rollback', self._discard_after_rollback)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('COUNTER_CACHE_TTL', 60)
+        app.extensions['counter_cache'] = _Store(app.config['COUNTER_CACHE_TTL'])
+
+    def _store(self):
+        return current_app.extensions['counter_cache']
+
+    def cached(self, name, ttl=None):
+        """Cache the decorated function's result under ``name`` plus its arguments."""
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args):
+                store = self._store()
+                key = (name,) + args
+                now = time.monotonic()
+                with store.lock:
+                    entry = store.entries.get(key)
+                    if entry is not None and entry[1] > now:
+                        store.hits += 1
+                        return entry[0]
+                    store.misses += 1
+                value = func(*args)
+                with store.lock:
+                    store.entries[key] = (value, now + (store.ttl if ttl is None else ttl))
+                return value
+            return wrapper
+        return decorator
+
+    def invalidate(self, *names):
+        """Drop every cached value stored under any of ``names``."""
+        store = self._store()
+        with store.lock:
+            stale = [key for key in store.entries if key[0] in names]
+            for key in stale:
+                del store.entries[key]
+            store.invalidations += len(stale)
+
+    def invalidate_after_commit(self, session, *names):
+        """Invalidate ``names`` once ``session`` commits, for Core writes."""
+        session.info.setdefault('stale_counters', set()).update(names)
+
+    def invalidate_on(self, model, *names):
+        """Invalidate ``names`` after a commit that changed rows of ``model``."""
+        if model not in self._dependencies:
+            self._dependencies[model] = set()
+            for action in ('after_insert', 'after_update', 'after_delete'):
+                event.listen(model, action, self._mark_dirty)
+        self._dependencies[model].update(names)
+
+    def _mark_dirty(self, mapper, connection, target):
+        session = Session.object_session(target)
+        if session is not None:
+            session.info.setdefault('stale_counters', set()).update(
+                self._dependencies[mapper.class_]
+            )
+
+    def stats(self):
+        store = self._store()
+        with store.lock:
+            lookups = store.hits + store.misses
+            return {
+                'entries': len(store.entries),
+                'hits': store.hits,
+                'misses': store.misses,
+                'invalidations': store.invalidations,
+                'hit_rate': store.hits / lookups if lookups else 0.0,
+                'ttl': store.ttl,
+            }
+
+    def _invalidate_after_commit(self, session):
+        stale = session.info.pop('stale_counters', None)
+        if stale and has_app_context() and 'counter_cache' in current_app.extensions:
+            self.invalidate(*stale)
+
+    def _discard_after_rollback(self, session):
+        session.info.pop('stale_counters', None)
@@ -0,0 +1,84 @@
+import click
+from app import db
+
+def register(app):
+    @app.cli.group()
+    def rebuild():
+        """Rebuild derived tables from their source records."""
+        pass
+
+    @rebuild.command('attendance-summary')
+    def attendance_summary():
+        """Recompute per-subject and monthly attendance counters from attendance records."""
+        from app.attendance import rebuild_monthly, rebuild_summaries
+        with db.engine.begin() as conn:
+            rebuild_summaries(conn)
+            rebuild_monthly(conn)
+        click.echo('Attendance summaries and monthly rollups rebuilt.')
+
+    @rebuild.command('library-search')
+    def library_search():
+        """Re-index every library resource for full-text search."""
+        from app.search import fts_available, rebuild_search_index
+        if not fts_available(db.engine):
+            click.echo('Full-text search index is only used on SQLite.')
+            return
+        with db.engine.begin() as conn:
+            rebuild_search_index(conn)
+        click.echo('Library search index rebuilt.')
+
+    @rebuild.command('rankings')
+    @click.option('--course')
+    @click.option('--year', type=int)
+    @click.option('--semester', type=int)
+    def rankings(course, year, semester):
+        """Recompute class rankings and subject toppers from exam results."""
+        from app.rankings import rebuild_rankings
+        with db.engine.begin() as conn:
+            count = rebuild_rankings(conn, course, year, semester)
+        click.echo(f'Ranked {count} students.')
+
+    @rebuild.command('fee-ledger')
+    def fee_ledger():
+        """Recompute what every student owes from fee structures and payments."""
+        from app.fees import rebuild_ledger
+        with db.engine.begin() as conn:
+            rebuild_ledger(conn)
+        click.echo('Fee ledger rebuilt.')
+
+    @rebuild.command('event-audience')
+    def event_audience():
+        """Re-parse the target audience of every event."""
+        from app.events import rebuild_audiences
+        with db.engine.begin() as conn:
+            rebuild_audiences(conn)
+        click.echo('Event audiences rebuilt.')
+
+    @rebuild.command('bus-allocation')
+    @click.option('--route', 'route_ids', type=int, multiple=True, help='only these route ids')
+    def bus_allocation(route_ids):
+        """Recount bus occupancy and refill free seats from the waitlists."""
+        from app.transport import rebalance_routes
+        with db.engine.begin() as conn:
+            summary = rebalance_routes(conn, list(route_ids) or None)
+        click.echo(f"{summary['allocated']} seats allocated, {summary['waitlisted']} waitlisted, "
+                   f"{summary['moved']} riders moved.")
+
+    @rebuild.command('bus-stops')
+    def bus_stops():
+        """Re-parse the stops of every bus route."""
+        from app.transport import rebuild_stops
+        with db.engine.begin() as conn:
+            rebuild_stops(conn)
+        click.echo('Bus stops rebuilt.')
+
+    @rebuild.command('library-popularity')
+    @click.option('--backfill', is_flag=True, help='first recount daily opens from the access counters')
+    def library_popularity(backfill):
+        """Recompute popular resources per class and "also opened" lists; run daily."""
+        from app.popularity import backfill_daily, rebuild_popularity
+        with db.engine.begin() as conn:
+            if backfill:
+                backfill_daily(conn)
+            rebuild_popularity(conn)
+        click.echo('Library popularity rebuilt.')
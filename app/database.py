@@ -0,0 +1,108 @@
+"""SQLite engine profile and read/write session routing.
+
+For a file-backed SQLite database (``SQLITE_PROFILE``, on by default):
+
+* the database runs in WAL mode, so readers keep reading from the last
+  committed snapshot while a writer commits;
+* every connection gets the ``SQLITE_PRAGMAS`` (busy_timeout,
+  synchronous=NORMAL, mmap_size, cache_size);
+* writes go through a pool of ``SQLITE_WRITE_POOL_SIZE`` connections
+  (one by default: SQLite has a single writer, so writers queue in the
+  pool instead of spinning on the busy handler) that start their
+  transactions with BEGIN IMMEDIATE;
+* reads in GET/HEAD/OPTIONS requests use a separate pool of
+  ``SQLITE_READ_POOL_SIZE`` ``query_only`` connections.
+
+A safe-method request that writes anyway is switched to the write
+connection at its first flush or INSERT/UPDATE/DELETE and stays there
+until the transaction ends, so it reads its own writes. Other databases,
+and in-memory SQLite as used by the tests, are left as configured.
+"""
+import sqlalchemy as sa
+from flask import current_app, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+DEFAULT_PRAGMAS = {
+    'busy_timeout': 5000,
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64000,
+}
+
+def _file_database(url):
+    url = sa.engine.make_url(url)
+    return url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:') \
+        and 'mode=memory' not in url.database
+
+def configure_profile(app):
+    """Set the engine options for the profile; call before ``db.init_app``.
+
+    Returns whether the profile applies to the configured database.
+    """
+    app.config.setdefault('SQLITE_PROFILE', True)
+    app.config.setdefault('SQLITE_PRAGMAS', DEFAULT_PRAGMAS)
+    app.config.setdefault('SQLITE_WRITE_POOL_SIZE', 1)
+    app.config.setdefault('SQLITE_READ_POOL_SIZE', 8)
+    if not (app.config['SQLITE_PROFILE'] and _file_database(app.config['SQLALCHEMY_DATABASE_URI'])):
+        return False
+    options = dict(app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+    options.setdefault('poolclass', sa.pool.QueuePool)
+    options.setdefault('pool_size', app.config['SQLITE_WRITE_POOL_SIZE'])
+    options.setdefault('max_overflow', 0)
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+    return True
+
+def install_profile(app, db):
+    """Attach the pragmas to the write engine and create the read engine."""
+    writer = db.engines[None]
+    _prepare(writer, dict(journal_mode='WAL', **app.config['SQLITE_PRAGMAS']), 'BEGIN IMMEDIATE')
+    reader = sa.create_engine(
+        writer.url,
+        poolclass=sa.pool.QueuePool,
+        pool_size=app.config['SQLITE_READ_POOL_SIZE'],
+        max_overflow=app.config['SQLITE_READ_POOL_SIZE'],
+        connect_args={'check_same_thread': False},
+    )
+    _prepare(reader, dict(app.config['SQLITE_PRAGMAS'], query_only='ON'), 'BEGIN')
+    app.extensions['sqlite_reader'] = reader
+
+def _prepare(engine, pragmas, begin):
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        # Let SQLAlchemy, not pysqlite, decide when transactions begin
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
+
+    @event.listens_for(engine, 'begin')
+    def begin_transaction(conn):
+        # On the driver connection, so query tracking does not count it
+        conn.connection.driver_connection.execute(begin)
+
+class RoutingSession(Session):
+    """Session reading from the read engine in safe-method requests."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self._routes_to_reader(clause):
+            return current_app.extensions['sqlite_reader']
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _routes_to_reader(self, clause):
+        if self.info.get('writing') or 'sqlite_reader' not in current_app.extensions:
+            return False
+        if not has_request_context() or request.method not in SAFE_METHODS:
+            return False
+        if self._flushing or isinstance(clause, sa.sql.dml.UpdateBase):
+            self.info['writing'] = True
+            return False
+        return True
+
+@event.listens_for(RoutingSession, 'after_transaction_end')
+def _end_writing(session, transaction):
+    if transaction.parent is None:
+        session.info.pop('writing', None)
@@ -0,0 +1,69 @@
+"""Event audiences and the per-student event feed.
+
+``Event.target_audience`` is free text such as ``all``, ``Computer Science``
+or ``Computer Science, year_2``. It is parsed once, when the event is
+written, into ``event_audience`` rows of (kind, value): ``('all', '')``,
+``('course', <lowercased course>)`` or ``('year', <year>)``. An event is
+for a student when any of its rows matches, so the feed looks up the
+student's three keys in the (kind, value, event_id) index instead of
+pattern-matching the text of every event.
+
+Events written through the ORM get their rows at flush time; bulk loads
+rebuild them with ``flask rebuild event-audience``.
+"""
+import re
+from datetime import date
+from sqlalchemy import and_, delete, event, insert, inspect, or_, select
+from sqlalchemy.orm import Session
+from app.models import Event, EventAudience
+
+YEAR_RE = re.compile(r'year[_ ]?(\d+)', re.IGNORECASE)
+
+def parse_audience(text):
+    """Return the sorted ``(kind, value)`` pairs described by ``text``."""
+    audiences = set()
+    for token in re.split(r'[,;]', text or ''):
+        token = ' '.join(token.split())
+        year = YEAR_RE.fullmatch(token)
+        if not token:
+            continue
+        if token.lower() in ('all', 'everyone'):
+            audiences.add(('all', ''))
+        elif year:
+            audiences.add(('year', str(int(year.group(1)))))
+        else:
+            audiences.add(('course', token.lower()))
+    return sorted(audiences) or [('all', '')]
+
+def event_feed(student, past=False, today=None):
+    """Active events for ``student``: upcoming ones, or past ones with ``past``."""
+    today = today or date.today()
+    audience = select(EventAudience.event_id).where(or_(
+        and_(EventAudience.kind == 'all', EventAudience.value == ''),
+        and_(EventAudience.kind == 'course', EventAudience.value == (student.course or '').lower()),
+        and_(EventAudience.kind == 'year', EventAudience.value == str(student.year)),
+    ))
+    return Event.query.filter(
+        Event.is_active == True,
+        Event.event_date < today if past else Event.event_date >= today,
+        Event.id.in_(audience)
+    )
+
+def rebuild_audiences(conn):
+    """Re-parse the audience of every event on ``conn``."""
+    conn.execute(delete(EventAudience))
+    rows = [{'event_id': event_id, 'kind': kind, 'value': value}
+            for event_id, text in conn.execute(select(Event.id, Event.target_audience))
+            for kind, value in parse_audience(text)]
+    if rows:
+        conn.execute(insert(EventAudience), rows)
+
+@event.listens_for(Session, 'before_flush')
+def _set_audiences(session, flush_context, instances):
+    for obj in list(session.new) + list(session.dirty):
+        if not isinstance(obj, Event):
+            continue
+        if obj in session.new or inspect(obj).attrs.target_audience.history.has_changes():
+            parsed = parse_audience(obj.target_audience)
+            if sorted((row.kind, row.value) for row in obj.audiences) != parsed:
+                obj.audiences = [EventAudience(kind=kind, value=value) for kind, value in parsed]
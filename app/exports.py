@@ -0,0 +1,77 @@
+"""Streaming CSV and NDJSON exports.
+
+Rows are fetched in batches of ``EXPORT_BATCH_SIZE`` (``yield_per``; a
+server-side cursor on PostgreSQL) and encoded batch by batch into the
+response body, so memory use does not grow with the size of the export.
+Clients that accept gzip get the body compressed on the fly.
+"""
+import csv
+import io
+import json
+import zlib
+from datetime import date, datetime, time
+from flask import Response, current_app, request, stream_with_context
+from app import db
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+def _json_default(value):
+    if isinstance(value, (date, datetime, time)):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+def csv_chunks(columns, batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for batch in batches:
+        writer.writerows(batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+def ndjson_chunks(columns, batches):
+    for batch in batches:
+        yield ''.join(
+            json.dumps(dict(zip(columns, row)), default=_json_default) + '\n'
+            for row in batch
+        )
+
+def gzip_chunks(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+def stream_export(stmt, fmt, filename):
+    """Stream the rows of ``stmt`` as a ``fmt`` file download.
+
+    The column labels of ``stmt`` become the CSV header / NDJSON keys.
+    """
+    batch_size = current_app.config.get('EXPORT_BATCH_SIZE', 1000)
+    columns = [column.name for column in stmt.selected_columns]
+    compress = request.accept_encodings['gzip'] > 0
+
+    def generate():
+        result = db.session.execute(stmt, execution_options={'yield_per': batch_size})
+        try:
+            encoder = csv_chunks if fmt == 'csv' else ndjson_chunks
+            chunks = encoder(columns, result.partitions())
+            if compress:
+                chunks = gzip_chunks(chunks)
+            yield from chunks
+        finally:
+            result.close()
+
+    response = Response(stream_with_context(generate()), content_type=EXPORT_FORMATS[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}.{fmt}'
+    response.headers['Vary'] = 'Accept-Encoding'
+    if compress:
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
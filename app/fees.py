@@ -0,0 +1,187 @@
+"""Fee payment approval and the fee ledger.
+
+A payment moves from ``pending`` to ``level1_approved`` (any staff member)
+and then to ``approved`` (the principal). ``approve_payments`` applies one
+level to many payments at once: each chunk of ids, or the whole filter, is
+one ``UPDATE ... RETURNING`` whose WHERE clause also requires the status
+the level starts from. The status check is the optimistic lock. When two
+approvers race for the same payments, the database approves each payment
+once, and only from the right status. The loser gets a conflict outcome
+instead of overwriting the approver or skipping level 1. The updates
+bypass the ORM, so the pending approvals counter is marked stale here; it
+is dropped when the caller commits.
+
+``fee_ledger`` holds one row per (student, fee structure) the student owes
+or has paid against. A student owes every structure of their current
+course, year and semester. ``paid`` counts every payment that was not
+rejected, ``approved`` only the approved ones, and ``outstanding`` is what
+is left of the total fee after ``paid``. The rows of just the affected
+students and structures are recomputed whenever payments, students or fee
+structures are flushed through the ORM, and by ``approve_payments``. Bulk
+loads rebuild the table with ``flask rebuild fee-ledger``.
+"""
+from datetime import datetime
+from sqlalchemy import and_, case, delete, event, func, insert, select, true, tuple_, union, update
+from sqlalchemy.orm import Session
+from app import counters, db
+from app.attendance import upsert
+from app.models import FeeLedger, FeePayment, FeeStructure, Student
+
+LEVELS = {
+    1: ('pending', 'level1_approved', 'level1_approver', 'level1_approval_date'),
+    2: ('level1_approved', 'approved', 'level2_approver', 'level2_approval_date'),
+}
+
+def approve_payments(level, approver_id, payment_ids=None, criteria=(), chunk_size=500):
+    """Approve ``payment_ids``, or every payment matching ``criteria``, at ``level``.
+
+    Returns one ``{'id', 'outcome', 'status'}`` dict per payment, where
+    ``outcome`` is ``approved``, ``conflict`` (the payment is not in the
+    status ``level`` approves from; ``status`` says where it is) or
+    ``not_found``. With ``criteria`` only the approved payments are listed.
+    """
+    expected, target, approver_column, date_column = LEVELS[level]
+    table = FeePayment.__table__
+    stmt = update(table).where(table.c.status == expected, *criteria).values({
+        'status': target,
+        approver_column: approver_id,
+        date_column: datetime.utcnow(),
+    }).returning(table.c.id, table.c.student_id, table.c.fee_structure_id)
+
+    approved = {}
+    if payment_ids is None:
+        approved.update((row.id, row) for row in db.session.execute(stmt))
+        outcomes = [{'id': payment_id, 'outcome': 'approved', 'status': target} for payment_id in sorted(approved)]
+    else:
+        payment_ids = list(dict.fromkeys(payment_ids))
+        current = {}
+        for start in range(0, len(payment_ids), chunk_size):
+            chunk = payment_ids[start:start + chunk_size]
+            approved.update((row.id, row) for row in db.session.execute(stmt.where(table.c.id.in_(chunk))))
+            missed = [payment_id for payment_id in chunk if payment_id not in approved]
+            if missed:
+                current.update(db.session.execute(
+                    select(table.c.id, table.c.status).where(table.c.id.in_(missed))
+                ).all())
+        outcomes = []
+        for payment_id in payment_ids:
+            if payment_id in approved:
+                outcomes.append({'id': payment_id, 'outcome': 'approved', 'status': target})
+            elif payment_id in current:
+                outcomes.append({'id': payment_id, 'outcome': 'conflict', 'status': current[payment_id]})
+            else:
+                outcomes.append({'id': payment_id, 'outcome': 'not_found', 'status': None})
+
+    if approved:
+        refresh_ledger(db.session.connection(),
+                       student_ids={row.student_id for row in approved.values()},
+                       fee_structure_ids={row.fee_structure_id for row in approved.values()})
+        counters.invalidate_after_commit(db.session, 'pending_fee_approvals')
+    return outcomes
+
+LEDGER_COLUMNS = ['student_id', 'fee_structure_id', 'course', 'year', 'semester',
+                  'due', 'paid', 'approved', 'outstanding', 'updated_at']
+
+def _scoped(stmt, student_column, structure_column, student_ids, fee_structure_ids):
+    if student_ids is not None:
+        stmt = stmt.where(student_column.in_(student_ids))
+    if fee_structure_ids is not None:
+        stmt = stmt.where(structure_column.in_(fee_structure_ids))
+    return stmt
+
+def _ledger_select(student_ids=None, fee_structure_ids=None):
+    """Ledger rows computed from students, fee structures and payments."""
+    amount = FeePayment.amount_paid
+    payments = _scoped(select(
+        FeePayment.student_id,
+        FeePayment.fee_structure_id,
+        func.sum(case((FeePayment.status == 'rejected', 0.0), else_=amount)).label('paid'),
+        func.sum(case((FeePayment.status == 'approved', amount), else_=0.0)).label('approved'),
+    ), FeePayment.student_id, FeePayment.fee_structure_id, student_ids, fee_structure_ids).group_by(
+        FeePayment.student_id, FeePayment.fee_structure_id
+    ).subquery()
+    owed = _scoped(select(Student.id, FeeStructure.id).join(FeeStructure, and_(
+        FeeStructure.course == Student.course,
+        FeeStructure.year == Student.year,
+        FeeStructure.semester == Student.semester
+    )), Student.id, FeeStructure.id, student_ids, fee_structure_ids)
+    pairs = union(owed, select(payments.c.student_id, payments.c.fee_structure_id)).subquery()
+    student_id, fee_structure_id = pairs.c
+
+    paid = func.coalesce(payments.c.paid, 0.0)
+    return select(
+        student_id,
+        fee_structure_id,
+        FeeStructure.course,
+        FeeStructure.year,
+        FeeStructure.semester,
+        FeeStructure.total_fee,
+        paid,
+        func.coalesce(payments.c.approved, 0.0),
+        case((FeeStructure.total_fee > paid, FeeStructure.total_fee - paid), else_=0.0),
+        func.current_timestamp(),
+    ).select_from(pairs).join(
+        FeeStructure, FeeStructure.id == fee_structure_id
+    ).outerjoin(payments, and_(
+        payments.c.student_id == student_id,
+        payments.c.fee_structure_id == fee_structure_id
+    )).where(true())  # SQLite needs a WHERE to parse an upsert whose SELECT ends in a join
+
+def refresh_ledger(conn, student_ids=None, fee_structure_ids=None, chunk_size=500):
+    """Recompute the ledger rows of ``student_ids`` and/or ``fee_structure_ids``.
+
+    Rows are recomputed from the source tables rather than adjusted by
+    deltas, so they cannot drift, and rows a student no longer owes (after
+    a change of semester, say) are deleted.
+    """
+    if student_ids is not None:
+        student_ids = sorted(student_ids)
+        if len(student_ids) > chunk_size:
+            for start in range(0, len(student_ids), chunk_size):
+                refresh_ledger(conn, student_ids[start:start + chunk_size], fee_structure_ids, chunk_size)
+            return
+    fresh = _ledger_select(student_ids, fee_structure_ids)
+    keys = select(*fresh.selected_columns[:2])
+    conn.execute(_scoped(
+        delete(FeeLedger), FeeLedger.student_id, FeeLedger.fee_structure_id, student_ids, fee_structure_ids
+    ).where(tuple_(FeeLedger.student_id, FeeLedger.fee_structure_id).not_in(keys)))
+    stmt = upsert(FeeLedger.__table__).from_select(LEDGER_COLUMNS, fresh)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['student_id', 'fee_structure_id'],
+        set_={column: stmt.excluded[column] for column in LEDGER_COLUMNS[2:]}
+    )
+    conn.execute(stmt)
+
+def rebuild_ledger(conn):
+    """Rebuild the whole fee ledger from scratch on ``conn``."""
+    conn.execute(delete(FeeLedger))
+    conn.execute(insert(FeeLedger).from_select(LEDGER_COLUMNS, _ledger_select()))
+
+def _mark_stale(mapper, connection, target):
+    session = Session.object_session(target)
+    if session is None:
+        return
+    stale = session.info.setdefault('stale_ledger', {'payments': set(), 'students': set(), 'structures': set()})
+    if isinstance(target, FeePayment):
+        stale['payments'].add((target.student_id, target.fee_structure_id))
+    elif isinstance(target, Student):
+        stale['students'].add(target.id)
+    else:
+        stale['structures'].add(target.id)
+
+def _refresh_stale(session, flush_context):
+    stale = session.info.pop('stale_ledger', None)
+    if not stale:
+        return
+    conn = session.connection()
+    if stale['payments']:
+        refresh_ledger(conn, {pair[0] for pair in stale['payments']}, {pair[1] for pair in stale['payments']})
+    if stale['students']:
+        refresh_ledger(conn, student_ids=stale['students'])
+    if stale['structures']:
+        refresh_ledger(conn, fee_structure_ids=stale['structures'])
+
+for model in (FeePayment, Student, FeeStructure):
+    for action in ('after_insert', 'after_update', 'after_delete'):
+        event.listen(model, action, _mark_stale)
+event.listen(Session, 'after_flush', _refresh_stale)
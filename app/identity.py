@@ -0,0 +1,145 @@
+"""Cached loading of the logged-in user.
+
+``load_user`` runs on every authenticated request, and nearly every view
+then reads ``current_user.student`` or ``current_user.staff``. The identity
+cache loads a user together with both profiles in one query and keeps a
+snapshot of the column values in a per-process LRU, for at most
+``IDENTITY_CACHE_TTL`` seconds and ``IDENTITY_CACHE_SIZE`` users. A hit
+rebuilds the objects from the snapshot and merges them into the request's
+session without touching the database.
+
+Entries are keyed by user id. Commits that insert, update or delete a user
+or a student/staff profile drop the user's entry and bump a store-wide
+invalidation count; a load that overlapped any invalidation is not cached,
+so a snapshot taken concurrently with a change is never served. Nothing is
+kept per user outside the bounded LRU. Writes that bypass the ORM must call
+``invalidate`` themselves; other worker processes see the change when their
+TTL expires.
+"""
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app, has_app_context
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, joinedload, make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
+
+class _Store:
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.generation = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+def _snapshot(obj):
+    if obj is None:
+        return None
+    return {attr.key: getattr(obj, attr.key) for attr in inspect(obj).mapper.column_attrs}
+
+def _restore(model, values):
+    if values is None:
+        return None
+    obj = model(**values)
+    make_transient_to_detached(obj)
+    return obj
+
+class IdentityCache:
+    def __init__(self, app=None):
+        event.listen(Session, 'after_commit', self._invalidate_after_commit)
+        event.listen(Session, 'after_rollback', self._discard_after_rollback)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        from app.models import Staff, Student, User
+        app.config.setdefault('IDENTITY_CACHE_SIZE', 1024)
+        app.config.setdefault('IDENTITY_CACHE_TTL', 60)
+        app.extensions['identity_cache'] = _Store(app.config['IDENTITY_CACHE_SIZE'],
+                                                  app.config['IDENTITY_CACHE_TTL'])
+        for model in (User, Student, Staff):
+            for action in ('after_insert', 'after_update', 'after_delete'):
+                if not event.contains(model, action, self._mark_dirty):
+                    event.listen(model, action, self._mark_dirty)
+
+    def _store(self):
+        return current_app.extensions['identity_cache']
+
+    def load(self, user_id):
+        """Return the user with ``user_id`` and its profiles, attached to the session."""
+        from app import db
+        from app.models import Staff, Student, User
+        store = self._store()
+        now = time.monotonic()
+        with store.lock:
+            generation = store.generation
+            entry = store.entries.get(user_id)
+            if entry is not None and entry[1] > now:
+                store.entries.move_to_end(user_id)
+                store.hits += 1
+            else:
+                entry = None
+                store.misses += 1
+
+        if entry is None:
+            user = User.query.options(
+                joinedload(User.student), joinedload(User.staff)
+            ).filter_by(id=user_id).one_or_none()
+            if user is not None:
+                snapshot = (_snapshot(user), _snapshot(user.student), _snapshot(user.staff))
+                with store.lock:
+                    # Skip the store when an identity changed while we were loading
+                    if store.generation == generation:
+                        store.entries[user_id] = (snapshot, now + store.ttl)
+                        store.entries.move_to_end(user_id)
+                        while len(store.entries) > store.size:
+                            store.entries.popitem(last=False)
+            return user
+
+        user_values, student_values, staff_values = entry[0]
+        user = _restore(User, user_values)
+        set_committed_value(user, 'student', _restore(Student, student_values))
+        set_committed_value(user, 'staff', _restore(Staff, staff_values))
+        return db.session.merge(user, load=False)
+
+    def invalidate(self, *user_ids):
+        """Drop the cached identities of ``user_ids``."""
+        store = self._store()
+        with store.lock:
+            store.generation += 1
+            for user_id in user_ids:
+                if store.entries.pop(user_id, None) is not None:
+                    store.invalidations += 1
+
+    def stats(self):
+        store = self._store()
+        with store.lock:
+            lookups = store.hits + store.misses
+            return {
+                'entries': len(store.entries),
+                'size': store.size,
+                'hits': store.hits,
+                'misses': store.misses,
+                'invalidations': store.invalidations,
+                'hit_rate': store.hits / lookups if lookups else 0.0,
+                'ttl': store.ttl,
+            }
+
+    def _mark_dirty(self, mapper, connection, target):
+        from app.models import User
+        session = Session.object_session(target)
+        if session is None:
+            return
+        user_id = target.id if isinstance(target, User) else target.user_id
+        session.info.setdefault('stale_identities', set()).add(user_id)
+
+    def _invalidate_after_commit(self, session):
+        stale = session.info.pop('stale_identities', None)
+        if stale and has_app_context() and 'identity_cache' in current_app.extensions:
+            self.invalidate(*stale)
+
+    def _discard_after_rollback(self, session):
+        session.info.pop('stale_identities', None)
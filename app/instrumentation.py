@@ -0,0 +1,200 @@
+"""Per-request performance instrumentation and an N+1 query guard.
+
+Every statement executed while a request is being handled is recorded on
+``g`` together with its duration; template rendering and the whole
+handler are timed as well. The totals are sent back in a ``Server-Timing``
+header and kept in an in-memory ring buffer for the staff performance page.
+
+When the view returns, the request is also checked against its query
+budget and for one statement shape repeating many times, which is the
+signature of a lazy relationship load inside a template loop. Violations
+raise ``QueryBudgetExceeded`` when ``SQL_GUARD_RAISE`` is set (tests) and
+are logged as warnings otherwise.
+"""
+import math
+import re
+import time
+from collections import Counter, defaultdict, deque
+from datetime import datetime
+from flask import before_render_template, current_app, g, has_app_context, request, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+_IN_LIST_RE = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_NUMBER_RE = re.compile(r'\b\d+\b')
+
+# Trackers opened with ``track_queries()``; meant for tests and debugging
+_active_trackers = []
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+def statement_shape(statement):
+    """Normalise a statement so that repeats differing only in values match."""
+    shape = _IN_LIST_RE.sub('(?)', statement)
+    shape = _NUMBER_RE.sub('N', shape)
+    return ' '.join(shape.split())
+
+class QueryTracker:
+    def __init__(self):
+        self.statements = []
+        self.shapes = Counter()
+        self.db_time = 0.0
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def record(self, statement):
+        self.statements.append(statement)
+        self.shapes[statement_shape(statement)] += 1
+
+    def record_duration(self, seconds):
+        self.db_time += seconds
+
+    def problems(self, budget, repeat_threshold):
+        """Describe every way the recorded statements break the limits."""
+        problems = []
+        if budget is not None and self.count > budget:
+            problems.append(f'{self.count} SQL statements exceed the budget of {budget}')
+        for shape, times in self.shapes.items():
+            if times >= repeat_threshold:
+                problems.append(f'statement repeated {times} times (likely N+1): {shape[:200]}')
+        return problems
+
+    def __enter__(self):
+        _active_trackers.append(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        _active_trackers.remove(self)
+        return False
+
+def track_queries():
+    """Context manager recording every statement executed inside it."""
+    return QueryTracker()
+
+def query_budget(limit):
+    """Override the per-request statement budget for one view."""
+    def decorator(view):
+        view.query_budget = limit
+        return view
+    return decorator
+
+def _request_tracker():
+    return g.get('query_tracker') if has_app_context() else None
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _record_statement(conn, cursor, statement, parameters, context, executemany):
+    for tracker in _active_trackers:
+        tracker.record(statement)
+    tracker = _request_tracker()
+    if tracker is not None:
+        tracker.record(statement)
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _record_duration(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info['query_started'].pop()
+    elapsed = time.perf_counter() - started
+    for tracker in _active_trackers:
+        tracker.record_duration(elapsed)
+    tracker = _request_tracker()
+    if tracker is not None:
+        tracker.record_duration(elapsed)
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+class Instrumentation:
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SQL_QUERY_BUDGET', 30)
+        app.config.setdefault('SQL_REPEAT_THRESHOLD', 5)
+        app.config.setdefault('SQL_GUARD_RAISE', False)
+        app.config.setdefault('INSTRUMENTATION_BUFFER_SIZE', 2000)
+        app.extensions['instrumentation'] = deque(maxlen=app.config['INSTRUMENTATION_BUFFER_SIZE'])
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        before_render_template.connect(self._render_started, app)
+        template_rendered.connect(self._render_finished, app)
+
+    def _start(self):
+        g.query_tracker = QueryTracker()
+        g.request_started = time.perf_counter()
+        g.render_time = 0.0
+
+    def _render_started(self, sender, template, context, **extra):
+        g.render_started = time.perf_counter()
+
+    def _render_finished(self, sender, template, context, **extra):
+        started = g.pop('render_started', None)
+        if started is not None:
+            g.render_time = g.get('render_time', 0.0) + time.perf_counter() - started
+
+    def _finish(self, response):
+        tracker = g.pop('query_tracker', None)
+        if tracker is None:
+            return response
+
+        total = time.perf_counter() - g.pop('request_started')
+        render = g.pop('render_time', 0.0)
+        response.headers['Server-Timing'] = ', '.join([
+            f'db;dur={tracker.db_time * 1000:.1f};desc="{tracker.count} queries"',
+            f'tpl;dur={render * 1000:.1f}',
+            f'app;dur={total * 1000:.1f}',
+        ])
+        current_app.extensions['instrumentation'].append({
+            'endpoint': request.endpoint or '(unmatched)',
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'queries': tracker.count,
+            'db_ms': tracker.db_time * 1000,
+            'render_ms': render * 1000,
+            'total_ms': total * 1000,
+            'at': datetime.utcnow(),
+        })
+
+        view = current_app.view_functions.get(request.endpoint)
+        budget = getattr(view, 'query_budget', current_app.config['SQL_QUERY_BUDGET'])
+        problems = tracker.problems(budget, current_app.config['SQL_REPEAT_THRESHOLD'])
+        if problems:
+            message = f'{request.method} {request.path}: ' + '; '.join(problems)
+            if current_app.config['SQL_GUARD_RAISE']:
+                raise QueryBudgetExceeded(message)
+            current_app.logger.warning(message)
+        return response
+
+    def recent(self):
+        """Snapshot of the ring buffer, oldest first."""
+        return list(current_app.extensions['instrumentation'])
+
+    def endpoint_summary(self):
+        """Latency percentiles per endpoint, slowest p95 first."""
+        by_endpoint = defaultdict(list)
+        for record in self.recent():
+            by_endpoint[record['endpoint']].append(record)
+
+        summary = []
+        for endpoint, records in by_endpoint.items():
+            totals = sorted(record['total_ms'] for record in records)
+            summary.append({
+                'endpoint': endpoint,
+                'requests': len(records),
+                'p50': percentile(totals, 0.50),
+                'p95': percentile(totals, 0.95),
+                'p99': percentile(totals, 0.99),
+                'max': totals[-1],
+                'avg_db_ms': sum(record['db_ms'] for record in records) / len(records),
+                'avg_render_ms': sum(record['render_ms'] for record in records) / len(records),
+                'avg_queries': sum(record['queries'] for record in records) / len(records),
+            })
+        return sorted(summary, key=lambda row: row['p95'], reverse=True)
@@ -0,0 +1,95 @@
+"""Storage and delivery of library resource files.
+
+Files live under ``LIBRARY_FILES_DIR`` (``instance/library`` by default).
+``LibraryResource.file_path`` is relative to it. ``send_resource`` answers
+with werkzeug's ``send_file``:
+
+* the body is the open file handed to the server's ``wsgi.file_wrapper``,
+  which servers such as gunicorn send with ``sendfile(2)`` instead of
+  copying it through Python;
+* ``Range`` requests get ``206 Partial Content``, or ``416`` past the end
+  of the file, and ``If-Range`` falls back to the full file once it
+  changed;
+* the ETag (inode, size and mtime in nanoseconds) is strong, and with
+  ``Last-Modified`` answers conditional GETs with ``304``. Responses are
+  ``private, no-cache``, so browsers keep the bytes but revalidate:
+  access is checked on every request.
+
+With ``LIBRARY_FILE_OFFLOAD`` set to ``x-accel-redirect`` (nginx) or
+``x-sendfile`` (Apache, lighttpd), the route still authorizes and logs the
+access, then names the file in a header and sends no body. The front
+proxy serves the bytes, ranges and validators itself.
+``LIBRARY_FILE_OFFLOAD_PREFIX`` is the internal nginx location that maps
+to ``LIBRARY_FILES_DIR``.
+"""
+import mimetypes
+import os
+import uuid
+from contextlib import contextmanager
+from urllib.parse import quote
+from flask import abort, current_app, request
+from werkzeug.security import safe_join
+from werkzeug.utils import secure_filename, send_file
+
+def files_dir():
+    return current_app.config.get('LIBRARY_FILES_DIR') or os.path.join(current_app.instance_path, 'library')
+
+@contextmanager
+def store_upload(upload):
+    """Save an uploaded file under a fresh name and yield its ``file_path``.
+
+    The file is written under a temporary name and moved into place when the
+    block, which commits the row pointing at it, exits cleanly; if the block
+    fails it is removed. Yields None when no file was uploaded.
+    """
+    if upload is None or not upload.filename:
+        yield None
+        return
+    _, extension = os.path.splitext(secure_filename(upload.filename))
+    file_path = uuid.uuid4().hex + extension.lower()
+    os.makedirs(files_dir(), exist_ok=True)
+    path = os.path.join(files_dir(), file_path)
+    partial = os.path.join(files_dir(), f'.{file_path}.part')
+    upload.save(partial)
+    try:
+        yield file_path
+    except BaseException:
+        os.remove(partial)
+        raise
+    os.replace(partial, path)
+
+def resolve(file_path):
+    """The absolute path of ``file_path``, or None when it is missing or outside ``files_dir``."""
+    path = safe_join(files_dir(), file_path or '')
+    return path if path is not None and os.path.isfile(path) else None
+
+def file_etag(stat):
+    return f'{stat.st_ino:x}-{stat.st_size:x}-{stat.st_mtime_ns:x}'
+
+def download_name(resource, path):
+    _, extension = os.path.splitext(path)
+    return (secure_filename(resource.title) or 'resource') + extension
+
+def send_resource(resource):
+    """The response delivering ``resource``'s file; 404 when it has none on disk."""
+    path = resolve(resource.file_path)
+    if path is None:
+        abort(404)
+    offload = current_app.config.get('LIBRARY_FILE_OFFLOAD')
+    if offload == 'x-accel-redirect':
+        response = current_app.response_class(mimetype=mimetypes.guess_type(path)[0] or 'application/octet-stream')
+        response.headers.set('Content-Disposition', 'inline', filename=download_name(resource, path))
+        prefix = current_app.config.get('LIBRARY_FILE_OFFLOAD_PREFIX', '/protected-library/')
+        response.headers['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + quote(os.path.relpath(path, files_dir()))
+    else:
+        stat = os.stat(path)
+        # The proxy behind X-Sendfile answers ranges and validators itself
+        response = send_file(path, request.environ, download_name=download_name(resource, path),
+                             conditional=offload != 'x-sendfile', etag=file_etag(stat),
+                             last_modified=stat.st_mtime, use_x_sendfile=offload == 'x-sendfile',
+                             response_class=current_app.response_class)
+        if offload != 'x-sendfile':
+            # werkzeug only says so on 206s; viewers such as pdf.js look for it on the first response
+            response.accept_ranges = 'bytes'
+    response.cache_control.private = True
+    return response
@@ -0,0 +1,172 @@
+"""Bulk entry of exam marks from CSV or XLSX uploads.
+
+An upload has one row per student with the columns ``student_id`` (the
+roll number, e.g. STU001), ``marks`` and optionally ``remarks``. Rows are
+read one at a time from the uploaded stream and handled in batches of
+``MARKS_BATCH_SIZE``. Each row is checked against the examination's roster
+(students of its course, year and semester) and its ``max_marks``. Grades
+for a batch come from one pass over the configured ``GRADE_SCALE``, and
+each batch is written with one upsert on (student_id, examination_id).
+Invalid rows are reported by line number and skipped; the valid rows are
+saved in the caller's transaction.
+
+XLSX files are read with openpyxl. Files that cannot be decoded raise
+``UploadError`` like any other refused upload.
+"""
+import codecs
+import csv
+from bisect import bisect_right
+from sqlalchemy import func
+from app import db
+from app.attendance import upsert
+from app.models import ExamResult, Student
+
+DEFAULT_GRADE_SCALE = [(85, 'A'), (70, 'B'), (55, 'C'), (40, 'D'), (0, 'F')]
+COLUMNS = ('student_id', 'marks', 'remarks')
+
+class UploadError(Exception):
+    pass
+
+def read_rows(stream, filename):
+    """Yield ``(line, {column: value})`` for the data rows of an upload."""
+    if filename.lower().endswith('.xlsx'):
+        rows = _xlsx_rows(stream)
+    elif filename.lower().endswith('.csv'):
+        rows = _csv_rows(stream)
+    else:
+        raise UploadError('Upload a .csv or .xlsx file.')
+
+    header = next(rows, None)
+    if header is None:
+        raise UploadError('The file is empty.')
+    header = [str(name or '').strip().lower() for name in header]
+    missing = [name for name in COLUMNS[:2] if name not in header]
+    if missing:
+        raise UploadError(f"Missing column(s): {', '.join(missing)}")
+    positions = {name: header.index(name) for name in COLUMNS if name in header}
+
+    for line, row in enumerate(rows, start=2):
+        values = {name: row[index] if index < len(row) else None for name, index in positions.items()}
+        if all(value in (None, '') for value in values.values()):
+            continue
+        yield line, values
+
+def _csv_rows(stream):
+    try:
+        yield from csv.reader(codecs.iterdecode(stream, 'utf-8-sig'))
+    except UnicodeDecodeError:
+        raise UploadError('The CSV file is not UTF-8 text; save it as "CSV UTF-8" and upload it again.') from None
+    except csv.Error as error:
+        raise UploadError(f'The CSV file could not be read: {error}') from None
+
+def _xlsx_rows(stream):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise UploadError('XLSX uploads need openpyxl installed; upload a CSV instead.') from None
+    # openpyxl fails in many ways on zips that are not workbooks (KeyError for
+    # missing parts, BadZipFile, InvalidFileException, XML parse errors...)
+    try:
+        workbook = load_workbook(stream, read_only=True, data_only=True)
+    except Exception:
+        raise UploadError('The file is not a valid XLSX workbook.') from None
+    try:
+        sheet = workbook.active
+        if sheet is None:
+            raise UploadError('The workbook has no worksheet to read.')
+        yield from sheet.iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+def grades_for(percentages, scale):
+    """Grade every percentage in ``percentages`` against ``scale``.
+
+    ``scale`` lists ``(minimum percentage, grade)`` pairs in any order.
+    """
+    steps = sorted(scale)
+    thresholds = [minimum for minimum, _ in steps]
+    grades = [grade for _, grade in steps]
+    return [grades[max(bisect_right(thresholds, percentage) - 1, 0)] for percentage in percentages]
+
+def _roster(exam):
+    return dict(db.session.query(Student.student_id, Student.id).filter(
+        Student.course == exam.course,
+        Student.year == exam.year,
+        Student.semester == exam.semester
+    ))
+
+def _parse_marks(value, max_marks):
+    if isinstance(value, str):
+        value = value.strip()
+    try:
+        marks = float(value)
+    except (TypeError, ValueError):
+        return None, f'Marks must be a number, got {value!r}'
+    if not marks.is_integer():
+        return None, f'Marks must be a whole number, got {value}'
+    if not 0 <= marks <= max_marks:
+        return None, f'Marks must be between 0 and {max_marks}'
+    return int(marks), None
+
+def import_marks(exam, rows, scale, batch_size=1000):
+    """Validate, grade and upsert ``rows`` from ``read_rows`` for ``exam``.
+
+    Returns ``{'saved', 'created', 'updated', 'errors'}``, where ``errors``
+    lists ``{'line', 'student_id', 'error'}`` for every rejected row. The
+    caller commits.
+    """
+    roster = _roster(exam)
+    existing = {student_id for (student_id,) in db.session.query(ExamResult.student_id).filter(
+        ExamResult.examination_id == exam.id
+    )}
+    summary = {'saved': 0, 'created': 0, 'updated': 0, 'errors': []}
+    seen = set()
+    batch = []
+
+    def flush():
+        grades = grades_for([row['marks_obtained'] * 100 / (exam.max_marks or 1) for row in batch], scale)
+        for row, grade in zip(batch, grades):
+            row['grade'] = grade
+        stmt = upsert(ExamResult.__table__)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['student_id', 'examination_id'],
+            set_={
+                'marks_obtained': stmt.excluded.marks_obtained,
+                'grade': stmt.excluded.grade,
+                'remarks': func.coalesce(stmt.excluded.remarks, ExamResult.__table__.c.remarks),
+            }
+        )
+        db.session.execute(stmt, batch)
+        batch.clear()
+
+    for line, values in rows:
+        roll = str(values.get('student_id') or '').strip()
+        student_id = roster.get(roll)
+        error = None
+        if not roll:
+            error = 'Missing student_id'
+        elif student_id is None:
+            error = 'Not on the roster for this examination'
+        elif student_id in seen:
+            error = 'Duplicate entry in file'
+        else:
+            marks, error = _parse_marks(values.get('marks'), exam.max_marks)
+        if error:
+            summary['errors'].append({'line': line, 'student_id': roll, 'error': error})
+            continue
+
+        seen.add(student_id)
+        remarks = values.get('remarks')
+        batch.append({
+            'examination_id': exam.id,
+            'student_id': student_id,
+            'marks_obtained': marks,
+            'remarks': str(remarks).strip() if remarks not in (None, '') else None,
+        })
+        summary['saved'] += 1
+        summary['updated' if student_id in existing else 'created'] += 1
+        if len(batch) == batch_size:
+            flush()
+    if batch:
+        flush()
+    return summary
@@ -0,0 +1,207 @@
+"""Schema migrations for databases created before a model change.
+
+``db.create_all()`` only creates missing tables, so indexes and constraints
+added to existing tables are applied here. Each migration runs once, inside
+its own transaction, and is recorded in the ``schema_migrations`` table.
+"""
+from datetime import datetime
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateColumn
+from app import db
+
+MIGRATIONS = []
+
+def migration(version):
+    """Register ``func(conn)`` as the migration identified by ``version``."""
+    def decorator(func):
+        MIGRATIONS.append((version, func))
+        return func
+    return decorator
+
+# Indexes created by released migrations and since replaced on the models,
+# as those migrations created them; later migrations drop them
+RETIRED_INDEXES = {
+    # Replaced by uq_library_access_student_resource in 0013
+    'ix_library_access_student_resource':
+        'CREATE INDEX IF NOT EXISTS ix_library_access_student_resource ON library_access (student_id, resource_id)',
+}
+
+def create_indexes(conn, *names):
+    """Create the named indexes declared on the models, if missing."""
+    indexes = {index.name: index
+               for table in db.metadata.tables.values()
+               for index in table.indexes}
+    for name in names:
+        if name in RETIRED_INDEXES:
+            conn.execute(text(RETIRED_INDEXES[name]))
+        else:
+            indexes[name].create(bind=conn, checkfirst=True)
+
+def add_columns(conn, table_name, *names):
+    """Add the named columns declared on the model to an existing table, if missing."""
+    table = db.metadata.tables[table_name]
+    existing = {column['name'] for column in inspect(conn).get_columns(table_name)}
+    for name in names:
+        if name not in existing:
+            ddl = CreateColumn(table.c[name]).compile(dialect=conn.dialect)
+            conn.execute(text(f'ALTER TABLE {table_name} ADD COLUMN {ddl}'))
+
+def upgrade(engine):
+    """Apply every registered migration that has not run yet."""
+    with engine.begin() as conn:
+        conn.execute(text(
+            'CREATE TABLE IF NOT EXISTS schema_migrations ('
+            'version VARCHAR(100) PRIMARY KEY, applied_at DATETIME NOT NULL)'
+        ))
+        applied = {row[0] for row in conn.execute(text('SELECT version FROM schema_migrations'))}
+
+    for version, func in sorted(MIGRATIONS):
+        if version in applied:
+            continue
+        with engine.begin() as conn:
+            func(conn)
+            conn.execute(
+                text('INSERT INTO schema_migrations (version, applied_at) VALUES (:version, :applied_at)'),
+                {'version': version, 'applied_at': datetime.utcnow()}
+            )
+
+@migration('0001_hot_table_indexes')
+def add_hot_table_indexes(conn):
+    create_indexes(
+        conn,
+        'ix_student_user_id',
+        'ix_staff_user_id',
+        'ix_exam_result_examination_id',
+        'ix_fee_payment_student_structure',
+        'ix_fee_payment_status_date',
+        'ix_bus_route_active',
+        'ix_bus_route_id',
+        'ix_bus_subscription_student_active',
+        'ix_bus_subscription_route_id',
+        'ix_attendance_student_date',
+        'ix_attendance_student_status',
+        'ix_event_event_date',
+        'ix_event_active_date',
+        'ix_library_resource_available',
+        'ix_library_resource_subject',
+        'ix_library_resource_type',
+        'ix_library_access_student_resource',
+        'ix_library_access_resource_id',
+    )
+    # Refresh planner statistics for the new indexes
+    conn.execute(text('ANALYZE'))
+
+@migration('0002_attendance_unique_mark')
+def make_attendance_marks_unique(conn):
+    # Keep the most recent mark where concurrent writers created duplicates
+    conn.execute(text(
+        'DELETE FROM attendance WHERE id NOT IN ('
+        'SELECT MAX(id) FROM attendance GROUP BY student_id, subject, date)'
+    ))
+    conn.execute(text('DROP INDEX IF EXISTS ix_attendance_student_subject_date'))
+    create_indexes(conn, 'uq_attendance_student_subject_date')
+
+@migration('0003_listing_indexes')
+def add_listing_indexes(conn):
+    create_indexes(
+        conn,
+        'ix_student_course_year_semester',
+        'ix_examination_exam_date',
+        'ix_examination_course_year_semester',
+        'ix_fee_payment_payment_date',
+    )
+
+@migration('0004_attendance_summary_backfill')
+def backfill_attendance_summary(conn):
+    from app.attendance import rebuild_summaries
+    rebuild_summaries(conn)
+
+@migration('0005_library_search_index')
+def add_library_search_index(conn):
+    from app.search import create_search_index, fts_available
+    if fts_available(conn):
+        create_search_index(conn)
+
+@migration('0006_attendance_monthly_backfill')
+def backfill_attendance_monthly(conn):
+    from app.attendance import rebuild_monthly
+    rebuild_monthly(conn)
+
+@migration('0007_result_snapshot_backfill')
+def backfill_result_snapshot(conn):
+    from app.rankings import rebuild_rankings
+    rebuild_rankings(conn)
+
+@migration('0008_exam_result_unique_mark')
+def make_exam_results_unique(conn):
+    # Keep the most recent result where a student was entered twice
+    conn.execute(text(
+        'DELETE FROM exam_result WHERE id NOT IN ('
+        'SELECT MAX(id) FROM exam_result GROUP BY student_id, examination_id)'
+    ))
+    conn.execute(text('DROP INDEX IF EXISTS ix_exam_result_student_exam'))
+    create_indexes(conn, 'uq_exam_result_student_exam')
+
+@migration('0009_fee_ledger_backfill')
+def backfill_fee_ledger(conn):
+    from app.fees import rebuild_ledger
+    rebuild_ledger(conn)
+
+@migration('0010_event_audience_backfill')
+def backfill_event_audience(conn):
+    from app.events import rebuild_audiences
+    rebuild_audiences(conn)
+
+@migration('0011_bus_seat_allocation')
+def add_bus_seat_allocation(conn):
+    from app.transport import rebalance_routes
+    add_columns(conn, 'bus_subscription', 'bus_id', 'seat_status')
+    # Keep the latest of any duplicate active subscriptions to the same route
+    conn.execute(text(
+        'UPDATE bus_subscription SET is_active = 0 WHERE is_active = 1 AND id NOT IN ('
+        'SELECT MAX(id) FROM bus_subscription WHERE is_active = 1 GROUP BY student_id, route_id)'
+    ))
+    create_indexes(
+        conn,
+        'ix_bus_subscription_route_seat',
+        'ix_bus_subscription_bus_stop',
+        'uq_bus_subscription_student_route_active',
+    )
+    rebalance_routes(conn)
+
+@migration('0012_bus_stop_backfill')
+def backfill_bus_stops(conn):
+    from app.transport import rebuild_stops
+    rebuild_stops(conn)
+
+@migration('0013_library_access_unique_counter')
+def make_library_access_counters_unique(conn):
+    # Fold repeated rows for a student and resource into the oldest one
+    conn.execute(text(
+        'UPDATE library_access SET '
+        'download_count = (SELECT SUM(COALESCE(other.download_count, 1)) FROM library_access other '
+        '                  WHERE other.student_id = library_access.student_id '
+        '                  AND other.resource_id = library_access.resource_id), '
+        'access_date = (SELECT MAX(other.access_date) FROM library_access other '
+        '               WHERE other.student_id = library_access.student_id '
+        '               AND other.resource_id = library_access.resource_id) '
+        'WHERE id IN (SELECT MIN(id) FROM library_access GROUP BY student_id, resource_id HAVING COUNT(*) > 1)'
+    ))
+    conn.execute(text(
+        'DELETE FROM library_access WHERE id NOT IN ('
+        'SELECT MIN(id) FROM library_access GROUP BY student_id, resource_id)'
+    ))
+    conn.execute(text('DROP INDEX IF EXISTS ix_library_access_student_resource'))
+    create_indexes(conn, 'uq_library_access_student_resource')
+
+@migration('0014_library_popularity')
+def backfill_library_popularity(conn):
+    from app.popularity import backfill_daily, rebuild_popularity
+    backfill_daily(conn)
+    rebuild_popularity(conn)
+
+@migration('0015_user_password_hash_length')
+def widen_password_hash(conn):
+    # scrypt hashes outgrow the original VARCHAR(120); SQLite ignores the length
+    if conn.dialect.name == 'postgresql':
+        conn.execute(text('ALTER TABLE "user" ALTER COLUMN password_hash TYPE VARCHAR(255)'))
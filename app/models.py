@@ -1,23 +1,23 @@
 from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
-from app import db
+from app import db, passwords
 
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
-    password_hash = db.Column(db.String(120), nullable=False)
+    # Long enough for any werkzeug method, scrypt included (~162 characters)
+    password_hash = db.Column(db.String(255), nullable=False)
     role = db.Column(db.String(20), nullable=False)  # 'student', 'staff', 'principal'
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     is_active = db.Column(db.Boolean, default=True)
     
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password, method='pbkdf2:sha256')
+        self.password_hash = passwords.hash(password)
     
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return passwords.verify(self.password_hash, password)
 
 class Student(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -36,6 +36,11 @@ class Student(db.Model):
     
     user = db.relationship('User', backref=db.backref('student', uselist=False))
 
+    __table_args__ = (
+        db.Index('ix_student_user_id', 'user_id'),
+        db.Index('ix_student_course_year_semester', 'course', 'year', 'semester'),
+    )
+
 class Staff(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -50,6 +55,10 @@ class Staff(db.Model):
     
     user = db.relationship('User', backref=db.backref('staff', uselist=False))
 
+    __table_args__ = (
+        db.Index('ix_staff_user_id', 'user_id'),
+    )
+
 class Examination(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
@@ -63,6 +72,11 @@ class Examination(db.Model):
     max_marks = db.Column(db.Integer, nullable=False)
     created_by = db.Column(db.Integer, db.ForeignKey('staff.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_examination_exam_date', 'exam_date'),
+        db.Index('ix_examination_course_year_semester', 'course', 'year', 'semester', 'exam_date'),
+    )
 
 class ExamResult(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -75,6 +89,42 @@ class ExamResult(db.Model):
     examination = db.relationship('Examination', backref='results')
     student = db.relationship('Student', backref='exam_results')
 
+    __table_args__ = (
+        db.Index('uq_exam_result_student_exam', 'student_id', 'examination_id', unique=True),
+        db.Index('ix_exam_result_examination_id', 'examination_id'),
+    )
+
+class ResultSnapshot(db.Model):
+    """A student's semester standing within their course/year/semester, see app/rankings.py."""
+    student_id = db.Column(db.Integer, db.ForeignKey('student.id'), primary_key=True)
+    course = db.Column(db.String(100), primary_key=True)
+    year = db.Column(db.Integer, primary_key=True)
+    semester = db.Column(db.Integer, primary_key=True)
+    obtained_marks = db.Column(db.Integer, nullable=False)
+    total_marks = db.Column(db.Integer, nullable=False)
+    subjects = db.Column(db.Integer, nullable=False)
+    percentage = db.Column(db.Float, nullable=False)
+    rank = db.Column(db.Integer, nullable=False)
+    percentile = db.Column(db.Float, nullable=False)
+    cohort_size = db.Column(db.Integer, nullable=False)
+    computed_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    student = db.relationship('Student')
+
+    __table_args__ = (
+        db.Index('ix_result_snapshot_cohort_rank', 'course', 'year', 'semester', 'rank', 'student_id'),
+    )
+
+class SubjectTopper(db.Model):
+    course = db.Column(db.String(100), primary_key=True)
+    year = db.Column(db.Integer, primary_key=True)
+    semester = db.Column(db.Integer, primary_key=True)
+    subject = db.Column(db.String(100), primary_key=True)
+    student_id = db.Column(db.Integer, db.ForeignKey('student.id'), primary_key=True)
+    percentage = db.Column(db.Float, nullable=False)
+    
+    student = db.relationship('Student')
+
 class FeeStructure(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     course = db.Column(db.String(100), nullable=False)
@@ -107,6 +157,33 @@ class FeePayment(db.Model):
     student = db.relationship('Student', backref='fee_payments')
     fee_structure = db.relationship('FeeStructure', backref='payments')
 
+    __table_args__ = (
+        db.Index('ix_fee_payment_student_structure', 'student_id', 'fee_structure_id'),
+        db.Index('ix_fee_payment_status_date', 'status', 'payment_date'),
+        db.Index('ix_fee_payment_payment_date', 'payment_date'),
+    )
+
+class FeeLedger(db.Model):
+    """What a student owes against one fee structure, see app/fees.py."""
+    student_id = db.Column(db.Integer, db.ForeignKey('student.id'), primary_key=True)
+    fee_structure_id = db.Column(db.Integer, db.ForeignKey('fee_structure.id'), primary_key=True)
+    course = db.Column(db.String(100), nullable=False)
+    year = db.Column(db.Integer, nullable=False)
+    semester = db.Column(db.Integer, nullable=False)
+    due = db.Column(db.Float, nullable=False, default=0)
+    paid = db.Column(db.Float, nullable=False, default=0)  # every payment that was not rejected
+    approved = db.Column(db.Float, nullable=False, default=0)
+    outstanding = db.Column(db.Float, nullable=False, default=0)  # due - paid, never below 0
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    student = db.relationship('Student')
+    fee_structure = db.relationship('FeeStructure')
+
+    __table_args__ = (
+        db.Index('ix_fee_ledger_cohort_outstanding', 'course', 'year', 'outstanding', 'student_id', 'fee_structure_id'),
+        db.Index('ix_fee_ledger_outstanding', 'outstanding', 'student_id', 'fee_structure_id'),
+    )
+
 class BusRoute(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     route_name = db.Column(db.String(100), nullable=False)
@@ -115,11 +192,34 @@ class BusRoute(db.Model):
     ending_point = db.Column(db.String(200), nullable=False)
     total_distance = db.Column(db.Float, nullable=False)
     estimated_time = db.Column(db.Integer, nullable=False)  # in minutes
-    stops = db.Column(db.Text)  # JSON string of stops
+    stops = db.Column(db.Text)  # JSON string of stops; see BusStop
     monthly_fee = db.Column(db.Float, nullable=False)
     term_fee = db.Column(db.Float, nullable=False)
     is_active = db.Column(db.Boolean, default=True)
 
+    bus_stops = db.relationship('BusStop', order_by='BusStop.sequence', cascade='all, delete-orphan',
+                                back_populates='route')
+
+    __table_args__ = (
+        db.Index('ix_bus_route_active', 'route_name',
+                 sqlite_where=db.text('is_active = 1'),
+                 postgresql_where=db.text('is_active')),
+    )
+
+class BusStop(db.Model):
+    """One stop of ``BusRoute.stops``, in route order; see app/transport.py."""
+    route_id = db.Column(db.Integer, db.ForeignKey('bus_route.id'), primary_key=True)
+    sequence = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(200), nullable=False)
+    name_key = db.Column(db.String(200), nullable=False)  # normalized for prefix search
+    offset_minutes = db.Column(db.Integer)  # from the start of the route
+
+    route = db.relationship('BusRoute', back_populates='bus_stops')
+
+    __table_args__ = (
+        db.Index('ix_bus_stop_name_key', 'name_key', 'route_id'),
+    )
+
 class Bus(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     bus_number = db.Column(db.String(20), unique=True, nullable=False)
@@ -134,6 +234,10 @@ class Bus(db.Model):
     
     route = db.relationship('BusRoute', backref='buses')
 
+    __table_args__ = (
+        db.Index('ix_bus_route_id', 'route_id'),
+    )
+
 class BusSubscription(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     student_id = db.Column(db.Integer, db.ForeignKey('student.id'), nullable=False)
@@ -143,9 +247,23 @@ class BusSubscription(db.Model):
     amount_paid = db.Column(db.Float, nullable=False)
     is_active = db.Column(db.Boolean, default=True)
     pickup_stop = db.Column(db.String(200), nullable=False)
+    bus_id = db.Column(db.Integer, db.ForeignKey('bus.id'))
+    seat_status = db.Column(db.String(20))  # allocated, waitlisted; see app/transport.py
     
     student = db.relationship('Student', backref='bus_subscriptions')
     route = db.relationship('BusRoute', backref='subscriptions')
+    bus = db.relationship('Bus')
+
+    __table_args__ = (
+        db.Index('ix_bus_subscription_student_active', 'student_id', 'is_active'),
+        db.Index('ix_bus_subscription_route_id', 'route_id'),
+        # Waitlists are served in subscription order
+        db.Index('ix_bus_subscription_route_seat', 'route_id', 'seat_status', 'id'),
+        db.Index('ix_bus_subscription_bus_stop', 'bus_id', 'pickup_stop'),
+        db.Index('uq_bus_subscription_student_route_active', 'student_id', 'route_id', unique=True,
+                 sqlite_where=db.text('is_active = 1'),
+                 postgresql_where=db.text('is_active')),
+    )
 
 class Attendance(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -160,6 +278,41 @@ class Attendance(db.Model):
     student = db.relationship('Student', backref='attendance_records')
     staff = db.relationship('Staff', backref='marked_attendance')
 
+    __table_args__ = (
+        db.Index('uq_attendance_student_subject_date', 'student_id', 'subject', 'date', unique=True),
+        db.Index('ix_attendance_student_date', 'student_id', 'date'),
+        db.Index('ix_attendance_student_status', 'student_id', 'status'),
+    )
+
+class AttendanceSummary(db.Model):
+    student_id = db.Column(db.Integer, db.ForeignKey('student.id'), primary_key=True)
+    subject = db.Column(db.String(100), primary_key=True)
+    total = db.Column(db.Integer, nullable=False, default=0)
+    present = db.Column(db.Integer, nullable=False, default=0)
+    late = db.Column(db.Integer, nullable=False, default=0)
+    absent = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    student = db.relationship('Student', backref='attendance_summaries')
+    
+    @property
+    def percentage(self):
+        return (self.present / self.total * 100) if self.total > 0 else 0
+
+class AttendanceMonthly(db.Model):
+    student_id = db.Column(db.Integer, db.ForeignKey('student.id'), primary_key=True)
+    subject = db.Column(db.String(100), primary_key=True)
+    month = db.Column(db.Date, primary_key=True)  # first day of the month
+    total = db.Column(db.Integer, nullable=False, default=0)
+    present = db.Column(db.Integer, nullable=False, default=0)
+    late = db.Column(db.Integer, nullable=False, default=0)
+    absent = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    @property
+    def percentage(self):
+        return (self.present / self.total * 100) if self.total > 0 else 0
+
 class Event(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
@@ -175,6 +328,25 @@ class Event(db.Model):
     is_active = db.Column(db.Boolean, default=True)
     
     creator = db.relationship('Staff', backref='created_events')
+    audiences = db.relationship('EventAudience', cascade='all, delete-orphan')
+
+    __table_args__ = (
+        db.Index('ix_event_event_date', 'event_date'),
+        # Partial index: student feeds only ever read active events
+        db.Index('ix_event_active_date', 'event_date',
+                 sqlite_where=db.text('is_active = 1'),
+                 postgresql_where=db.text('is_active')),
+    )
+
+class EventAudience(db.Model):
+    """One audience of an event, parsed from its target_audience, see app/events.py."""
+    event_id = db.Column(db.Integer, db.ForeignKey('event.id'), primary_key=True)
+    kind = db.Column(db.String(20), primary_key=True)  # all, course, year
+    value = db.Column(db.String(100), primary_key=True, default='')  # course names are lowercased
+
+    __table_args__ = (
+        db.Index('ix_event_audience_kind_value', 'kind', 'value', 'event_id'),
+    )
 
 class LibraryResource(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -194,6 +366,15 @@ class LibraryResource(db.Model):
     
     added_by_staff = db.relationship('Staff', backref='added_resources')
 
+    __table_args__ = (
+        # Partial index: the student catalogue only lists available resources
+        db.Index('ix_library_resource_available', 'course', 'year',
+                 sqlite_where=db.text('is_available = 1'),
+                 postgresql_where=db.text('is_available')),
+        db.Index('ix_library_resource_subject', 'subject'),
+        db.Index('ix_library_resource_type', 'resource_type'),
+    )
+
 class LibraryAccess(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     student_id = db.Column(db.Integer, db.ForeignKey('student.id'), nullable=False)
@@ -203,3 +384,43 @@ class LibraryAccess(db.Model):
     
     student = db.relationship('Student', backref='library_access')
     resource = db.relationship('LibraryResource', backref='access_logs')
+
+    __table_args__ = (
+        # One counter row per student and resource; see app/access_buffer.py
+        db.Index('uq_library_access_student_resource', 'student_id', 'resource_id', unique=True),
+        db.Index('ix_library_access_resource_id', 'resource_id'),
+    )
+
+class LibraryAccessDaily(db.Model):
+    """Opens of a resource by students of one course and year on one day; see app/popularity.py."""
+    resource_id = db.Column(db.Integer, db.ForeignKey('library_resource.id'), primary_key=True)
+    course = db.Column(db.String(100), primary_key=True)
+    year = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    opens = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.Index('ix_library_access_daily_class_day', 'course', 'year', 'day'),
+    )
+
+class LibraryPopularity(db.Model):
+    """The most opened resources in a class over a rolling window; see app/popularity.py."""
+    course = db.Column(db.String(100), primary_key=True)
+    year = db.Column(db.Integer, primary_key=True)
+    window_days = db.Column(db.Integer, primary_key=True)
+    subject = db.Column(db.String(100), primary_key=True)  # '' ranks every subject together
+    rank = db.Column(db.Integer, primary_key=True)
+    resource_id = db.Column(db.Integer, db.ForeignKey('library_resource.id'), nullable=False)
+    opens = db.Column(db.Integer, nullable=False)
+    computed_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    resource = db.relationship('LibraryResource')
+
+class LibraryCoAccess(db.Model):
+    """Resources most often opened by the students who opened ``resource_id``."""
+    resource_id = db.Column(db.Integer, db.ForeignKey('library_resource.id'), primary_key=True)
+    rank = db.Column(db.Integer, primary_key=True)
+    other_id = db.Column(db.Integer, db.ForeignKey('library_resource.id'), nullable=False)
+    students = db.Column(db.Integer, nullable=False)
+
+    other = db.relationship('LibraryResource', foreign_keys=[other_id])
@@ -0,0 +1,139 @@
+"""Keyset (cursor) pagination for the listing pages.
+
+Pages are addressed by the sort key of their boundary row instead of an
+offset, so rows inserted while someone is paging never shift entries
+between pages, and a deep page costs the same index seek as the first one.
+
+NULL sorts below every value (SQLite's default, made explicit for other
+databases). Keys over nullable columns are compared column by column with
+``IS NULL`` checks, because a row-value comparison drops NULL rows.
+"""
+import base64
+import binascii
+import json
+from datetime import date, datetime
+from sqlalchemy import and_, false, func, or_, tuple_
+
+MAX_PER_PAGE = 100
+
+class KeysetPage:
+    def __init__(self, items, total, per_page, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.total = total
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+def encode_cursor(values):
+    raw = json.dumps([v.isoformat() if isinstance(v, (date, datetime)) else v for v in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor, columns):
+    """Decode a cursor into typed key values, or None if it is malformed."""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (binascii.Error, ValueError):
+        return None
+    if not isinstance(values, list) or len(values) != len(columns):
+        return None
+
+    decoded = []
+    for column, value in zip(columns, values):
+        if value is None and _nullable(column):
+            decoded.append(None)
+            continue
+        python_type = column.type.python_type
+        try:
+            if python_type is datetime:
+                value = datetime.fromisoformat(value)
+            elif python_type is date:
+                value = date.fromisoformat(value)
+            else:
+                value = python_type(value)
+        except (TypeError, ValueError):
+            return None
+        decoded.append(value)
+    return decoded
+
+def _nullable(column):
+    return getattr(column.expression, 'nullable', True)
+
+def _beyond(columns, values, smaller):
+    """Rows strictly below (``smaller``) or above the key ``values``."""
+    if not any(_nullable(column) for column in columns):
+        key = tuple_(*columns)
+        return key < tuple(values) if smaller else key > tuple(values)
+    clauses = []
+    equal = []
+    for column, value in zip(columns, values):
+        if smaller:
+            step = false() if value is None else column < value
+            if value is not None and _nullable(column):
+                step = or_(step, column.is_(None))
+        else:
+            step = column.is_not(None) if value is None else column > value
+        clauses.append(and_(*equal, step))
+        equal.append(column.is_(None) if value is None else column == value)
+    return or_(*clauses)
+
+def _ordered(column, descending):
+    order = column.desc() if descending else column.asc()
+    if not _nullable(column):
+        return order
+    return order.nulls_last() if descending else order.nulls_first()
+
+def paginate(query, columns, per_page, after=None, before=None, descending=True, options=()):
+    """Return one KeysetPage of ``query`` ordered by ``columns``.
+
+    ``columns`` is the sort key and must end with a unique column (usually
+    the primary key). ``after``/``before`` are cursors taken from a previous
+    page. ``options`` are loader options applied to the page query only, so
+    the total is counted without loading any rows.
+    """
+    per_page = max(1, min(per_page, MAX_PER_PAGE))
+    total = query.order_by(None).with_entities(func.count(columns[-1])).scalar()
+
+    after_values = decode_cursor(after, columns)
+    before_values = decode_cursor(before, columns) if after_values is None else None
+
+    page_query = query.options(*options)
+    if before_values is not None:
+        # Walk backwards from the cursor, then restore display order
+        seek = _beyond(columns, before_values, smaller=not descending)
+        order = [_ordered(c, not descending) for c in columns]
+        rows = page_query.filter(seek).order_by(*order).limit(per_page + 1).all()
+        has_prev = len(rows) > per_page
+        rows = rows[:per_page]
+        rows.reverse()
+        has_next = True
+    else:
+        order = [_ordered(c, descending) for c in columns]
+        if after_values is not None:
+            seek = _beyond(columns, after_values, smaller=descending)
+            page_query = page_query.filter(seek)
+        rows = page_query.order_by(*order).limit(per_page + 1).all()
+        has_next = len(rows) > per_page
+        rows = rows[:per_page]
+        has_prev = after_values is not None
+
+    def cursor_for(row):
+        return encode_cursor([getattr(row, c.key) for c in columns])
+
+    return KeysetPage(
+        rows,
+        total,
+        per_page,
+        next_cursor=cursor_for(rows[-1]) if rows and has_next else None,
+        prev_cursor=cursor_for(rows[0]) if rows and has_prev else None,
+    )
@@ -0,0 +1,146 @@
+"""Password hashing off the request thread.
+
+Hashes are computed and checked in a bounded process pool
+(``PASSWORD_HASH_WORKERS`` processes; 0 hashes inline, which tests use).
+At most ``PASSWORD_HASH_MAX_PENDING`` hashes may be queued or running.
+Past that, callers wait up to ``PASSWORD_HASH_TIMEOUT`` seconds for a slot
+and then get ``HashingBusy``, so a burst of sign-ins cannot pile up
+unbounded CPU work. New hashes use ``PASSWORD_HASH_METHOD``. Stored hashes
+made with other parameters are reported by ``needs_rehash`` so they can be
+upgraded on the next successful login.
+"""
+import atexit
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from flask import current_app, has_app_context
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+DEFAULT_METHOD = f'pbkdf2:sha256:{DEFAULT_PBKDF2_ITERATIONS}'
+
+class HashingBusy(Exception):
+    pass
+
+def normalize_method(method):
+    """Spell out the defaults werkzeug fills in, as stored in the hash."""
+    parts = method.split(':')
+    if parts[0] == 'pbkdf2':
+        name = parts[1] if len(parts) > 1 else 'sha256'
+        iterations = parts[2] if len(parts) > 2 else DEFAULT_PBKDF2_ITERATIONS
+        return f'pbkdf2:{name}:{iterations}'
+    if parts[0] == 'scrypt':
+        given = parts[1:4]
+        n, r, p = given + ['32768', '8', '1'][len(given):]
+        return f'scrypt:{n}:{r}:{p}'
+    return method
+
+def _timed(func, *args, **kwargs):
+    started = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - started
+
+class _Pool:
+    def __init__(self, method, workers, max_pending, timeout):
+        self.method = normalize_method(method)
+        self.workers = workers
+        self.timeout = timeout
+        self.slots = threading.BoundedSemaphore(max_pending)
+        self.lock = threading.Lock()
+        self.executor = None
+        self.pending = 0
+        self.max_pending_seen = 0
+        self.completed = 0
+        self.rejected = 0
+        self.hash_time = 0.0
+        self.rehashed = 0
+
+    def _executor(self):
+        with self.lock:
+            if self.executor is None:
+                # spawn: forking a multi-threaded server process is unsafe
+                self.executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+                atexit.register(self.executor.shutdown, cancel_futures=True)
+            return self.executor
+
+    def run(self, func, *args, **kwargs):
+        if not self.slots.acquire(timeout=self.timeout):
+            with self.lock:
+                self.rejected += 1
+            raise HashingBusy('Password hashing queue is full')
+        with self.lock:
+            self.pending += 1
+            self.max_pending_seen = max(self.max_pending_seen, self.pending)
+        try:
+            if self.workers:
+                result, elapsed = self._executor().submit(_timed, func, *args, **kwargs).result()
+            else:
+                result, elapsed = _timed(func, *args, **kwargs)
+        finally:
+            with self.lock:
+                self.pending -= 1
+            self.slots.release()
+        with self.lock:
+            self.completed += 1
+            self.hash_time += elapsed
+        return result
+
+class PasswordHasher:
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('PASSWORD_HASH_METHOD', DEFAULT_METHOD)
+        app.config.setdefault('PASSWORD_HASH_WORKERS', os.cpu_count() or 1)
+        app.config.setdefault('PASSWORD_HASH_MAX_PENDING', 8 * max(1, app.config['PASSWORD_HASH_WORKERS']))
+        app.config.setdefault('PASSWORD_HASH_TIMEOUT', 10)
+        app.extensions['password_hasher'] = _Pool(
+            app.config['PASSWORD_HASH_METHOD'],
+            app.config['PASSWORD_HASH_WORKERS'],
+            app.config['PASSWORD_HASH_MAX_PENDING'],
+            app.config['PASSWORD_HASH_TIMEOUT'],
+        )
+
+    def _pool(self):
+        if has_app_context():
+            return current_app.extensions['password_hasher']
+        return None
+
+    def hash(self, password):
+        pool = self._pool()
+        if pool is None:
+            return generate_password_hash(password, method=DEFAULT_METHOD)
+        return pool.run(generate_password_hash, password, method=pool.method)
+
+    def verify(self, password_hash, password):
+        pool = self._pool()
+        if pool is None:
+            return check_password_hash(password_hash, password)
+        return pool.run(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """Whether ``password_hash`` was made with other than the configured parameters."""
+        pool = self._pool()
+        method = pool.method if pool is not None else DEFAULT_METHOD
+        return password_hash.split('$', 1)[0] != method
+
+    def record_rehash(self):
+        pool = self._pool()
+        with pool.lock:
+            pool.rehashed += 1
+
+    def stats(self):
+        pool = self._pool()
+        with pool.lock:
+            return {
+                'method': pool.method,
+                'workers': pool.workers,
+                'queue_depth': pool.pending,
+                'max_queue_depth': pool.max_pending_seen,
+                'completed': pool.completed,
+                'rejected': pool.rejected,
+                'rehashed': pool.rehashed,
+                'avg_hash_ms': pool.hash_time / pool.completed * 1000 if pool.completed else 0.0,
+            }
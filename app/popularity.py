@@ -0,0 +1,158 @@
+"""Popular library resources per class and "also opened" lists.
+
+Library opens are summed per resource, course, year and day in
+``library_access_daily``. ``AccessBuffer.flush`` adds each batch of clicks
+there with one upsert. ``library_popularity`` keeps the ``TOP`` resources of
+every course/year over the rolling ``WINDOWS``, both over every subject
+(``subject = ''``) and per subject. ``library_co_access`` keeps, for every
+resource, the ``ALSO_OPENED`` resources most shared by the students who
+opened it. Each is filled by one window-function ``INSERT ... SELECT``.
+
+The buffer's background thread refreshes the classes and resources its
+flushes touched every ``LIBRARY_POPULARITY_REFRESH_INTERVAL`` seconds, off
+the request path. Windows also roll over at
+midnight without any click, so ``flask rebuild library-popularity`` should
+run daily. Pages read a class's list with one primary-key range read.
+"""
+from datetime import datetime, timedelta
+from sqlalchemy import Date, cast, delete, func, insert, literal, select, tuple_, union_all
+from sqlalchemy.orm import joinedload
+from app.models import LibraryAccess, LibraryAccessDaily, LibraryCoAccess, LibraryPopularity, LibraryResource, Student
+
+WINDOWS = (7, 30, 365)
+TOP = 10
+ALSO_OPENED = 5
+
+POPULARITY_COLUMNS = ['course', 'year', 'window_days', 'subject', 'rank', 'resource_id', 'opens', 'computed_at']
+CO_ACCESS_COLUMNS = ['resource_id', 'rank', 'other_id', 'students']
+
+def _day_of(column, dialect):
+    if dialect == 'postgresql':
+        return cast(column, Date)
+    return func.date(column)
+
+def _popular(classes, today):
+    daily = LibraryAccessDaily
+    windows = []
+    for window_days in WINDOWS:
+        query = select(
+            daily.course, daily.year, literal(window_days).label('window_days'), LibraryResource.subject,
+            daily.resource_id, func.sum(daily.opens).label('opens'),
+        ).join(LibraryResource, LibraryResource.id == daily.resource_id).where(
+            daily.day >= today - timedelta(days=window_days - 1), LibraryResource.is_available == True
+        ).group_by(daily.course, daily.year, LibraryResource.subject, daily.resource_id)
+        if classes is not None:
+            query = query.where(tuple_(daily.course, daily.year).in_(classes))
+        windows.append(query)
+    totals = union_all(*windows).cte('totals')
+
+    def ranked(subject, partition):
+        return select(
+            totals.c.course, totals.c.year, totals.c.window_days, subject.label('subject'),
+            func.row_number().over(
+                partition_by=[totals.c.course, totals.c.year, totals.c.window_days, *partition],
+                order_by=[totals.c.opens.desc(), totals.c.resource_id],
+            ).label('rank'),
+            totals.c.resource_id, totals.c.opens, func.current_timestamp().label('computed_at'),
+        )
+
+    # Every subject together under '', then each subject on its own
+    lists = union_all(ranked(literal(''), []), ranked(totals.c.subject, [totals.c.subject])).subquery()
+    return select(*lists.c).where(lists.c.rank <= TOP)
+
+def refresh_popularity(conn, classes=None, today=None):
+    """Recompute the lists of ``classes`` (``(course, year)`` pairs), or of every class."""
+    if classes is not None:
+        classes = sorted(set(classes))
+        if not classes:
+            return
+    stmt = delete(LibraryPopularity)
+    if classes is not None:
+        stmt = stmt.where(tuple_(LibraryPopularity.course, LibraryPopularity.year).in_(classes))
+    conn.execute(stmt)
+    conn.execute(insert(LibraryPopularity).from_select(POPULARITY_COLUMNS, _popular(classes, today or datetime.utcnow().date())))
+
+def refresh_co_access(conn, resource_ids=None):
+    """Recompute the "also opened" lists of ``resource_ids``, or of every resource."""
+    if resource_ids is not None:
+        resource_ids = sorted(set(resource_ids))
+        if not resource_ids:
+            return
+    opened = LibraryAccess.__table__.alias('opened')
+    also = LibraryAccess.__table__.alias('also')
+    query = select(
+        opened.c.resource_id, also.c.resource_id.label('other_id'), func.count().label('students')
+    ).join(also, (also.c.student_id == opened.c.student_id) & (also.c.resource_id != opened.c.resource_id)
+    ).group_by(opened.c.resource_id, also.c.resource_id)
+    stmt = delete(LibraryCoAccess)
+    if resource_ids is not None:
+        query = query.where(opened.c.resource_id.in_(resource_ids))
+        stmt = stmt.where(LibraryCoAccess.resource_id.in_(resource_ids))
+    pairs = query.subquery()
+    ranked = select(
+        pairs.c.resource_id,
+        func.row_number().over(
+            partition_by=pairs.c.resource_id, order_by=[pairs.c.students.desc(), pairs.c.other_id]
+        ).label('rank'),
+        pairs.c.other_id, pairs.c.students,
+    ).subquery()
+    conn.execute(stmt)
+    conn.execute(insert(LibraryCoAccess).from_select(
+        CO_ACCESS_COLUMNS, select(*ranked.c).where(ranked.c.rank <= ALSO_OPENED)
+    ))
+
+def co_access_affected(conn, student_ids):
+    """Resources whose lists change when ``student_ids`` open something new."""
+    return [resource_id for (resource_id,) in conn.execute(
+        select(LibraryAccess.resource_id).where(LibraryAccess.student_id.in_(sorted(set(student_ids)))).distinct()
+    )]
+
+def backfill_daily(conn):
+    """Rebuild the daily opens from the access counters.
+
+    Each counter only keeps its last access date, so all of its opens land on
+    that day.
+    """
+    day = _day_of(LibraryAccess.access_date, conn.dialect.name)
+    query = select(
+        LibraryAccess.resource_id, Student.course, Student.year, day,
+        func.sum(func.coalesce(LibraryAccess.download_count, 1)),
+    ).join(Student, Student.id == LibraryAccess.student_id).where(
+        Student.course != None, Student.year != None, LibraryAccess.access_date != None
+    ).group_by(LibraryAccess.resource_id, Student.course, Student.year, day)
+    conn.execute(delete(LibraryAccessDaily))
+    conn.execute(insert(LibraryAccessDaily).from_select(['resource_id', 'course', 'year', 'day', 'opens'], query))
+
+def rebuild_popularity(conn, today=None):
+    """Drop daily opens older than the longest window and recompute every list."""
+    today = today or datetime.utcnow().date()
+    conn.execute(delete(LibraryAccessDaily).where(LibraryAccessDaily.day < today - timedelta(days=max(WINDOWS) - 1)))
+    refresh_popularity(conn, today=today)
+    refresh_co_access(conn)
+
+def popular_in_class(student, window_days=30, subject='', limit=5):
+    """The most opened resources in ``student``'s class, most opened first."""
+    rows = LibraryPopularity.query.filter(
+        LibraryPopularity.course == student.course,
+        LibraryPopularity.year == student.year,
+        LibraryPopularity.window_days == window_days,
+        LibraryPopularity.subject == subject,
+        LibraryPopularity.rank <= limit,
+    ).options(joinedload(LibraryPopularity.resource)).order_by(LibraryPopularity.rank)
+    # Lists are refreshed periodically; skip resources withdrawn since
+    return [row for row in rows if row.resource.is_available]
+
+def also_opened(student, resource_ids, limit=3):
+    """``{resource_id: [resources]}`` opened by the readers of each resource that ``student`` may open."""
+    also = {}
+    if not resource_ids:
+        return also
+    rows = LibraryCoAccess.query.filter(LibraryCoAccess.resource_id.in_(set(resource_ids))).options(
+        joinedload(LibraryCoAccess.other)
+    ).order_by(LibraryCoAccess.resource_id, LibraryCoAccess.rank)
+    for row in rows:
+        other = row.other
+        if (other.is_available and other.course in (student.course, 'all') and other.year in (student.year, None)
+                and len(also.setdefault(row.resource_id, [])) < limit):
+            also[row.resource_id].append(other)
+    return also
@@ -0,0 +1,102 @@
+"""Semester results and class rankings.
+
+``rebuild_rankings`` computes every student's semester percentage, rank,
+percentile and the toppers of each subject, per course/year/semester cohort.
+The database does the work in one ``INSERT ... SELECT`` per table, using
+window functions partitioned by cohort. Results are stored in
+``result_snapshot`` and ``subject_topper``. Pages read the snapshot instead
+of aggregating exam results; a student's own rank is a primary-key lookup.
+Snapshots are rebuilt with ``flask rebuild rankings`` or from the staff
+rankings page after marks are entered.
+"""
+from sqlalchemy import delete, func, insert, select
+from app.models import Examination, ExamResult, ResultSnapshot, SubjectTopper
+
+SNAPSHOT_COLUMNS = ['student_id', 'course', 'year', 'semester', 'obtained_marks', 'total_marks',
+                    'subjects', 'percentage', 'rank', 'percentile', 'cohort_size', 'computed_at']
+TOPPER_COLUMNS = ['course', 'year', 'semester', 'subject', 'student_id', 'percentage']
+
+def _percentage(obtained, total):
+    return func.coalesce(obtained * 100.0 / func.nullif(total, 0), 0.0)
+
+def _in_cohort(stmt, course=None, year=None, semester=None):
+    if course:
+        stmt = stmt.where(Examination.course == course)
+    if year:
+        stmt = stmt.where(Examination.year == year)
+    if semester:
+        stmt = stmt.where(Examination.semester == semester)
+    return stmt
+
+def semester_totals(*criteria):
+    """Marks per student and exam year/semester, filtered by ``criteria``."""
+    return select(
+        Examination.year,
+        Examination.semester,
+        func.sum(ExamResult.marks_obtained).label('obtained_marks'),
+        func.sum(Examination.max_marks).label('total_marks'),
+        func.count(ExamResult.id).label('subjects'),
+    ).join(ExamResult.examination).where(*criteria).group_by(
+        Examination.year, Examination.semester
+    )
+
+def _ranked(course, year, semester):
+    totals = _in_cohort(select(
+        ExamResult.student_id,
+        Examination.course,
+        Examination.year,
+        Examination.semester,
+        func.sum(ExamResult.marks_obtained).label('obtained_marks'),
+        func.sum(Examination.max_marks).label('total_marks'),
+        func.count(ExamResult.id).label('subjects'),
+    ).join(ExamResult.examination), course, year, semester).group_by(
+        ExamResult.student_id, Examination.course, Examination.year, Examination.semester
+    ).subquery()
+
+    cohort = [totals.c.course, totals.c.year, totals.c.semester]
+    percentage = _percentage(totals.c.obtained_marks, totals.c.total_marks)
+    return select(
+        totals.c.student_id, *cohort,
+        totals.c.obtained_marks, totals.c.total_marks, totals.c.subjects,
+        percentage,
+        func.rank().over(partition_by=cohort, order_by=percentage.desc()),
+        func.cume_dist().over(partition_by=cohort, order_by=percentage) * 100,
+        func.count().over(partition_by=cohort),
+        func.current_timestamp(),
+    )
+
+def _toppers(course, year, semester):
+    scores = _in_cohort(select(
+        Examination.course,
+        Examination.year,
+        Examination.semester,
+        Examination.subject,
+        ExamResult.student_id,
+        _percentage(func.sum(ExamResult.marks_obtained), func.sum(Examination.max_marks)).label('percentage'),
+    ).join(ExamResult.examination), course, year, semester).group_by(
+        Examination.course, Examination.year, Examination.semester, Examination.subject, ExamResult.student_id
+    ).subquery()
+
+    positions = select(scores, func.rank().over(
+        partition_by=[scores.c.course, scores.c.year, scores.c.semester, scores.c.subject],
+        order_by=scores.c.percentage.desc()
+    ).label('position')).subquery()
+    return select(*[positions.c[name] for name in TOPPER_COLUMNS]).where(positions.c.position == 1)
+
+def rebuild_rankings(conn, course=None, year=None, semester=None):
+    """Recompute the snapshot of the matching cohorts (all by default) on ``conn``.
+
+    Returns the number of students ranked.
+    """
+    for model in (ResultSnapshot, SubjectTopper):
+        stmt = delete(model)
+        if course:
+            stmt = stmt.where(model.course == course)
+        if year:
+            stmt = stmt.where(model.year == year)
+        if semester:
+            stmt = stmt.where(model.semester == semester)
+        conn.execute(stmt)
+    result = conn.execute(insert(ResultSnapshot).from_select(SNAPSHOT_COLUMNS, _ranked(course, year, semester)))
+    conn.execute(insert(SubjectTopper).from_select(TOPPER_COLUMNS, _toppers(course, year, semester)))
+    return result.rowcount
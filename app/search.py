@@ -0,0 +1,115 @@
+"""Full-text search over the library catalogue.
+
+On SQLite the catalogue is indexed by an external-content FTS5 table,
+``library_resource_fts``, over title, subject, author and description.
+Triggers on ``library_resource`` keep it in step with every insert, update
+and delete, so writes through the ORM and through Core both stay searchable.
+Results are ranked by BM25 with title matches weighted highest. Other
+databases fall back to a case-insensitive substring search.
+"""
+import re
+from markupsafe import Markup, escape
+from sqlalchemy import column, func, literal_column, or_, table, text
+from app import db
+from app.models import LibraryResource
+
+FTS_TABLE = 'library_resource_fts'
+FTS_COLUMNS = ('title', 'subject', 'author', 'description')
+# BM25 weights, in FTS_COLUMNS order
+FTS_WEIGHTS = (10.0, 5.0, 3.0, 1.0)
+
+SEARCH_LIMIT = 50
+
+# Sentinels wrapped around matches by highlight()/snippet(); they cannot
+# occur in catalogue text and are swapped for <mark> after escaping.
+_OPEN, _CLOSE = '\x02', '\x03'
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+_fts = table(FTS_TABLE, column('rowid'), column('rank'))
+_fts_hidden = literal_column(FTS_TABLE)
+
+def fts_available(bind):
+    return bind.dialect.name == 'sqlite'
+
+def create_search_index(conn):
+    """Create the FTS5 table and its sync triggers, then index every resource."""
+    conn.execute(text(
+        f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5('
+        f'{", ".join(FTS_COLUMNS)}, '
+        f"content='library_resource', content_rowid='id', "
+        f"tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+    ))
+    new_values = ', '.join(f'new.{name}' for name in FTS_COLUMNS)
+    old_values = ', '.join(f'old.{name}' for name in FTS_COLUMNS)
+    columns = ', '.join(FTS_COLUMNS)
+    conn.execute(text(
+        f'CREATE TRIGGER IF NOT EXISTS library_resource_fts_insert AFTER INSERT ON library_resource BEGIN '
+        f'INSERT INTO {FTS_TABLE} (rowid, {columns}) VALUES (new.id, {new_values}); END'
+    ))
+    conn.execute(text(
+        f'CREATE TRIGGER IF NOT EXISTS library_resource_fts_delete AFTER DELETE ON library_resource BEGIN '
+        f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}, rowid, {columns}) VALUES ('delete', old.id, {old_values}); END"
+    ))
+    conn.execute(text(
+        f'CREATE TRIGGER IF NOT EXISTS library_resource_fts_update AFTER UPDATE OF {columns} ON library_resource BEGIN '
+        f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}, rowid, {columns}) VALUES ('delete', old.id, {old_values}); "
+        f'INSERT INTO {FTS_TABLE} (rowid, {columns}) VALUES (new.id, {new_values}); END'
+    ))
+    # Persist the column weights so ORDER BY rank uses them
+    weights = ', '.join(str(weight) for weight in FTS_WEIGHTS)
+    conn.execute(text(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}, rank) VALUES ('rank', 'bm25({weights})')"))
+    rebuild_search_index(conn)
+
+def rebuild_search_index(conn):
+    """Re-read every resource into the FTS index."""
+    conn.execute(text(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('rebuild')"))
+
+def match_expression(terms):
+    """Turn free text into an FTS5 query: every word must match, as a prefix.
+
+    Words are quoted so that FTS5 operators and punctuation typed by the
+    user are searched for literally instead of raising syntax errors.
+    Returns ``None`` when there is nothing to search for.
+    """
+    words = _TOKEN_RE.findall(terms)
+    if not words:
+        return None
+    return ' '.join(f'"{word}"*' for word in words)
+
+def _marked(value):
+    if value is None:
+        return None
+    return Markup(str(escape(value)).replace(_OPEN, '<mark>').replace(_CLOSE, '</mark>'))
+
+def search_resources(query, terms, limit=SEARCH_LIMIT):
+    """Rank the resources selected by ``query`` against ``terms``.
+
+    ``query`` is a ``LibraryResource`` query carrying any other filters.
+    Returns ``(resources, highlights)`` where ``highlights`` maps a resource
+    id to its marked-up title and description snippet (``None`` without FTS).
+    """
+    if not fts_available(db.session.get_bind()):
+        pattern = f'%{terms.strip()}%'
+        resources = query.filter(or_(*[
+            getattr(LibraryResource, name).ilike(pattern) for name in FTS_COLUMNS
+        ])).order_by(LibraryResource.title).limit(limit).all()
+        return resources, {}
+
+    expression = match_expression(terms)
+    if expression is None:
+        return [], {}
+
+    rows = query.join(_fts, _fts.c.rowid == LibraryResource.id).filter(
+        _fts_hidden.op('MATCH')(expression)
+    ).add_columns(
+        func.highlight(_fts_hidden, 0, _OPEN, _CLOSE),
+        func.snippet(_fts_hidden, 3, _OPEN, _CLOSE, '…', 16),
+    ).order_by(_fts.c.rank).limit(limit).all()
+
+    resources = []
+    highlights = {}
+    for resource, title, snippet in rows:
+        resources.append(resource)
+        highlights[resource.id] = {'title': _marked(title), 'snippet': _marked(snippet)}
+    return resources, highlights
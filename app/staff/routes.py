@@ -1,9 +1,85 @@
-from flask import render_template, redirect, url_for, flash, request, jsonify
+from flask import render_template, redirect, url_for, flash, request, jsonify, current_app, abort
 from flask_login import login_required, current_user
 from app.staff import bp
 from app.models import *
-from app import db
-from datetime import datetime, date
+from app import access_buffer, db, counters, identities, instrumentation, passwords
+from app.attendance import mark_roster
+from app.exports import stream_export
+from app.fees import LEVELS, approve_payments
+from app.library_files import store_upload
+from app.marks import DEFAULT_GRADE_SCALE, UploadError, import_marks, read_rows
+from app.pagination import paginate
+from app.rankings import rebuild_rankings
+from app.transport import parse_stops, rebalance_routes, stops_json
+from datetime import datetime, date, timedelta
+from sqlalchemy import func, select
+from sqlalchemy.orm import joinedload, selectinload
+from werkzeug.datastructures import MultiDict
+
+def _date_arg(name, args=None):
+    args = request.args if args is None else args
+    return args.get(name, type=lambda value: datetime.strptime(value, '%Y-%m-%d').date())
+
+def _fee_payment_criteria(args):
+    criteria = []
+    course = args.get('course')
+    year = args.get('year', type=int)
+    semester = args.get('semester', type=int)
+    fee_structure_id = args.get('fee_structure_id', type=int)
+    date_from = _date_arg('date_from', args)
+    date_to = _date_arg('date_to', args)
+    if course or year or semester:
+        structures = select(FeeStructure.id)
+        if course:
+            structures = structures.where(FeeStructure.course == course)
+        if year:
+            structures = structures.where(FeeStructure.year == year)
+        if semester:
+            structures = structures.where(FeeStructure.semester == semester)
+        criteria.append(FeePayment.fee_structure_id.in_(structures.scalar_subquery()))
+    if fee_structure_id:
+        criteria.append(FeePayment.fee_structure_id == fee_structure_id)
+    if date_from:
+        criteria.append(FeePayment.payment_date >= date_from)
+    if date_to:
+        criteria.append(FeePayment.payment_date < date_to + timedelta(days=1))
+    return criteria
+
+def _filter_fee_payments(query):
+    return query.filter(*_fee_payment_criteria(request.args))
+
+def _page(query, columns, **kwargs):
+    return paginate(
+        query,
+        columns,
+        request.args.get('per_page', current_app.config['ITEMS_PER_PAGE'], type=int),
+        after=request.args.get('after'),
+        before=request.args.get('before'),
+        **kwargs
+    )
+
+# Dashboard counters, cached until a commit touches their tables
+@counters.cached('total_students')
+def count_students():
+    return Student.query.count()
+
+@counters.cached('total_staff')
+def count_staff():
+    return Staff.query.count()
+
+@counters.cached('pending_fee_approvals')
+def count_pending_fee_approvals():
+    return FeePayment.query.filter_by(status='pending').count()
+
+@counters.cached('today_events')
+def count_events_on(day):
+    return Event.query.filter_by(event_date=day).count()
+
+counters.invalidate_on(Student, 'total_students')
+counters.invalidate_on(Staff, 'total_staff')
+counters.invalidate_on(User, 'total_students', 'total_staff')
+counters.invalidate_on(FeePayment, 'pending_fee_approvals')
+counters.invalidate_on(Event, 'today_events')
 
 @bp.route('/dashboard')
 @login_required
@@ -13,10 +89,10 @@ def dashboard():
         return redirect(url_for('main.index'))
     
     # Get dashboard statistics
-    total_students = Student.query.count()
-    total_staff = Staff.query.count()
-    pending_fee_approvals = FeePayment.query.filter_by(status='pending').count()
-    today_events = Event.query.filter_by(event_date=date.today()).count()
+    total_students = count_students()
+    total_staff = count_staff()
+    pending_fee_approvals = count_pending_fee_approvals()
+    today_events = count_events_on(date.today())
     
     return render_template('staff/dashboard.html', 
                          total_students=total_students,
@@ -24,6 +100,40 @@ def dashboard():
                          pending_fee_approvals=pending_fee_approvals,
                          today_events=today_events)
 
+@bp.route('/api/cache-stats')
+@login_required
+def cache_stats():
+    if current_user.role != 'principal':
+        return jsonify({'error': 'Access denied'}), 403
+    
+    stats = counters.stats()
+    stats['identities'] = identities.stats()
+    stats['library_access'] = access_buffer.stats()
+    return jsonify(stats)
+
+@bp.route('/api/password-hash-stats')
+@login_required
+def password_hash_stats():
+    if current_user.role != 'principal':
+        return jsonify({'error': 'Access denied'}), 403
+    
+    return jsonify(passwords.stats())
+
+@bp.route('/performance')
+@login_required
+def performance():
+    if current_user.role != 'principal':
+        flash('Access denied.')
+        return redirect(url_for('staff.dashboard'))
+    
+    recent = instrumentation.recent()
+    slowest = sorted(recent, key=lambda record: record['total_ms'], reverse=True)[:20]
+    return render_template('staff/performance.html',
+                         endpoints=instrumentation.endpoint_summary(),
+                         slowest=slowest,
+                         buffered=len(recent),
+                         capacity=current_app.config['INSTRUMENTATION_BUFFER_SIZE'])
+
 # Examination Management
 @bp.route('/examinations')
 @login_required
@@ -32,8 +142,28 @@ def examinations():
         flash('Access denied.')
         return redirect(url_for('main.index'))
     
-    exams = Examination.query.all()
-    return render_template('staff/examinations.html', exams=exams)
+    query = Examination.query
+    course = request.args.get('course')
+    year = request.args.get('year', type=int)
+    semester = request.args.get('semester', type=int)
+    subject = request.args.get('subject')
+    date_from = _date_arg('date_from')
+    date_to = _date_arg('date_to')
+    if course:
+        query = query.filter(Examination.course == course)
+    if year:
+        query = query.filter(Examination.year == year)
+    if semester:
+        query = query.filter(Examination.semester == semester)
+    if subject:
+        query = query.filter(Examination.subject == subject)
+    if date_from:
+        query = query.filter(Examination.exam_date >= date_from)
+    if date_to:
+        query = query.filter(Examination.exam_date <= date_to)
+    
+    page = _page(query, [Examination.exam_date, Examination.id])
+    return render_template('staff/examinations.html', exams=page.items, page=page)
 
 @bp.route('/examinations/add', methods=['GET', 'POST'])
 @login_required
@@ -62,6 +192,92 @@ def add_examination():
     
     return render_template('staff/add_examination.html')
 
+@bp.route('/examinations/<int:exam_id>/marks', methods=['GET', 'POST'])
+@login_required
+def upload_marks(exam_id):
+    if current_user.role not in ['staff', 'principal']:
+        flash('Access denied.')
+        return redirect(url_for('main.index'))
+    
+    exam = db.get_or_404(Examination, exam_id)
+    wants_json = request.accept_mimetypes.best_match(['text/html', 'application/json']) == 'application/json'
+    summary = None
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        try:
+            if upload is None or not upload.filename:
+                raise UploadError('Choose a file to upload.')
+            summary = import_marks(
+                exam,
+                read_rows(upload.stream, upload.filename),
+                current_app.config.get('GRADE_SCALE', DEFAULT_GRADE_SCALE),
+                current_app.config.get('MARKS_BATCH_SIZE', 1000)
+            )
+        except UploadError as error:
+            db.session.rollback()
+            if wants_json:
+                return jsonify({'error': str(error)}), 400
+            flash(str(error))
+            return render_template('staff/upload_marks.html', exam=exam, summary=None), 400
+        
+        # Saved rows and the cohort's rankings change together
+        rebuild_rankings(db.session.connection(), exam.course, exam.year, exam.semester)
+        db.session.commit()
+        if wants_json:
+            return jsonify(summary)
+        flash(f"Saved marks for {summary['saved']} students ({summary['created']} new, "
+              f"{summary['updated']} updated); {len(summary['errors'])} rows rejected.")
+    
+    return render_template('staff/upload_marks.html', exam=exam, summary=summary)
+
+@bp.route('/rankings')
+@login_required
+def class_rankings():
+    if current_user.role not in ['staff', 'principal']:
+        flash('Access denied.')
+        return redirect(url_for('main.index'))
+    
+    cohorts = db.session.query(
+        ResultSnapshot.course, ResultSnapshot.year, ResultSnapshot.semester,
+        func.max(ResultSnapshot.cohort_size), func.max(ResultSnapshot.computed_at)
+    ).group_by(ResultSnapshot.course, ResultSnapshot.year, ResultSnapshot.semester).all()
+    
+    course = request.args.get('course')
+    year = request.args.get('year', type=int)
+    semester = request.args.get('semester', type=int)
+    if not cohorts:
+        return render_template('staff/rankings.html', cohorts=cohorts, cohort=(course, year, semester))
+    if not (course and year and semester):
+        course, year, semester = cohorts[0][:3]
+    
+    page = _page(
+        ResultSnapshot.query.filter_by(course=course, year=year, semester=semester),
+        [ResultSnapshot.rank, ResultSnapshot.student_id],
+        descending=False,
+        options=[joinedload(ResultSnapshot.student)]
+    )
+    toppers = SubjectTopper.query.filter_by(course=course, year=year, semester=semester).options(
+        joinedload(SubjectTopper.student)
+    ).order_by(SubjectTopper.subject, SubjectTopper.student_id).all()
+    
+    return render_template('staff/rankings.html', cohorts=cohorts, cohort=(course, year, semester),
+                         standings=page.items, page=page, toppers=toppers)
+
+@bp.route('/rankings/rebuild', methods=['POST'])
+@login_required
+def recompute_rankings():
+    if current_user.role not in ['staff', 'principal']:
+        flash('Access denied.')
+        return redirect(url_for('main.index'))
+    
+    course = request.form.get('course') or None
+    year = request.form.get('year', type=int)
+    semester = request.form.get('semester', type=int)
+    count = rebuild_rankings(db.session.connection(), course, year, semester)
+    db.session.commit()
+    flash(f'Rankings recomputed for {count} students.')
+    return redirect(url_for('staff.class_rankings', course=course, year=year, semester=semester))
+
 # Fee Management
 @bp.route('/fee-structure')
 @login_required
@@ -80,8 +296,45 @@ def fee_payments():
         flash('Access denied.')
         return redirect(url_for('main.index'))
     
-    payments = FeePayment.query.all()
-    return render_template('staff/fee_payments.html', payments=payments)
+    query = _filter_fee_payments(FeePayment.query)
+    
+    # Per-status counts for the filter tabs, computed before the status filter
+    status_counts = dict(query.order_by(None).with_entities(
+        FeePayment.status, func.count(FeePayment.id)
+    ).group_by(FeePayment.status).all())
+    
+    status = request.args.get('status')
+    if status:
+        query = query.filter(FeePayment.status == status)
+    
+    page = _page(query, [FeePayment.payment_date, FeePayment.id],
+                 options=[joinedload(FeePayment.student), joinedload(FeePayment.fee_structure)])
+    return render_template('staff/fee_payments.html', payments=page.items, page=page,
+                         status_counts=status_counts)
+
+@bp.route('/fee-dues')
+@login_required
+def fee_dues():
+    if current_user.role not in ['staff', 'principal']:
+        flash('Access denied.')
+        return redirect(url_for('main.index'))
+    
+    query = FeeLedger.query
+    course = request.args.get('course')
+    year = request.args.get('year', type=int)
+    if course:
+        query = query.filter(FeeLedger.course == course)
+    if year:
+        query = query.filter(FeeLedger.year == year)
+    min_outstanding = request.args.get('min_outstanding', type=float)
+    if min_outstanding:
+        query = query.filter(FeeLedger.outstanding >= min_outstanding)
+    else:
+        query = query.filter(FeeLedger.outstanding > 0)
+    
+    page = _page(query, [FeeLedger.outstanding, FeeLedger.student_id, FeeLedger.fee_structure_id],
+                 options=[joinedload(FeeLedger.student), joinedload(FeeLedger.fee_structure)])
+    return render_template('staff/fee_dues.html', dues=page.items, page=page)
 
 @bp.route('/approve-payment/<int:payment_id>/<int:level>')
 @login_required
@@ -90,21 +343,70 @@ def approve_payment(payment_id, level):
         flash('Access denied.')
         return redirect(url_for('main.index'))
     
-    payment = FeePayment.query.get_or_404(payment_id)
-    
-    if level == 1:
-        payment.level1_approver = current_user.staff.id
-        payment.level1_approval_date = datetime.utcnow()
-        payment.status = 'level1_approved'
-    elif level == 2 and current_user.role == 'principal':
-        payment.level2_approver = current_user.staff.id
-        payment.level2_approval_date = datetime.utcnow()
-        payment.status = 'approved'
+    if level not in LEVELS or (level == 2 and current_user.role != 'principal'):
+        flash('Only the principal can give level 2 approval.')
+        return redirect(url_for('staff.fee_payments'))
     
+    outcome, = approve_payments(level, current_user.staff.id, [payment_id])
+    if outcome['outcome'] == 'not_found':
+        abort(404)
     db.session.commit()
-    flash(f'Payment approved at level {level}!')
+    if outcome['outcome'] == 'approved':
+        flash(f'Payment approved at level {level}!')
+    else:
+        flash(f"Payment not approved: it is already {outcome['status'].replace('_', ' ')}.")
     return redirect(url_for('staff.fee_payments'))
 
+@bp.route('/fee-payments/approve', methods=['POST'])
+@login_required
+def approve_payments_batch():
+    if current_user.role not in ['staff', 'principal']:
+        return jsonify({'error': 'Access denied'}), 403
+    
+    data = request.get_json(silent=True) if request.is_json else None
+    if data is not None:
+        args = MultiDict({key: value for key, value in data.items() if key != 'payment_ids'})
+        payment_ids = data.get('payment_ids')
+    else:
+        args = request.form
+        payment_ids = request.form.getlist('payment_ids', type=int) or None
+    level = args.get('level', type=int)
+    
+    def refuse(message, status=400):
+        # API callers get the error; the list page's forms get it flashed
+        if request.is_json:
+            return jsonify({'error': message}), status
+        flash(message)
+        return redirect(url_for('staff.fee_payments', status=LEVELS.get(level, LEVELS[1])[0]))
+    
+    if level not in LEVELS:
+        return refuse('level must be 1 or 2')
+    if level == 2 and current_user.role != 'principal':
+        return refuse('Only the principal can give level 2 approval', 403)
+    
+    if payment_ids is not None:
+        if not isinstance(payment_ids, list) or not all(isinstance(payment_id, int) for payment_id in payment_ids):
+            return refuse('payment_ids must be a list of integers')
+        outcomes = approve_payments(level, current_user.staff.id, payment_ids)
+    else:
+        criteria = _fee_payment_criteria(args)
+        # Refuse to approve every payment in the system by accident
+        if not criteria:
+            if data is None:
+                return refuse('Select at least one payment to approve.')
+            return refuse('Give payment_ids or at least one filter')
+        outcomes = approve_payments(level, current_user.staff.id, criteria=criteria)
+    db.session.commit()
+    
+    counts = {'approved': 0, 'conflict': 0, 'not_found': 0}
+    for outcome in outcomes:
+        counts[outcome['outcome']] += 1
+    if request.is_json or request.accept_mimetypes.best_match(['text/html', 'application/json']) == 'application/json':
+        return jsonify({'level': level, 'counts': counts, 'payments': outcomes})
+    flash(f"Approved {counts['approved']} payments at level {level}; "
+          f"{counts['conflict']} were already processed and {counts['not_found']} were not found.")
+    return redirect(url_for('staff.fee_payments', status=LEVELS[level][1]))
+
 # Transportation Management
 @bp.route('/transportation')
 @login_required
@@ -113,9 +415,15 @@ def transportation():
         flash('Access denied.')
         return redirect(url_for('main.index'))
     
-    routes = BusRoute.query.all()
-    buses = Bus.query.all()
-    return render_template('staff/transportation.html', routes=routes, buses=buses)
+    query = BusRoute.query
+    status = request.args.get('status')
+    if status == 'active':
+        query = query.filter(BusRoute.is_active == True)
+    elif status == 'inactive':
+        query = query.filter(BusRoute.is_active == False)
+    
+    page = _page(query, [BusRoute.id], descending=False, options=[selectinload(BusRoute.buses)])
+    return render_template('staff/transportation.html', routes=page.items, page=page)
 
 @bp.route('/bus-routes/add', methods=['GET', 'POST'])
 @login_required
@@ -125,6 +433,12 @@ def add_bus_route():
         return redirect(url_for('main.index'))
     
     if request.method == 'POST':
+        try:
+            stops = parse_stops(request.form.get('stops'))
+        except ValueError as error:
+            flash(f'Stops: {error}')
+            return render_template('staff/add_bus_route.html'), 400
+        # The bus_stop rows are written from the JSON when the route is flushed
         route = BusRoute(
             route_name=request.form['route_name'],
             route_number=request.form['route_number'],
@@ -132,7 +446,7 @@ def add_bus_route():
             ending_point=request.form['ending_point'],
             total_distance=float(request.form['total_distance']),
             estimated_time=int(request.form['estimated_time']),
-            stops=request.form['stops'],
+            stops=stops_json(stops),
             monthly_fee=float(request.form['monthly_fee']),
             term_fee=float(request.form['term_fee'])
         )
@@ -143,6 +457,20 @@ def add_bus_route():
     
     return render_template('staff/add_bus_route.html')
 
+@bp.route('/bus-routes/<int:route_id>/rebalance', methods=['POST'])
+@login_required
+def rebalance_bus_route(route_id):
+    if current_user.role not in ['staff', 'principal']:
+        flash('Access denied.')
+        return redirect(url_for('main.index'))
+    
+    route = db.get_or_404(BusRoute, route_id)
+    summary = rebalance_routes(db.session.connection(), [route.id])
+    db.session.commit()
+    flash(f"{route.route_name}: {summary['allocated']} seats allocated, {summary['waitlisted']} waitlisted, "
+          f"{summary['moved']} riders moved.")
+    return redirect(url_for('staff.transportation'))
+
 # Attendance Management
 @bp.route('/attendance')
 @login_required
@@ -151,8 +479,19 @@ def attendance():
         flash('Access denied.')
         return redirect(url_for('main.index'))
     
-    students = Student.query.all()
-    return render_template('staff/attendance.html', students=students)
+    query = Student.query
+    course = request.args.get('course')
+    year = request.args.get('year', type=int)
+    semester = request.args.get('semester', type=int)
+    if course:
+        query = query.filter(Student.course == course)
+    if year:
+        query = query.filter(Student.year == year)
+    if semester:
+        query = query.filter(Student.semester == semester)
+    
+    page = _page(query, [Student.id], descending=False)
+    return render_template('staff/attendance.html', students=page.items, page=page)
 
 @bp.route('/mark-attendance', methods=['POST'])
 @login_required
@@ -160,35 +499,50 @@ def mark_attendance():
     if current_user.role not in ['staff', 'principal']:
         return jsonify({'error': 'Access denied'}), 403
     
-    student_id = request.json['student_id']
-    subject = request.json['subject']
-    status = request.json['status']
     attendance_date = datetime.strptime(request.json['date'], '%Y-%m-%d').date()
     
-    # Check if attendance already marked for this date
-    existing = Attendance.query.filter_by(
-        student_id=student_id,
-        subject=subject,
-        date=attendance_date
-    ).first()
-    
-    if existing:
-        existing.status = status
-        existing.marked_by = current_user.staff.id
-        existing.marked_at = datetime.utcnow()
-    else:
-        attendance = Attendance(
-            student_id=student_id,
-            subject=subject,
-            date=attendance_date,
-            status=status,
-            marked_by=current_user.staff.id
-        )
-        db.session.add(attendance)
+    results = mark_roster(
+        request.json['subject'],
+        attendance_date,
+        [{'student_id': request.json['student_id'], 'status': request.json['status']}],
+        current_user.staff.id
+    )
+    if results[0]['result'] == 'error':
+        return jsonify({'error': results[0]['error']}), 400
     
     db.session.commit()
     return jsonify({'success': True})
 
+@bp.route('/mark-attendance/bulk', methods=['POST'])
+@login_required
+def mark_attendance_bulk():
+    if current_user.role not in ['staff', 'principal']:
+        return jsonify({'error': 'Access denied'}), 403
+    
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Request body must be a JSON object'}), 400
+    subject = data.get('subject')
+    records = data.get('records')
+    if not subject or not isinstance(records, list):
+        return jsonify({'error': 'subject and a list of records are required'}), 400
+    try:
+        attendance_date = datetime.strptime(data.get('date', ''), '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        return jsonify({'error': 'date must be in YYYY-MM-DD format'}), 400
+    
+    # Whole roster in one transaction
+    results = mark_roster(subject, attendance_date, records, current_user.staff.id)
+    db.session.commit()
+    
+    saved = sum(1 for result in results if result['result'] != 'error')
+    return jsonify({
+        'success': True,
+        'saved': saved,
+        'errors': len(results) - saved,
+        'results': results
+    })
+
 # Event Management
 @bp.route('/events')
 @login_required
@@ -197,8 +551,24 @@ def events():
         flash('Access denied.')
         return redirect(url_for('main.index'))
     
-    events = Event.query.all()
-    return render_template('staff/events.html', events=events)
+    query = Event.query
+    event_type = request.args.get('type')
+    status = request.args.get('status')
+    date_from = _date_arg('date_from')
+    date_to = _date_arg('date_to')
+    if event_type:
+        query = query.filter(Event.event_type == event_type)
+    if status == 'active':
+        query = query.filter(Event.is_active == True)
+    elif status == 'inactive':
+        query = query.filter(Event.is_active == False)
+    if date_from:
+        query = query.filter(Event.event_date >= date_from)
+    if date_to:
+        query = query.filter(Event.event_date <= date_to)
+    
+    page = _page(query, [Event.event_date, Event.id], options=[joinedload(Event.creator)])
+    return render_template('staff/events.html', events=page.items, page=page)
 
 @bp.route('/events/add', methods=['GET', 'POST'])
 @login_required
@@ -219,6 +589,7 @@ def add_event():
             target_audience=request.form['target_audience'],
             created_by=current_user.staff.id
         )
+        # The event_audience rows are parsed from target_audience at flush, see app/events.py
         db.session.add(event)
         db.session.commit()
         flash('Event added successfully!')
@@ -234,8 +605,28 @@ def library():
         flash('Access denied.')
         return redirect(url_for('main.index'))
     
-    resources = LibraryResource.query.all()
-    return render_template('staff/library.html', resources=resources)
+    query = LibraryResource.query
+    course = request.args.get('course')
+    year = request.args.get('year', type=int)
+    subject = request.args.get('subject')
+    resource_type = request.args.get('type')
+    status = request.args.get('status')
+    if course:
+        query = query.filter(LibraryResource.course == course)
+    if year:
+        query = query.filter(LibraryResource.year == year)
+    if subject:
+        query = query.filter(LibraryResource.subject == subject)
+    if resource_type:
+        query = query.filter(LibraryResource.resource_type == resource_type)
+    if status == 'available':
+        query = query.filter(LibraryResource.is_available == True)
+    elif status == 'unavailable':
+        query = query.filter(LibraryResource.is_available == False)
+    
+    page = _page(query, [LibraryResource.id], options=[joinedload(LibraryResource.added_by_staff)])
+    return render_template('staff/library.html', resources=page.items, page=page,
+                           opens=access_buffer.totals([resource.id for resource in page.items]))
 
 @bp.route('/library/add-resource', methods=['GET', 'POST'])
 @login_required
@@ -256,9 +647,132 @@ def add_library_resource():
             description=request.form['description'],
             added_by=current_user.staff.id
         )
-        db.session.add(resource)
-        db.session.commit()
+        # The file only lands in the library once its row is committed
+        with store_upload(request.files.get('file')) as file_path:
+            resource.file_path = file_path
+            db.session.add(resource)
+            db.session.commit()
         flash('Library resource added successfully!')
         return redirect(url_for('staff.library'))
     
     return render_template('staff/add_library_resource.html')
+
+# Exports
+@bp.route('/export/fee-payments.<any(csv, ndjson):fmt>')
+@login_required
+def export_fee_payments(fmt):
+    if current_user.role not in ['staff', 'principal']:
+        flash('Access denied.')
+        return redirect(url_for('main.index'))
+    
+    stmt = select(
+        FeePayment.id,
+        Student.student_id.label('roll_number'),
+        Student.first_name,
+        Student.last_name,
+        FeeStructure.course,
+        FeeStructure.year,
+        FeeStructure.semester,
+        FeeStructure.academic_year,
+        FeePayment.amount_paid,
+        FeePayment.payment_method,
+        FeePayment.transaction_id,
+        FeePayment.payment_date,
+        FeePayment.status,
+    ).join(Student, FeePayment.student_id == Student.id).join(
+        FeeStructure, FeePayment.fee_structure_id == FeeStructure.id
+    )
+    stmt = _filter_fee_payments(stmt)
+    status = request.args.get('status')
+    if status:
+        stmt = stmt.where(FeePayment.status == status)
+    return stream_export(stmt.order_by(FeePayment.id), fmt, 'fee_payments')
+
+@bp.route('/export/attendance.<any(csv, ndjson):fmt>')
+@login_required
+def export_attendance(fmt):
+    if current_user.role not in ['staff', 'principal']:
+        flash('Access denied.')
+        return redirect(url_for('main.index'))
+    
+    stmt = select(
+        Attendance.date,
+        Attendance.subject,
+        Student.student_id.label('roll_number'),
+        Student.first_name,
+        Student.last_name,
+        Student.course,
+        Student.year,
+        Student.semester,
+        Attendance.status,
+        Attendance.remarks,
+    ).join(Student, Attendance.student_id == Student.id)
+    course = request.args.get('course')
+    year = request.args.get('year', type=int)
+    semester = request.args.get('semester', type=int)
+    subject = request.args.get('subject')
+    status = request.args.get('status')
+    date_from = _date_arg('date_from')
+    date_to = _date_arg('date_to')
+    if course:
+        stmt = stmt.where(Student.course == course)
+    if year:
+        stmt = stmt.where(Student.year == year)
+    if semester:
+        stmt = stmt.where(Student.semester == semester)
+    if subject:
+        stmt = stmt.where(Attendance.subject == subject)
+    if status:
+        stmt = stmt.where(Attendance.status == status)
+    if date_from:
+        stmt = stmt.where(Attendance.date >= date_from)
+    if date_to:
+        stmt = stmt.where(Attendance.date <= date_to)
+    # Rows go out in insertion order so the database never has to sort them
+    return stream_export(stmt.order_by(Attendance.id), fmt, 'attendance')
+
+@bp.route('/export/results.<any(csv, ndjson):fmt>')
+@login_required
+def export_results(fmt):
+    if current_user.role not in ['staff', 'principal']:
+        flash('Access denied.')
+        return redirect(url_for('main.index'))
+    
+    stmt = select(
+        Examination.name.label('examination'),
+        Examination.subject,
+        Examination.exam_date,
+        Examination.course,
+        Examination.year,
+        Examination.semester,
+        Student.student_id.label('roll_number'),
+        Student.first_name,
+        Student.last_name,
+        ExamResult.marks_obtained,
+        Examination.max_marks,
+        ExamResult.grade,
+    ).join(Examination, ExamResult.examination_id == Examination.id).join(
+        Student, ExamResult.student_id == Student.id
+    )
+    course = request.args.get('course')
+    year = request.args.get('year', type=int)
+    semester = request.args.get('semester', type=int)
+    subject = request.args.get('subject')
+    grade = request.args.get('grade')
+    date_from = _date_arg('date_from')
+    date_to = _date_arg('date_to')
+    if course:
+        stmt = stmt.where(Examination.course == course)
+    if year:
+        stmt = stmt.where(Examination.year == year)
+    if semester:
+        stmt = stmt.where(Examination.semester == semester)
+    if subject:
+        stmt = stmt.where(Examination.subject == subject)
+    if grade:
+        stmt = stmt.where(ExamResult.grade == grade)
+    if date_from:
+        stmt = stmt.where(Examination.exam_date >= date_from)
+    if date_to:
+        stmt = stmt.where(Examination.exam_date <= date_to)
+    return stream_export(stmt.order_by(ExamResult.id), fmt, 'exam_results')
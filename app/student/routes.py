@@ -1,10 +1,31 @@
-from flask import render_template, redirect, url_for, flash, request, jsonify
+from flask import render_template, redirect, url_for, flash, request, jsonify, current_app
 from flask_login import login_required, current_user
 from app.student import bp
-from app.models import Student, Attendance, Event, LibraryResource, LibraryAccess, ExamResult, BusSubscription, BusRoute
-from app import db
-from datetime import datetime, date
-from sqlalchemy import func
+from app.models import Student, Attendance, AttendanceSummary, Event, LibraryResource, ExamResult, Examination, Bus, BusStop, BusSubscription, BusRoute, ResultSnapshot
+from app import access_buffer, db, counters
+from app.attendance import CHART_MAX_MONTHS, attendance_chart
+from app.events import event_feed
+from app.library_files import send_resource
+from app.pagination import paginate
+from app.popularity import WINDOWS, also_opened, popular_in_class
+from app.rankings import semester_totals
+from app.search import search_resources
+from app.transport import cancel, route_stops, stop_key, stop_prefix, subscribe, waitlist_positions
+from datetime import date, timedelta
+from sqlalchemy import func, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import contains_eager, joinedload, selectinload
+
+# Library filter options, cached until a commit touches the catalogue
+@counters.cached('library_subjects')
+def library_subjects():
+    return [subject for (subject,) in db.session.query(LibraryResource.subject).distinct().order_by(LibraryResource.subject)]
+
+@counters.cached('library_resource_types')
+def library_resource_types():
+    return [resource_type for (resource_type,) in db.session.query(LibraryResource.resource_type).distinct().order_by(LibraryResource.resource_type)]
+
+counters.invalidate_on(LibraryResource, 'library_subjects', 'library_resource_types')
 
 @bp.route('/dashboard')
 @login_required
@@ -19,12 +40,16 @@ def dashboard():
         return redirect(url_for('main.index'))
     
     # Get dashboard statistics
-    total_attendance = Attendance.query.filter_by(student_id=student.id).count()
-    present_count = Attendance.query.filter_by(student_id=student.id, status='present').count()
+    total_attendance, present_count = db.session.query(
+        func.coalesce(func.sum(AttendanceSummary.total), 0),
+        func.coalesce(func.sum(AttendanceSummary.present), 0)
+    ).filter(AttendanceSummary.student_id == student.id).one()
     attendance_percentage = (present_count / total_attendance * 100) if total_attendance > 0 else 0
     
-    upcoming_events = Event.query.filter(Event.event_date >= date.today()).limit(5).all()
-    recent_results = ExamResult.query.filter_by(student_id=student.id).limit(5).all()
+    upcoming_events = event_feed(student).order_by(Event.event_date.asc(), Event.id.asc()).limit(5).all()
+    recent_results = ExamResult.query.filter_by(student_id=student.id).options(
+        joinedload(ExamResult.examination)
+    ).limit(5).all()
     
     return render_template('student/dashboard.html',
                          student=student,
@@ -50,25 +75,32 @@ def attendance():
         return redirect(url_for('main.index'))
     
     student = current_user.student
-    attendance_records = Attendance.query.filter_by(student_id=student.id).order_by(Attendance.date.desc()).all()
-    
-    # Calculate subject-wise attendance
-    subject_attendance = {}
-    for record in attendance_records:
-        if record.subject not in subject_attendance:
-            subject_attendance[record.subject] = {'total': 0, 'present': 0}
-        subject_attendance[record.subject]['total'] += 1
-        if record.status == 'present':
-            subject_attendance[record.subject]['present'] += 1
-    
-    # Calculate percentages
-    for subject in subject_attendance:
-        total = subject_attendance[subject]['total']
-        present = subject_attendance[subject]['present']
-        subject_attendance[subject]['percentage'] = (present / total * 100) if total > 0 else 0
+    summaries = AttendanceSummary.query.filter_by(student_id=student.id).order_by(
+        AttendanceSummary.subject
+    ).all()
+    subject_attendance = {
+        summary.subject: {
+            'total': summary.total,
+            'present': summary.present,
+            'late': summary.late,
+            'absent': summary.absent,
+            'percentage': summary.percentage
+        }
+        for summary in summaries
+    }
+    
+    # Detailed history is paged instead of loaded in full
+    page = paginate(
+        Attendance.query.filter_by(student_id=student.id),
+        [Attendance.date, Attendance.id],
+        current_app.config['ITEMS_PER_PAGE'],
+        after=request.args.get('after'),
+        before=request.args.get('before')
+    )
     
     return render_template('student/attendance.html',
-                         attendance_records=attendance_records,
+                         attendance_records=page.items,
+                         page=page,
                          subject_attendance=subject_attendance)
 
 @bp.route('/academics')
@@ -81,24 +113,28 @@ def academics():
     student = current_user.student
     exam_results = ExamResult.query.filter_by(student_id=student.id).join(
         ExamResult.examination
-    ).order_by('examination.exam_date desc').all()
-    
-    # Calculate semester-wise performance
-    semester_performance = {}
-    for result in exam_results:
-        semester = f"Year {result.examination.year} - Semester {result.examination.semester}"
-        if semester not in semester_performance:
-            semester_performance[semester] = {'total_marks': 0, 'obtained_marks': 0, 'subjects': 0}
-        
-        semester_performance[semester]['total_marks'] += result.examination.max_marks
-        semester_performance[semester]['obtained_marks'] += result.marks_obtained
-        semester_performance[semester]['subjects'] += 1
-    
-    # Calculate percentages
-    for semester in semester_performance:
-        total = semester_performance[semester]['total_marks']
-        obtained = semester_performance[semester]['obtained_marks']
-        semester_performance[semester]['percentage'] = (obtained / total * 100) if total > 0 else 0
+    ).options(
+        contains_eager(ExamResult.examination)
+    ).order_by(Examination.exam_date.desc()).all()
+    
+    # Semester-wise performance, summed by the database
+    standings = {
+        (snapshot.year, snapshot.semester): snapshot
+        for snapshot in ResultSnapshot.query.filter_by(student_id=student.id)
+    }
+    totals = db.session.execute(semester_totals(ExamResult.student_id == student.id).order_by(
+        Examination.year.desc(), Examination.semester.desc()
+    )).all()
+    semester_performance = {
+        f"Year {row.year} - Semester {row.semester}": {
+            'total_marks': row.total_marks,
+            'obtained_marks': row.obtained_marks,
+            'subjects': row.subjects,
+            'percentage': (row.obtained_marks / row.total_marks * 100) if row.total_marks else 0,
+            'standing': standings.get((row.year, row.semester)),
+        }
+        for row in totals
+    }
     
     return render_template('student/academics.html',
                          exam_results=exam_results,
@@ -113,14 +149,18 @@ def library():
         return redirect(url_for('main.index'))
     
     student = current_user.student
+    search = request.args.get('q', '').strip()
     subject = request.args.get('subject', '')
     resource_type = request.args.get('type', '')
+    window_days = request.args.get('window', 30, type=int)
+    if window_days not in WINDOWS:
+        window_days = 30
     
     # Build query based on filters
     query = LibraryResource.query.filter_by(is_available=True)
     
     if subject:
-        query = query.filter(LibraryResource.subject.ilike(f'%{subject}%'))
+        query = query.filter_by(subject=subject)
     if resource_type:
         query = query.filter_by(resource_type=resource_type)
     
@@ -133,16 +173,24 @@ def library():
         (LibraryResource.year == None)
     )
     
-    resources = query.all()
-    
-    # Get unique subjects and resource types for filters
-    subjects = db.session.query(LibraryResource.subject).distinct().all()
-    resource_types = db.session.query(LibraryResource.resource_type).distinct().all()
+    highlights = {}
+    if search:
+        resources, highlights = search_resources(query, search)
+    else:
+        resources = query.all()
+    resource_ids = [resource.id for resource in resources]
     
     return render_template('student/library.html',
                          resources=resources,
-                         subjects=[s[0] for s in subjects],
-                         resource_types=[r[0] for r in resource_types],
+                         opened=access_buffer.counts(student.id, resource_ids),
+                         popular=popular_in_class(student, window_days, subject),
+                         also=also_opened(student, resource_ids),
+                         windows=WINDOWS,
+                         current_window=window_days,
+                         highlights=highlights,
+                         subjects=library_subjects(),
+                         resource_types=library_resource_types(),
+                         current_search=search,
                          current_subject=subject,
                          current_type=resource_type)
 
@@ -155,28 +203,22 @@ def access_resource(resource_id):
     
     student = current_user.student
     resource = LibraryResource.query.get_or_404(resource_id)
-    
-    # Log the access
-    access_log = LibraryAccess.query.filter_by(
-        student_id=student.id,
-        resource_id=resource_id
-    ).first()
-    
-    if access_log:
-        access_log.download_count += 1
-        access_log.access_date = datetime.utcnow()
-    else:
-        access_log = LibraryAccess(
-            student_id=student.id,
-            resource_id=resource_id
-        )
-        db.session.add(access_log)
-    
-    db.session.commit()
-    
-    # In a real application, you would serve the actual file here
-    flash(f'Accessing resource: {resource.title}')
-    return redirect(url_for('student.library'))
+    if not (resource.is_available and resource.course in (student.course, 'all')
+            and resource.year in (student.year, None)):
+        flash('This resource is not available to you.')
+        return redirect(url_for('student.library'))
+    
+    if not resource.file_path:
+        flash(f'No file is attached to {resource.title} yet.')
+        return redirect(url_for('student.library'))
+    response = send_resource(resource)
+    
+    # Log the access once the file is actually sent; counted in memory and
+    # written in batches. Revalidations (304) are not opens, and neither are
+    # the later ranges a PDF viewer fetches.
+    if response.status_code in (200, 206) and (request.range is None or request.range.ranges[0][0] == 0):
+        access_buffer.record(student.id, resource.id, student.course, student.year)
+    return response
 
 @bp.route('/events')
 @login_required
@@ -186,30 +228,27 @@ def events():
         return redirect(url_for('main.index'))
     
     student = current_user.student
-    
-    # Get current and upcoming events
-    current_events = Event.query.filter(
-        Event.event_date >= date.today(),
-        Event.is_active == True
-    ).filter(
-        (Event.target_audience == 'all') |
-        (Event.target_audience.ilike(f'%{student.course}%')) |
-        (Event.target_audience.ilike(f'%year_{student.year}%'))
-    ).order_by(Event.event_date.asc()).all()
-    
-    # Get past events for reference
-    past_events = Event.query.filter(
-        Event.event_date < date.today(),
-        Event.is_active == True
-    ).filter(
-        (Event.target_audience == 'all') |
-        (Event.target_audience.ilike(f'%{student.course}%')) |
-        (Event.target_audience.ilike(f'%year_{student.year}%'))
-    ).order_by(Event.event_date.desc()).limit(10).all()
+    past = request.args.get('when') == 'past'
+    
+    # Upcoming events soonest first, past events most recent first
+    page = paginate(
+        event_feed(student, past=past),
+        [Event.event_date, Event.id],
+        current_app.config['ITEMS_PER_PAGE'],
+        after=request.args.get('after'),
+        before=request.args.get('before'),
+        descending=past,
+        options=[joinedload(Event.creator)]
+    )
+    type_counts = dict(event_feed(student).with_entities(
+        Event.event_type, func.count(Event.id)
+    ).group_by(Event.event_type).all())
     
     return render_template('student/events.html',
-                         current_events=current_events,
-                         past_events=past_events)
+                         events=page.items,
+                         page=page,
+                         past=past,
+                         type_counts=type_counts)
 
 @bp.route('/transportation')
 @login_required
@@ -224,14 +263,97 @@ def transportation():
     subscriptions = BusSubscription.query.filter_by(
         student_id=student.id,
         is_active=True
-    ).all()
-    
-    # Get available routes
-    available_routes = BusRoute.query.filter_by(is_active=True).all()
+    ).options(joinedload(BusSubscription.route), joinedload(BusSubscription.bus)).all()
+    positions = waitlist_positions([subscription.id for subscription in subscriptions
+                                    if subscription.seat_status == 'waitlisted'])
+    
+    # Get available routes, only those serving the stop typed in if any
+    stop = request.args.get('stop', '').strip()
+    routes_query = BusRoute.query.filter_by(is_active=True).options(
+        selectinload(BusRoute.buses), selectinload(BusRoute.bus_stops)
+    )
+    if stop:
+        routes_query = routes_query.filter(BusRoute.id.in_(select(BusStop.route_id).where(*stop_prefix(stop))))
+    available_routes = routes_query.all()
     
     return render_template('student/transportation.html',
                          subscriptions=subscriptions,
-                         available_routes=available_routes)
+                         waitlist_positions=positions,
+                         available_routes=available_routes,
+                         stop=stop,
+                         stop_key=stop_key(stop))
+
+SUBSCRIPTION_PLANS = {'monthly': 30, 'term': 120}
+
+@bp.route('/transportation/subscribe', methods=['POST'])
+@login_required
+def subscribe_route():
+    if current_user.role != 'student':
+        return jsonify({'error': 'Access denied'}), 403
+    
+    wants_json = request.accept_mimetypes.best_match(['text/html', 'application/json']) == 'application/json'
+    
+    def fail(message, status=400):
+        if wants_json:
+            return jsonify({'error': message}), status
+        flash(message)
+        return redirect(url_for('student.transportation'))
+    
+    route = db.session.get(BusRoute, request.form.get('route_id', type=int) or 0)
+    if route is None or not route.is_active:
+        return fail('Choose an active route.', 404)
+    plan = request.form.get('plan', 'monthly')
+    if plan not in SUBSCRIPTION_PLANS:
+        return fail('Choose a monthly or term plan.')
+    pickup_stop = (request.form.get('pickup_stop') or '').strip()
+    stops = route_stops(route.id)
+    if not pickup_stop or (stops and pickup_stop not in stops):
+        return fail('Choose a pickup stop on this route.')
+    
+    subscription = BusSubscription(
+        student_id=current_user.student.id,
+        route_id=route.id,
+        start_date=date.today(),
+        end_date=date.today() + timedelta(days=SUBSCRIPTION_PLANS[plan]),
+        amount_paid=route.monthly_fee if plan == 'monthly' else route.term_fee,
+        pickup_stop=pickup_stop
+    )
+    try:
+        bus_id = subscribe(subscription)
+    except IntegrityError:
+        db.session.rollback()
+        return fail('You are already subscribed to this route.', 409)
+    db.session.commit()
+    
+    position = None if bus_id else waitlist_positions([subscription.id]).get(subscription.id)
+    bus = db.session.get(Bus, bus_id) if bus_id else None
+    if wants_json:
+        return jsonify({
+            'subscription_id': subscription.id,
+            'seat_status': 'allocated' if bus else 'waitlisted',
+            'bus': bus.bus_number if bus else None,
+            'waitlist_position': position,
+        }), 201
+    if bus:
+        flash(f'Subscribed to {route.route_name}: your seat is on bus {bus.bus_number}.')
+    else:
+        flash(f'All buses on {route.route_name} are full; you are number {position} on the waitlist.')
+    return redirect(url_for('student.transportation'))
+
+@bp.route('/transportation/<int:subscription_id>/cancel', methods=['POST'])
+@login_required
+def cancel_subscription(subscription_id):
+    if current_user.role != 'student':
+        flash('Access denied.')
+        return redirect(url_for('main.index'))
+    
+    subscription = BusSubscription.query.filter_by(
+        id=subscription_id, student_id=current_user.student.id
+    ).first_or_404()
+    if cancel(subscription):
+        db.session.commit()
+        flash(f'Subscription to {subscription.route.route_name} cancelled.')
+    return redirect(url_for('student.transportation'))
 
 @bp.route('/api/attendance-chart')
 @login_required
@@ -239,23 +361,15 @@ def attendance_chart_data():
     if current_user.role != 'student':
         return jsonify({'error': 'Access denied'}), 403
     
-    student = current_user.student
-    
-    # Get monthly attendance data for the last 6 months
-    attendance_data = db.session.query(
-        func.strftime('%Y-%m', Attendance.date).label('month'),
-        func.count(Attendance.id).label('total'),
-        func.sum(func.case([(Attendance.status == 'present', 1)], else_=0)).label('present')
-    ).filter_by(student_id=student.id).group_by(
-        func.strftime('%Y-%m', Attendance.date)
-    ).order_by('month desc').limit(6).all()
-    
-    chart_data = {
-        'months': [row.month for row in reversed(attendance_data)],
-        'percentages': [
-            (row.present / row.total * 100) if row.total > 0 else 0 
-            for row in reversed(attendance_data)
-        ]
-    }
+    months = min(max(request.args.get('months', 6, type=int), 1), CHART_MAX_MONTHS)
+    data, last_modified = attendance_chart(
+        current_user.student.id, months, by_subject=request.args.get('by') == 'subject'
+    )
     
-    return jsonify(chart_data)
+    # Revalidated on every fetch; unchanged rollups are answered with a 304
+    response = jsonify(data)
+    response.add_etag()
+    response.last_modified = last_modified
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
@@ -0,0 +1,311 @@
+"""Bus stops and seat allocation on the buses of a route.
+
+``BusRoute.stops`` keeps a route's stops as a JSON list of names, or of
+``{"name", "offset_minutes"}`` objects. It is parsed once, when the route is
+written, into ordered ``bus_stop`` rows. Finding the routes that serve a
+stop is then a range scan of the (name_key, route_id) index on the
+normalized name, and needs no JSON parsing. Routes written through the
+ORM get their rows at flush time. Bulk loads rebuild them with ``flask
+rebuild bus-stops``. ``route_stops`` caches each route's stop names until
+a commit changes any stop.
+
+Every active subscription is either ``allocated`` to one bus of its route
+or ``waitlisted``. ``Bus.current_occupancy`` counts the allocated seats.
+A seat is taken with one conditional UPDATE
+(``current_occupancy = current_occupancy + 1 WHERE current_occupancy <
+capacity``), never read-modify-write, so concurrent subscribers cannot
+overbook a bus: whoever finds it full moves on to the next bus, and joins
+the waitlist when every bus is full. A waitlisted subscription is
+promoted with another conditional UPDATE (``WHERE seat_status =
+'waitlisted'``), so two cancellations never hand the same student two
+seats.
+
+Among the buses with free seats, a subscriber goes on the one already
+carrying the most students from the same pickup stop, then the emptiest
+one, so a stop's students ride together.
+
+``rebalance_routes`` (``flask rebuild bus-allocation`` or the staff
+transportation page) recomputes occupancy from the allocations. It moves
+riders off buses in maintenance or over capacity, then fills the free
+seats from the waitlist in subscription order.
+"""
+import json
+from sqlalchemy import and_, bindparam, delete, event, func, insert, inspect, select, update
+from sqlalchemy.orm import Session
+from app import counters, db
+from app.models import Bus, BusRoute, BusStop, BusSubscription
+
+OUT_OF_SERVICE = 'maintenance'
+
+def stop_key(name):
+    """The normalized form of a stop name that ``bus_stop.name_key`` stores."""
+    return ' '.join(str(name).split()).lower()
+
+def _offset(value):
+    if value in (None, ''):
+        return None
+    try:
+        minutes = float(str(value).strip())
+    except ValueError:
+        minutes = -1.0
+    if not minutes.is_integer() or minutes < 0:
+        raise ValueError(f'Minutes from the start must be a whole number, got {value!r}')
+    return int(minutes)
+
+def parse_stops(text):
+    """Return ``[(name, offset_minutes)]`` for the stops described by ``text``.
+
+    ``text`` is either the JSON kept in ``BusRoute.stops`` or one stop per
+    line, optionally followed by ``| minutes`` from the start of the route,
+    as typed into the add route form. Raises ValueError for malformed input.
+    """
+    text = (text or '').strip()
+    if text.startswith('['):
+        items = [(item.get('name'), item.get('offset_minutes')) if isinstance(item, dict) else (item, None)
+                 for item in json.loads(text)]
+    else:
+        items = [line.partition('|')[::2] for line in text.splitlines()]
+    stops = []
+    for name, offset in items:
+        name = ' '.join(str(name or '').split())
+        if name:
+            stops.append((name, _offset(offset)))
+    return stops
+
+def stops_json(stops):
+    """The ``BusRoute.stops`` JSON for ``[(name, offset_minutes)]``."""
+    return json.dumps([name if offset is None else {'name': name, 'offset_minutes': offset}
+                       for name, offset in stops])
+
+def _stored_stops(text):
+    try:
+        return parse_stops(text)
+    except ValueError:
+        return []  # unreadable legacy value: the route just has no stops
+
+@counters.cached('route_stops')
+def route_stops(route_id):
+    """The stop names of route ``route_id``, in order."""
+    return tuple(db.session.execute(
+        select(BusStop.name).where(BusStop.route_id == route_id).order_by(BusStop.sequence)
+    ).scalars())
+
+counters.invalidate_on(BusStop, 'route_stops')
+
+def stop_prefix(prefix):
+    """Conditions matching the bus stops whose name starts with ``prefix``, case-insensitively."""
+    key = stop_key(prefix)
+    # A range on the index rather than LIKE, which SQLite only indexes case-sensitively
+    return [BusStop.name_key >= key, BusStop.name_key < key + '\U0010ffff']
+
+def rebuild_stops(conn):
+    """Re-parse the stops of every route on ``conn``."""
+    conn.execute(delete(BusStop))
+    rows = [{'route_id': route_id, 'sequence': sequence, 'name': name, 'name_key': stop_key(name),
+             'offset_minutes': offset}
+            for route_id, text in conn.execute(select(BusRoute.id, BusRoute.stops))
+            for sequence, (name, offset) in enumerate(_stored_stops(text), start=1)]
+    if rows:
+        conn.execute(insert(BusStop), rows)
+
+@event.listens_for(Session, 'before_flush')
+def _set_stops(session, flush_context, instances):
+    for obj in list(session.new) + list(session.dirty):
+        if not isinstance(obj, BusRoute):
+            continue
+        if obj in session.new or inspect(obj).attrs.stops.history.has_changes():
+            parsed = _stored_stops(obj.stops)
+            if [(stop.name, stop.offset_minutes) for stop in obj.bus_stops] != parsed:
+                obj.bus_stops = [BusStop(sequence=sequence, name=name, name_key=stop_key(name), offset_minutes=offset)
+                                 for sequence, (name, offset) in enumerate(parsed, start=1)]
+
+def _claim_seat(bus_id):
+    bus = Bus.__table__
+    result = db.session.execute(update(bus).where(
+        bus.c.id == bus_id,
+        func.coalesce(bus.c.current_occupancy, 0) < bus.c.capacity,
+        bus.c.status != OUT_OF_SERVICE
+    ).values(current_occupancy=func.coalesce(bus.c.current_occupancy, 0) + 1))
+    return result.rowcount == 1
+
+def _free_seat(bus_id):
+    bus = Bus.__table__
+    db.session.execute(update(bus).where(
+        bus.c.id == bus_id, bus.c.current_occupancy > 0
+    ).values(current_occupancy=bus.c.current_occupancy - 1))
+
+def _candidate_buses(route_id, pickup_stop):
+    """Buses of the route with free seats, best for ``pickup_stop`` first."""
+    subscription = BusSubscription.__table__
+    same_stop = select(func.count()).where(
+        subscription.c.bus_id == Bus.id,
+        subscription.c.pickup_stop == pickup_stop,
+        subscription.c.seat_status == 'allocated'
+    ).scalar_subquery()
+    free = Bus.capacity - func.coalesce(Bus.current_occupancy, 0)
+    return db.session.execute(select(Bus.id).where(
+        Bus.route_id == route_id,
+        Bus.status != OUT_OF_SERVICE,
+        free > 0
+    ).order_by(same_stop.desc(), free.desc(), Bus.id)).scalars().all()
+
+def place(subscription_id, route_id, pickup_stop):
+    """Move a waitlisted subscription onto a bus with a free seat.
+
+    Returns the bus id, or None when every bus is full (or another
+    request placed the subscription first).
+    """
+    subscription = BusSubscription.__table__
+    for bus_id in _candidate_buses(route_id, pickup_stop):
+        if not _claim_seat(bus_id):
+            continue  # filled up since the candidates were read
+        claimed = db.session.execute(update(subscription).where(
+            subscription.c.id == subscription_id,
+            subscription.c.seat_status == 'waitlisted',
+            subscription.c.is_active == True
+        ).values(bus_id=bus_id, seat_status='allocated')).rowcount
+        if claimed:
+            return bus_id
+        _free_seat(bus_id)
+        return None
+    return None
+
+def subscribe(subscription):
+    """Allocate a seat to a new ``subscription``, or waitlist it.
+
+    The subscription is flushed first. Returns the bus id or None.
+    """
+    subscription.seat_status = 'waitlisted'
+    subscription.bus_id = None
+    db.session.add(subscription)
+    db.session.flush()
+    bus_id = place(subscription.id, subscription.route_id, subscription.pickup_stop)
+    db.session.expire(subscription, ['bus_id', 'seat_status'])
+    return bus_id
+
+def promote_waitlist(route_id, limit=None):
+    """Give free seats on the route to waitlisted subscriptions, oldest first."""
+    subscription = BusSubscription.__table__
+    promoted = 0
+    while limit is None or promoted < limit:
+        head = db.session.execute(select(subscription.c.id, subscription.c.pickup_stop).where(
+            subscription.c.route_id == route_id,
+            subscription.c.seat_status == 'waitlisted',
+            subscription.c.is_active == True
+        ).order_by(subscription.c.id).limit(1)).first()
+        if head is None or place(head.id, route_id, head.pickup_stop) is None:
+            break
+        promoted += 1
+    return promoted
+
+def cancel(subscription):
+    """Deactivate ``subscription``, giving its seat to the waitlist."""
+    table = BusSubscription.__table__
+    while True:
+        current = db.session.execute(select(table.c.bus_id).where(
+            table.c.id == subscription.id, table.c.is_active == True
+        )).first()
+        if current is None:
+            return False
+        # Only if no promotion moved it onto a bus in the meantime
+        cancelled = db.session.execute(update(table).where(
+            table.c.id == subscription.id,
+            table.c.is_active == True,
+            table.c.bus_id.is_not_distinct_from(current.bus_id)
+        ).values(is_active=False, seat_status=None, bus_id=None)).rowcount
+        if cancelled:
+            break
+    db.session.expire(subscription, ['is_active', 'seat_status', 'bus_id'])
+    if current.bus_id is not None:
+        _free_seat(current.bus_id)
+        promote_waitlist(subscription.route_id, limit=1)
+    return True
+
+def waitlist_positions(subscription_ids):
+    """Map each waitlisted id in ``subscription_ids`` to its place in its route's queue."""
+    mine = BusSubscription.__table__.alias('mine')
+    ahead = BusSubscription.__table__.alias('ahead')
+    return dict(db.session.execute(select(mine.c.id, func.count(ahead.c.id)).join(ahead, and_(
+        ahead.c.route_id == mine.c.route_id,
+        ahead.c.seat_status == 'waitlisted',
+        ahead.c.is_active == True,
+        ahead.c.id <= mine.c.id
+    )).where(
+        mine.c.id.in_(subscription_ids), mine.c.seat_status == 'waitlisted'
+    ).group_by(mine.c.id)).all())
+
+def rebalance_routes(conn, route_ids=None):
+    """Recompute the allocations of ``route_ids`` (every route by default) on ``conn``.
+
+    Returns ``{'allocated', 'waitlisted', 'moved'}`` totals.
+    """
+    bus_table = Bus.__table__
+    table = BusSubscription.__table__
+    buses_query = select(bus_table.c.id, bus_table.c.route_id, bus_table.c.capacity, bus_table.c.status)
+    if route_ids is not None:
+        buses_query = buses_query.where(bus_table.c.route_id.in_(route_ids))
+    # Lock the buses so concurrent subscribers wait for the rebalance
+    buses = conn.execute(buses_query.order_by(bus_table.c.id).with_for_update()).all()
+    subscriptions_query = select(
+        table.c.id, table.c.route_id, table.c.pickup_stop, table.c.bus_id, table.c.seat_status, table.c.is_active
+    )
+    if route_ids is not None:
+        subscriptions_query = subscriptions_query.where(table.c.route_id.in_(route_ids))
+    subscriptions = conn.execute(subscriptions_query.order_by(table.c.id)).all()
+
+    by_route = {}
+    for bus in buses:
+        by_route.setdefault(bus.route_id, [])
+        if bus.status != OUT_OF_SERVICE:
+            by_route[bus.route_id].append(bus)
+    seats = {bus.id: 0 for bus in buses}
+    riders = {bus.id: {} for bus in buses}
+    assignment = {}
+    unplaced = []
+
+    def seat(subscription_id, bus_id, stop):
+        assignment[subscription_id] = bus_id
+        seats[bus_id] += 1
+        riders[bus_id][stop] = riders[bus_id].get(stop, 0) + 1
+
+    # Keep current riders where their bus still has room, earliest first
+    usable = {bus.id: bus for route_buses in by_route.values() for bus in route_buses}
+    for row in subscriptions:
+        if not row.is_active:
+            continue
+        bus = usable.get(row.bus_id) if row.seat_status == 'allocated' else None
+        if bus is not None and bus.route_id == row.route_id and seats[bus.id] < bus.capacity:
+            seat(row.id, bus.id, row.pickup_stop)
+        else:
+            unplaced.append(row)
+    for row in unplaced:
+        free = [bus for bus in by_route.get(row.route_id, []) if seats[bus.id] < bus.capacity]
+        if free:
+            best = max(free, key=lambda bus: (riders[bus.id].get(row.pickup_stop, 0),
+                                              bus.capacity - seats[bus.id], -bus.id))
+            seat(row.id, best.id, row.pickup_stop)
+
+    changes = []
+    summary = {'allocated': 0, 'waitlisted': 0, 'moved': 0}
+    for row in subscriptions:
+        if not row.is_active:
+            target = (None, None)
+        elif row.id in assignment:
+            target = (assignment[row.id], 'allocated')
+            summary['allocated'] += 1
+        else:
+            target = (None, 'waitlisted')
+            summary['waitlisted'] += 1
+        if (row.bus_id, row.seat_status) != target:
+            changes.append({'subscription_id': row.id, 'new_bus_id': target[0], 'new_seat_status': target[1]})
+            if row.is_active and row.seat_status == 'allocated':
+                summary['moved'] += 1
+    if changes:
+        conn.execute(update(table).where(table.c.id == bindparam('subscription_id')).values(
+            bus_id=bindparam('new_bus_id'), seat_status=bindparam('new_seat_status')
+        ), changes)
+    if seats:
+        conn.execute(update(bus_table).where(bus_table.c.id == bindparam('target_id')).values(
+            current_occupancy=bindparam('occupancy')
+        ), [{'target_id': bus_id, 'occupancy': count} for bus_id, count in seats.items()])
+    return summary
@@ -0,0 +1,392 @@
+"""Load-test benchmark for the student and staff routes.
+
+Seeds a database with generate_data.py, then serves the app from a separate
+process with a threaded WSGI server. Three clients log in: a student,
+staff1 and the principal. Each route is requested ``--requests`` times
+with ``--concurrency`` requests in flight. For every route the run reports
+throughput and p50/p95/p99 latency. Query counts and database time come
+from the Server-Timing header. Results are saved as JSON (by default
+under benchmarks/, named after the current commit). ``--compare``
+checks them against an earlier baseline and exits non-zero on regressions.
+
+``--contention`` then measures the read routes a second time while a
+staff client keeps posting bulk attendance rosters. Those results are
+reported with a ``[writing]`` suffix next to the writer's own throughput.
+Running with ``--no-sqlite-profile`` as well gives the rollback-journal
+baseline without WAL or read/write routing.
+
+``--subscribe N`` logs in N students without a bus pass and has them all
+subscribe to the same route at once, then checks in the database that no
+bus holds more riders than seats and that every bus's occupancy matches
+its allocated subscriptions.
+
+    python benchmark.py --students 2000 --months 3 --concurrency 8
+    python benchmark.py --reuse --compare benchmarks/abc1234.json
+    python benchmark.py --contention --routes student
+    python benchmark.py --reuse --routes transportation --subscribe 200
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import re
+import socket
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from http.cookiejar import CookieJar
+from urllib.error import HTTPError
+from urllib.parse import urlencode
+from urllib.request import HTTPCookieProcessor, Request, build_opener
+from app.instrumentation import percentile
+from generate_data import ACCOUNTS, DEFAULT_PASSWORD, database_config, generate
+
+ROUTES = [
+    ('student', '/student/dashboard'),
+    ('student', '/student/profile'),
+    ('student', '/student/attendance'),
+    ('student', '/student/academics'),
+    ('student', '/student/library'),
+    ('student', '/student/library?q=database'),
+    ('student', '/student/library/access/1'),
+    ('student', '/student/events'),
+    ('student', '/student/transportation'),
+    ('student', '/student/transportation?stop=stop+1-'),
+    ('student', '/student/api/attendance-chart'),
+    ('staff', '/staff/dashboard'),
+    ('staff', '/staff/examinations'),
+    ('staff', '/staff/rankings'),
+    ('staff', '/staff/fee-dues'),
+    ('staff', '/staff/fee-payments'),
+    ('staff', '/staff/fee-payments?status=pending'),
+    ('staff', '/staff/attendance'),
+    ('staff', '/staff/events'),
+    ('staff', '/staff/library'),
+    ('staff', '/staff/transportation'),
+    ('principal', '/staff/dashboard'),
+    ('principal', '/staff/performance'),
+]
+
+_QUERIES_RE = re.compile(r'desc="(\d+) queries"')
+_DB_RE = re.compile(r'db;dur=([\d.]+)')
+
+def serve(database, port, sqlite_profile=True):
+    """Run the app on ``port``; the target of the server process."""
+    from werkzeug.serving import make_server
+    from app import create_app
+
+    class BenchmarkConfig(database_config(database)):
+        WTF_CSRF_ENABLED = False
+        # Login cost is not measured, and a daemon process cannot start the hashing pool
+        PASSWORD_HASH_WORKERS = 0
+        SQLITE_PROFILE = sqlite_profile
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    app = create_app(BenchmarkConfig)
+    app.logger.setLevel(logging.ERROR)
+    make_server('127.0.0.1', port, app, threaded=True).serve_forever()
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def start_server(database, sqlite_profile=True):
+    port = free_port()
+    process = multiprocessing.get_context('spawn').Process(
+        target=serve, args=(database, port, sqlite_profile), daemon=True)
+    process.start()
+    base_url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                return process, base_url
+        except OSError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError('benchmark server did not start')
+
+def login(base_url, username, password):
+    """Return a URL opener holding a logged-in session cookie."""
+    opener = build_opener(HTTPCookieProcessor(CookieJar()))
+    form = urlencode({'username': username, 'password': password}).encode()
+    with opener.open(base_url + '/auth/login', data=form) as response:
+        if '/auth/login' in response.geturl():
+            raise RuntimeError(f'could not log in as {username}')
+    return opener
+
+def timed_request(opener, url):
+    started = time.perf_counter()
+    try:
+        with opener.open(url) as response:
+            response.read()
+            status = response.status
+            timing = response.headers.get('Server-Timing', '')
+    except HTTPError as error:
+        status = error.code
+        timing = error.headers.get('Server-Timing', '')
+    elapsed = (time.perf_counter() - started) * 1000
+    queries = _QUERIES_RE.search(timing)
+    db_time = _DB_RE.search(timing)
+    return {
+        'ms': elapsed,
+        'status': status,
+        'queries': int(queries.group(1)) if queries else None,
+        'db_ms': float(db_time.group(1)) if db_time else None,
+    }
+
+def summarize(samples, wall_time):
+    latencies = sorted(sample['ms'] for sample in samples)
+    queries = [sample['queries'] for sample in samples if sample['queries'] is not None]
+    db_times = [sample['db_ms'] for sample in samples if sample['db_ms'] is not None]
+    return {
+        'requests': len(samples),
+        'errors': sum(1 for sample in samples if sample['status'] >= 400),
+        'throughput': len(samples) / wall_time if wall_time else 0.0,
+        'p50': percentile(latencies, 0.50),
+        'p95': percentile(latencies, 0.95),
+        'p99': percentile(latencies, 0.99),
+        'mean_queries': sum(queries) / len(queries) if queries else None,
+        'mean_db_ms': sum(db_times) / len(db_times) if db_times else None,
+    }
+
+def run_routes(base_url, routes, requests, concurrency, warmup=2, log=print, suffix=''):
+    openers = {role: login(base_url, *ACCOUNTS[role]) for role in {role for role, _ in routes}}
+    results = {}
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for role, path in routes:
+            opener = openers[role]
+            url = base_url + path
+            for _ in range(warmup):
+                timed_request(opener, url)
+            started = time.perf_counter()
+            samples = list(pool.map(lambda _: timed_request(opener, url), range(requests)))
+            key = f'{role} {path}{suffix}'
+            results[key] = summarize(samples, time.perf_counter() - started)
+            log(format_row(key, results[key]))
+    return results
+
+class BulkWriter(threading.Thread):
+    """Post attendance rosters of ``student_ids`` back to back until stopped."""
+
+    def __init__(self, base_url, student_ids, subject='Load Test'):
+        super().__init__(daemon=True)
+        self.opener = login(base_url, *ACCOUNTS['staff'])
+        self.url = base_url + '/staff/mark-attendance/bulk'
+        self.student_ids = student_ids
+        self.subject = subject
+        self.stop = threading.Event()
+        self.samples = []
+
+    def run(self):
+        day = datetime(2000, 1, 1).toordinal()
+        while not self.stop.is_set():
+            body = json.dumps({
+                'subject': self.subject,
+                'date': datetime.fromordinal(day).strftime('%Y-%m-%d'),
+                'records': [{'student_id': student_id, 'status': 'present' if (student_id + day) % 5 else 'absent'}
+                            for student_id in self.student_ids],
+            }).encode()
+            started = time.perf_counter()
+            try:
+                with self.opener.open(Request(self.url, data=body, headers={'Content-Type': 'application/json'})) as response:
+                    response.read()
+                    status = response.status
+            except HTTPError as error:
+                status = error.code
+            self.samples.append({'ms': (time.perf_counter() - started) * 1000, 'status': status,
+                                 'queries': None, 'db_ms': None})
+            day += 1
+
+def roster(database, size):
+    with sqlite3.connect(database) as conn:
+        return [row[0] for row in conn.execute('SELECT id FROM student ORDER BY id LIMIT ?', (size,))]
+
+def run_contention(base_url, routes, requests, concurrency, student_ids, log=print):
+    """Run ``routes`` while a ``BulkWriter`` marks attendance for ``student_ids``."""
+    writer = BulkWriter(base_url, student_ids)
+    started = time.perf_counter()
+    writer.start()
+    try:
+        results = run_routes(base_url, routes, requests, concurrency, log=log, suffix=' [writing]')
+    finally:
+        writer.stop.set()
+        writer.join()
+    key = f'staff POST /staff/mark-attendance/bulk ({len(student_ids)} rows)'
+    results[key] = summarize(writer.samples, time.perf_counter() - started)
+    log(format_row(key, results[key]))
+    return results
+
+def subscribers(database, count):
+    """Up to ``count`` students without an active bus pass, and the route with the most free seats."""
+    with sqlite3.connect(database) as conn:
+        (route_id,) = conn.execute(
+            'SELECT bus_route.id FROM bus_route JOIN bus ON bus.route_id = bus_route.id'
+            ' WHERE bus_route.is_active GROUP BY bus_route.id'
+            ' ORDER BY sum(bus.capacity - bus.current_occupancy) DESC, bus_route.id LIMIT 1'
+        ).fetchone()
+        usernames = [row[0] for row in conn.execute(
+            'SELECT user.username FROM student JOIN user ON user.id = student.user_id'
+            ' WHERE NOT EXISTS (SELECT 1 FROM bus_subscription'
+            '                   WHERE bus_subscription.student_id = student.id AND bus_subscription.is_active)'
+            ' ORDER BY student.id LIMIT ?', (count,))]
+        stops = [row[0] for row in conn.execute(
+            'SELECT name FROM bus_stop WHERE route_id = ? ORDER BY sequence', (route_id,))]
+    return usernames, route_id, stops or ['Main Gate']
+
+def seat_audit(database):
+    """Buses holding more riders than seats, or whose occupancy disagrees with their allocations."""
+    with sqlite3.connect(database) as conn:
+        return conn.execute(
+            'SELECT bus.bus_number, bus.capacity, bus.current_occupancy, count(bus_subscription.id) FROM bus'
+            ' LEFT JOIN bus_subscription ON bus_subscription.bus_id = bus.id'
+            "  AND bus_subscription.is_active AND bus_subscription.seat_status = 'allocated'"
+            ' GROUP BY bus.id HAVING bus.current_occupancy > bus.capacity'
+            '  OR bus.current_occupancy != count(bus_subscription.id)'
+        ).fetchall()
+
+def run_subscriptions(base_url, database, count, concurrency, log=print):
+    """Post ``count`` concurrent subscriptions to one route and audit the seats afterwards."""
+    usernames, route_id, stops = subscribers(database, count)
+    passwords = dict(ACCOUNTS.values())
+    openers = [login(base_url, username, passwords.get(username, DEFAULT_PASSWORD)) for username in usernames]
+    url = base_url + '/student/transportation/subscribe'
+
+    def subscribe(index):
+        form = urlencode({'route_id': route_id, 'pickup_stop': stops[index % len(stops)], 'plan': 'monthly'})
+        return timed_request(openers[index], Request(url, data=form.encode(), headers={'Accept': 'application/json'}))
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        started = time.perf_counter()
+        samples = list(pool.map(subscribe, range(len(openers))))
+        wall_time = time.perf_counter() - started
+    key = f'student POST /student/transportation/subscribe ({len(openers)} students)'
+    stats = summarize(samples, wall_time)
+    stats['seat_errors'] = len(seat_audit(database))
+    log(format_row(key, stats))
+    for bus_number, capacity, occupancy, allocated in seat_audit(database):
+        log(f'SEATS {bus_number}: capacity {capacity}, occupancy {occupancy}, allocated {allocated}')
+    return {key: stats}
+
+def set_journal_mode(database, mode):
+    with sqlite3.connect(database) as conn:
+        conn.execute(f'PRAGMA journal_mode={mode}')
+
+def format_row(key, stats):
+    queries = '-' if stats['mean_queries'] is None else f"{stats['mean_queries']:.1f}"
+    return (f"{key:<45} {stats['throughput']:>8.1f}/s  p50 {stats['p50']:>7.1f}  p95 {stats['p95']:>7.1f}"
+            f"  p99 {stats['p99']:>7.1f} ms  queries {queries:>5}  errors {stats['errors']}")
+
+def compare(results, baseline, tolerance):
+    """List regressions of ``results`` against ``baseline`` routes."""
+    regressions = []
+    for key, stats in results.items():
+        before = baseline.get(key)
+        if before is None:
+            continue
+        if stats['p95'] > before['p95'] * (1 + tolerance):
+            regressions.append(f"{key}: p95 {before['p95']:.1f} -> {stats['p95']:.1f} ms")
+        if stats['throughput'] < before['throughput'] * (1 - tolerance):
+            regressions.append(f"{key}: throughput {before['throughput']:.1f} -> {stats['throughput']:.1f}/s")
+        if (stats['mean_queries'] or 0) > (before['mean_queries'] or 0):
+            regressions.append(f"{key}: queries {before['mean_queries']} -> {stats['mean_queries']}")
+        if stats.get('seat_errors'):
+            regressions.append(f"{key}: {stats['seat_errors']} bus(es) with inconsistent seat counts")
+        if stats['errors'] > before['errors']:
+            regressions.append(f"{key}: errors {before['errors']} -> {stats['errors']}")
+    return regressions
+
+def current_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--database', default=os.path.join('instance', 'benchmark.db'))
+    parser.add_argument('--reuse', action='store_true', help='use the existing database instead of seeding')
+    parser.add_argument('--students', type=int, default=500)
+    parser.add_argument('--months', type=int, default=2)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--hash-method', default='pbkdf2:sha256:1000',
+                        help='password hash for seeded accounts; login cost is not measured here')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=100, help='measured requests per route')
+    parser.add_argument('--routes', help='only run routes containing this text')
+    parser.add_argument('--contention', action='store_true',
+                        help='repeat the GET routes while bulk attendance writes run')
+    parser.add_argument('--roster', type=int, default=1000, help='students per bulk attendance post')
+    parser.add_argument('--subscribe', type=int, default=0, metavar='N',
+                        help='finish with N students subscribing to one bus route at once')
+    parser.add_argument('--no-sqlite-profile', action='store_true',
+                        help='serve with the rollback journal and no read/write routing')
+    parser.add_argument('--output', help='where to save results (default benchmarks/<commit>.json)')
+    parser.add_argument('--compare', help='baseline JSON file to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed relative slowdown')
+    args = parser.parse_args(argv)
+
+    if not (args.reuse and os.path.exists(args.database)):
+        print(f'Seeding {args.database} ({args.students} students, {args.months} months)...')
+        generate(args.database, args.students, args.months, args.seed, hash_method=args.hash_method)
+
+    routes = [route for route in ROUTES if not args.routes or args.routes in ' '.join(route)]
+    if args.no_sqlite_profile:
+        set_journal_mode(args.database, 'delete')
+    process, base_url = start_server(args.database, sqlite_profile=not args.no_sqlite_profile)
+    try:
+        results = run_routes(base_url, routes, args.requests, args.concurrency)
+        if args.contention:
+            results.update(run_contention(base_url, routes, args.requests, args.concurrency,
+                                          roster(args.database, args.roster)))
+        if args.subscribe:
+            results.update(run_subscriptions(base_url, args.database, args.subscribe, args.concurrency))
+    finally:
+        process.terminate()
+        process.join()
+
+    commit = current_commit()
+    report = {
+        'meta': {
+            'commit': commit,
+            'created_at': datetime.utcnow().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'students': args.students,
+            'months': args.months,
+            'seed': args.seed,
+            'hash_method': args.hash_method,
+            'concurrency': args.concurrency,
+            'requests': args.requests,
+            'contention': args.contention,
+            'subscribe': args.subscribe,
+            'sqlite_profile': not args.no_sqlite_profile,
+        },
+        'routes': results,
+    }
+    output = args.output or os.path.join('benchmarks', f'{commit}.json')
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'Saved {output}')
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline['routes'], args.tolerance)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        if regressions:
+            return 1
+        print(f"No regressions against {baseline['meta']['commit']}.")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
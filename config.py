@@ -9,3 +9,20 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or \
         'sqlite:///' + os.path.join(basedir, 'college_management.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    ITEMS_PER_PAGE = 25
+    # Hash cost per environment, e.g. pbkdf2:sha256:600000 or scrypt:32768:8:1
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD') or 'pbkdf2:sha256:600000'
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS') or os.cpu_count() or 1)
+    # File-backed SQLite: WAL, per-connection pragmas and read/write routing (app/database.py)
+    SQLITE_PROFILE = os.environ.get('SQLITE_PROFILE', '1') != '0'
+    SQLITE_READ_POOL_SIZE = int(os.environ.get('SQLITE_READ_POOL_SIZE') or 8)
+    # Library access counts are buffered per process and written in batches (app/access_buffer.py)
+    LIBRARY_ACCESS_FLUSH_SIZE = int(os.environ.get('LIBRARY_ACCESS_FLUSH_SIZE') or 500)
+    LIBRARY_ACCESS_FLUSH_INTERVAL = float(os.environ.get('LIBRARY_ACCESS_FLUSH_INTERVAL') or 5)
+    # Seconds between background refreshes of the popular-in-class lists the flushes touched (app/popularity.py)
+    LIBRARY_POPULARITY_REFRESH_INTERVAL = float(os.environ.get('LIBRARY_POPULARITY_REFRESH_INTERVAL') or 300)
+    # Library files (app/library_files.py); instance/library when unset
+    LIBRARY_FILES_DIR = os.environ.get('LIBRARY_FILES_DIR')
+    # x-accel-redirect (nginx) or x-sendfile to let the front proxy send the bytes
+    LIBRARY_FILE_OFFLOAD = os.environ.get('LIBRARY_FILE_OFFLOAD')
+    LIBRARY_FILE_OFFLOAD_PREFIX = os.environ.get('LIBRARY_FILE_OFFLOAD_PREFIX') or '/protected-library/'
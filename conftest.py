@@ -0,0 +1,103 @@
+from datetime import date, datetime, timedelta
+import json
+import pytest
+from flask import g
+from app import access_buffer, create_app, db
+from app.models import *
+from config import Config
+
+class TestConfig(Config):
+    TESTING = True
+    WTF_CSRF_ENABLED = False
+    SQL_GUARD_RAISE = True
+    SQL_REPEAT_THRESHOLD = 3
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    PASSWORD_HASH_METHOD = 'pbkdf2:sha256:1000'
+    PASSWORD_HASH_WORKERS = 0
+    LIBRARY_ACCESS_FLUSH_SIZE = 1
+    LIBRARY_POPULARITY_REFRESH_INTERVAL = None
+
+@pytest.fixture
+def app():
+    app = create_app(TestConfig)
+    with app.app_context():
+        yield app
+        access_buffer.shutdown()
+        db.session.remove()
+        db.drop_all()
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+def login(client, user):
+    """Log ``user`` in without going through the password check."""
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user.id)
+        session['_fresh'] = True
+    # Requests share the fixture's app context, so drop any cached user
+    g.pop('_login_user', None)
+
+@pytest.fixture
+def library_files(app, tmp_path):
+    """Serve library files from ``tmp_path``; returns ``attach(resource)``, which gives it a file."""
+    app.config['LIBRARY_FILES_DIR'] = str(tmp_path)
+
+    def attach(resource, content=b'%PDF-1.4\n'):
+        resource.file_path = f'resource-{resource.id}.pdf'
+        (tmp_path / resource.file_path).write_bytes(content)
+        db.session.commit()
+        return f'/student/library/access/{resource.id}'
+    return attach
+
+@pytest.fixture
+def sample(app):
+    """A small but complete data set touching every table the routes read."""
+    principal_user = User(username='principal', email='principal@college.edu', role='principal', password_hash='x')
+    staff_user = User(username='staff1', email='staff1@college.edu', role='staff', password_hash='x')
+    student_user = User(username='student1', email='student1@college.edu', role='student', password_hash='x')
+    db.session.add_all([principal_user, staff_user, student_user])
+    db.session.flush()
+
+    principal = Staff(user_id=principal_user.id, employee_id='EMP001', first_name='John', last_name='Smith',
+                      department='Administration', designation='Principal', hire_date=date(2020, 1, 1))
+    staff = Staff(user_id=staff_user.id, employee_id='EMP002', first_name='Jane', last_name='Doe',
+                  department='Computer Science', designation='Professor', hire_date=date(2021, 8, 15))
+    student = Student(user_id=student_user.id, student_id='STU001', first_name='Alice', last_name='Johnson',
+                      date_of_birth=date(2003, 5, 15), gender='Female', course='Computer Science',
+                      year=2, semester=3, admission_date=date(2023, 8, 1))
+    db.session.add_all([principal, staff, student])
+    db.session.flush()
+
+    fee = FeeStructure(course='Computer Science', year=2, semester=3, tuition_fee=5000.0,
+                       total_fee=5000.0, academic_year='2023-24')
+    exam = Examination(name='Mid-Term', subject='Database Systems', course='Computer Science', year=2,
+                       semester=3, exam_date=date.today(), start_time=datetime.strptime('10:00', '%H:%M').time(),
+                       duration_minutes=180, max_marks=100, created_by=staff.id)
+    route = BusRoute(route_name='City Route', route_number='R001', starting_point='City',
+                     ending_point='Campus', total_distance=10.0, estimated_time=30,
+                     stops=json.dumps(['City', 'Park Street', 'Campus']), monthly_fee=100.0, term_fee=300.0)
+    resource = LibraryResource(title='Database System Concepts', subject='Database Systems',
+                               course='Computer Science', year=2, semester=3, resource_type='book',
+                               description='Textbook', added_by=staff.id)
+    event = Event(title='Sports Day', description='Annual sports day', event_date=date.today() + timedelta(days=5),
+                  event_type='sports', target_audience='all', created_by=principal.id)
+    db.session.add_all([fee, exam, route, resource, event])
+    db.session.flush()
+
+    db.session.add_all([
+        FeePayment(student_id=student.id, fee_structure_id=fee.id, amount_paid=5000.0, payment_method='online'),
+        ExamResult(examination_id=exam.id, student_id=student.id, marks_obtained=85, grade='A'),
+        Bus(bus_number='CL-001', route_id=route.id, driver_name='Mike', driver_phone='1', capacity=40),
+        BusSubscription(student_id=student.id, route_id=route.id, start_date=date.today(),
+                        end_date=date.today() + timedelta(days=90), amount_paid=300.0, pickup_stop='Park Street'),
+        LibraryAccess(student_id=student.id, resource_id=resource.id),
+    ])
+    for days in range(1, 11):
+        db.session.add(Attendance(student_id=student.id, subject='Database Systems',
+                                  date=date.today() - timedelta(days=days),
+                                  status='present' if days % 4 else 'absent', marked_by=staff.id))
+    db.session.commit()
+
+    return {'principal': principal_user, 'staff': staff_user, 'student': student_user,
+            'exam': exam, 'route': route, 'resource': resource, 'event': event}
@@ -1,5 +1,7 @@
 from app import create_app, db
 from app.models import *
+from app.attendance import rebuild_monthly, rebuild_summaries
+from app.rankings import rebuild_rankings
 from datetime import datetime, date, timedelta
 import json
 
@@ -255,6 +257,9 @@ def create_sample_data():
                 db.session.add(attendance4)
         
         db.session.commit()
+        rebuild_summaries(db.session.connection())
+        rebuild_monthly(db.session.connection())
+        db.session.commit()
         
         # Create events
         print("Creating events...")
@@ -353,6 +358,8 @@ def create_sample_data():
         )
         db.session.add(result2)
         
+        db.session.commit()
+        rebuild_rankings(db.session.connection())
         db.session.commit()
         
         # Create fee payment
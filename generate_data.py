@@ -0,0 +1,419 @@
+"""Generate a synthetic college database at a configurable scale.
+
+The same seed, scale and ``--today`` always produce the same rows, so
+benchmark runs on different commits see identical data; only the password
+salts differ. Rows are written with bulk Core inserts in large batches and
+explicit primary keys. Attendance is generated student by student, which
+matches the order of its indexes. Password hashing runs in a process pool
+while the other tables are written. The principal, staff1 and student1
+accounts use the same passwords as create_sample_data.py; every other
+account's password is ``password123``.
+
+    python generate_data.py --students 20000 --staff 300 --months 24 --database instance/large.db
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import time as clock
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, time, timedelta
+from functools import partial
+from sqlalchemy import bindparam, insert, text, update
+from werkzeug.security import generate_password_hash
+from app import create_app, db
+from app.attendance import rebuild_monthly, rebuild_summaries
+from app.events import rebuild_audiences
+from app.fees import rebuild_ledger
+from app.popularity import backfill_daily, rebuild_popularity
+from app.rankings import rebuild_rankings
+from app.transport import rebalance_routes, rebuild_stops, stops_json
+from app.models import *
+from config import Config
+
+BATCH_SIZE = 20000
+
+COURSES = {
+    'Computer Science': ['Programming Fundamentals', 'Data Structures', 'Database Systems', 'Web Development',
+                         'Operating Systems', 'Computer Networks', 'Compiler Design', 'Machine Learning'],
+    'Electronics': ['Circuit Theory', 'Digital Logic', 'Signals and Systems', 'Analog Electronics',
+                    'Microprocessors', 'Communication Systems', 'VLSI Design', 'Embedded Systems'],
+    'Mechanical': ['Engineering Drawing', 'Thermodynamics', 'Fluid Mechanics', 'Strength of Materials',
+                   'Machine Design', 'Heat Transfer', 'Manufacturing Processes', 'Robotics'],
+    'Civil': ['Surveying', 'Building Materials', 'Structural Analysis', 'Geotechnics',
+              'Hydraulics', 'Transportation Engineering', 'Concrete Design', 'Environmental Engineering'],
+}
+SUBJECTS_PER_YEAR = 4
+RESOURCE_TYPES = ['book', 'notes', 'exam_paper', 'reference']
+FIRST_NAMES = ['Aarav', 'Alice', 'Bob', 'Chen', 'Diya', 'Elena', 'Farah', 'Gopal', 'Hana', 'Ivan',
+               'Jia', 'Kiran', 'Leo', 'Maya', 'Nikhil', 'Olivia', 'Priya', 'Rahul', 'Sara', 'Tariq']
+LAST_NAMES = ['Brown', 'Das', 'Garcia', 'Iyer', 'Johnson', 'Khan', 'Lee', 'Mehta', 'Nair', 'Patel',
+              'Reddy', 'Rossi', 'Singh', 'Smith', 'Tanaka', 'Verma', 'Williams', 'Wong', 'Yadav', 'Zhou']
+ATTENDANCE_WEIGHTS = {'present': 85, 'late': 5, 'absent': 10}
+PAYMENT_WEIGHTS = {'approved': 60, 'level1_approved': 15, 'pending': 20, 'rejected': 5}
+
+# Accounts the benchmark logs in with
+ACCOUNTS = {
+    'principal': ('principal', 'principal123'),
+    'staff': ('staff1', 'staff123'),
+    'student': ('student1', 'student123'),
+}
+DEFAULT_PASSWORD = 'password123'
+# Stored until the pooled hashes arrive; never a valid hash
+PENDING_HASH = '!'
+
+def subjects_for(course, year):
+    names = COURSES[course]
+    return [names[(2 * (year - 1) + offset) % len(names)] for offset in range(SUBJECTS_PER_YEAR)]
+
+def weekdays(start, end):
+    day = start
+    while day <= end:
+        if day.weekday() < 5:
+            yield day
+        day += timedelta(days=1)
+
+def grade_for(marks):
+    return 'A' if marks >= 85 else 'B' if marks >= 70 else 'C' if marks >= 55 else 'D' if marks >= 40 else 'F'
+
+def executemany(stmt, rows):
+    """Run ``stmt`` for ``rows`` (any iterable of dicts) in batches; returns the row count."""
+    conn = db.session.connection()
+    count = 0
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == BATCH_SIZE:
+            conn.execute(stmt, batch)
+            count += len(batch)
+            batch = []
+    if batch:
+        conn.execute(stmt, batch)
+        count += len(batch)
+    return count
+
+def bulk_insert(model, rows):
+    return executemany(insert(model.__table__), rows)
+
+class Generator:
+    def __init__(self, students=500, staff=None, months=2, seed=42, today=None,
+                 classes_per_day=3, accesses_per_student=5, hash_method='pbkdf2:sha256', workers=None):
+        self.students = students
+        self.staff = staff or max(2, students // 60)
+        self.months = months
+        self.rng = random.Random(seed)
+        self.today = today or date.today()
+        self.start = self.today - timedelta(days=months * 30)
+        self.classes_per_day = min(classes_per_day, SUBJECTS_PER_YEAR)
+        self.accesses_per_student = accesses_per_student
+        self.hash_method = hash_method
+        self.workers = workers or os.cpu_count()
+
+    def name(self):
+        return self.rng.choice(FIRST_NAMES), self.rng.choice(LAST_NAMES)
+
+    def pick(self, weights):
+        return self.rng.choices(list(weights), weights=list(weights.values()))[0]
+
+    def terms(self):
+        """Start dates of the half-year terms inside the generated window."""
+        starts = []
+        term = self.today - timedelta(days=120)
+        while term >= self.start or not starts:
+            starts.append(term)
+            term -= timedelta(days=182)
+        return sorted(starts)
+
+    def run(self, log=print):
+        if db.engine.dialect.name == 'sqlite':
+            # Throwaway database: trade durability for load speed
+            db.session.execute(text('PRAGMA synchronous = OFF'))
+            db.session.execute(text('PRAGMA journal_mode = MEMORY'))
+            db.session.execute(text('PRAGMA cache_size = -262144'))
+
+        usernames = self.usernames()
+        passwords = {username: password for username, password in ACCOUNTS.values()}
+        pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+        try:
+            # Hashes are computed while the tables below are written
+            hashes = pool.map(
+                partial(generate_password_hash, method=self.hash_method),
+                [passwords.get(username, DEFAULT_PASSWORD) for username in usernames],
+                chunksize=max(1, len(usernames) // (self.workers * 8)),
+            )
+            steps = [
+                ('users and profiles', self.people),
+                ('fee structures and payments', self.fees),
+                ('examinations and results', self.examinations),
+                ('attendance', self.attendance),
+                ('events', self.events),
+                ('transportation', self.transportation),
+                ('library', self.library),
+                ('password hashes', lambda: self.store_hashes(hashes)),
+            ]
+            for label, step in steps:
+                started = clock.perf_counter()
+                count = step()
+                db.session.commit()
+                elapsed = clock.perf_counter() - started
+                log(f'{label}: {count} rows in {elapsed:.1f}s ({count / max(elapsed, 1e-9):,.0f} rows/s)')
+        finally:
+            pool.shutdown(cancel_futures=True)
+        db.session.execute(text('ANALYZE'))
+        db.session.commit()
+
+    def usernames(self):
+        """Usernames in user id order: staff (principal first), then students."""
+        staff = [ACCOUNTS['principal'][0]] + [f'staff{index}' for index in range(1, self.staff)]
+        return staff + [f'student{index}' for index in range(1, self.students + 1)]
+
+    def people(self):
+        users = []
+        staff = []
+        for user_id, username in enumerate(self.usernames(), start=1):
+            role = 'principal' if user_id == 1 else 'staff' if user_id <= self.staff else 'student'
+            users.append({'id': user_id, 'username': username, 'email': f'{username}@college.edu',
+                          'password_hash': PENDING_HASH, 'role': role})
+        for index in range(1, self.staff + 1):
+            first, last = self.name()
+            course = list(COURSES)[index % len(COURSES)]
+            staff.append({'id': index, 'user_id': index, 'employee_id': f'EMP{index:05d}',
+                          'first_name': first, 'last_name': last,
+                          'department': 'Administration' if index == 1 else course,
+                          'designation': 'Principal' if index == 1 else 'Assistant Professor',
+                          'hire_date': date(2015, 1, 1) + timedelta(days=self.rng.randrange(3000))})
+
+        self.student_rows = []
+        for index in range(1, self.students + 1):
+            course = list(COURSES)[index % len(COURSES)]
+            year = (index // len(COURSES)) % 4 + 1
+            first, last = self.name()
+            self.student_rows.append({
+                'id': index, 'user_id': self.staff + index, 'student_id': f'STU{index:07d}',
+                'first_name': first, 'last_name': last,
+                'date_of_birth': date(2006 - year, 1, 1) + timedelta(days=self.rng.randrange(365)),
+                'gender': self.rng.choice(['Female', 'Male']),
+                'course': course, 'year': year, 'semester': year * 2 - 1,
+                'admission_date': date(self.today.year - year + 1, 8, 1),
+            })
+
+        return (bulk_insert(User, users) + bulk_insert(Staff, staff)
+                + bulk_insert(Student, self.student_rows))
+
+    def store_hashes(self, hashes):
+        users = User.__table__
+        stmt = update(users).where(users.c.id == bindparam('user_id')).values(password_hash=bindparam('hash'))
+        return executemany(stmt, ({'user_id': user_id, 'hash': password_hash}
+                                  for user_id, password_hash in enumerate(hashes, start=1)))
+
+    def fees(self):
+        structures = {}
+        for course in COURSES:
+            for year in range(1, 5):
+                tuition = 4000.0 + 500 * year
+                structures[course, year] = {
+                    'id': len(structures) + 1, 'course': course, 'year': year, 'semester': year * 2 - 1,
+                    'tuition_fee': tuition, 'lab_fee': 500.0, 'library_fee': 200.0, 'sports_fee': 300.0,
+                    'other_fees': 100.0, 'total_fee': tuition + 1100.0,
+                    'academic_year': f'{self.today.year}-{str(self.today.year + 1)[2:]}',
+                }
+        terms = self.terms()
+
+        def payments():
+            payment_id = 0
+            for student in self.student_rows:
+                structure = structures[student['course'], student['year']]
+                for term in terms:
+                    payment_id += 1
+                    paid_on = max(self.start, term + timedelta(days=self.rng.randrange(30)))
+                    status = self.pick(PAYMENT_WEIGHTS) if term == terms[-1] else 'approved'
+                    yield {
+                        'id': payment_id, 'student_id': student['id'], 'fee_structure_id': structure['id'],
+                        'amount_paid': structure['total_fee'], 'payment_method': self.rng.choice(['card', 'upi', 'bank_transfer']),
+                        'transaction_id': f'TXN{payment_id:09d}',
+                        'payment_date': datetime.combine(paid_on, time(self.rng.randrange(9, 17), self.rng.randrange(60))),
+                        'status': status,
+                        'level1_approver': 2 if status in ('level1_approved', 'approved') else None,
+                        'level2_approver': 1 if status == 'approved' else None,
+                    }
+
+        count = bulk_insert(FeeStructure, structures.values()) + bulk_insert(FeePayment, payments())
+        rebuild_ledger(db.session.connection())
+        return count
+
+    def examinations(self):
+        exams = []
+        sittings = [(term + timedelta(days=60), 'Mid-Term Examination') for term in self.terms()]
+        sittings += [(term + timedelta(days=150), 'End-Term Examination') for term in self.terms()]
+        for course in COURSES:
+            for year in range(1, 5):
+                for subject in subjects_for(course, year):
+                    for exam_date, name in sittings:
+                        exams.append({
+                            'id': len(exams) + 1, 'name': name, 'subject': subject, 'course': course,
+                            'year': year, 'semester': year * 2 - 1,
+                            'exam_date': exam_date + timedelta(days=self.rng.randrange(5)),
+                            'start_time': time(10), 'duration_minutes': 180, 'max_marks': 100,
+                            'created_by': 1 + len(exams) % self.staff,
+                        })
+        past = {}
+        for exam in exams:
+            if exam['exam_date'] < self.today:
+                past.setdefault((exam['course'], exam['year']), []).append(exam['id'])
+
+        def results():
+            for student in self.student_rows:
+                for exam_id in past.get((student['course'], student['year']), []):
+                    marks = max(0, min(100, int(self.rng.gauss(68, 14))))
+                    yield {'examination_id': exam_id, 'student_id': student['id'],
+                           'marks_obtained': marks, 'grade': grade_for(marks)}
+
+        count = bulk_insert(Examination, exams) + bulk_insert(ExamResult, results())
+        rebuild_rankings(db.session.connection())
+        return count
+
+    def attendance(self):
+        days = list(weekdays(self.start, self.today - timedelta(days=1)))
+        marked_at = datetime.combine(self.today, time(17))
+        statuses = list(ATTENDANCE_WEIGHTS)
+        weights = list(ATTENDANCE_WEIGHTS.values())
+        marks_per_student = len(days) * self.classes_per_day
+
+        def rows():
+            # Student by student, matching the (student_id, ...) index order
+            for student in self.student_rows:
+                subjects = subjects_for(student['course'], student['year'])
+                marker = 1 + student['id'] % self.staff
+                drawn = iter(self.rng.choices(statuses, weights, k=marks_per_student))
+                for offset, day in enumerate(days):
+                    for period in range(self.classes_per_day):
+                        yield {'student_id': student['id'],
+                               'subject': subjects[(offset + period) % SUBJECTS_PER_YEAR],
+                               'date': day, 'status': next(drawn),
+                               'marked_by': marker, 'marked_at': marked_at}
+
+        count = bulk_insert(Attendance, rows())
+        rebuild_summaries(db.session.connection())
+        rebuild_monthly(db.session.connection())
+        return count
+
+    def events(self):
+        kinds = ['academic', 'cultural', 'sports', 'other']
+        count = max(40, self.months * 10)
+        span = (self.today - self.start).days
+        # Half the events are for everyone, the rest for one course or one year
+        audiences = ['all'] * (len(COURSES) + 4) + list(COURSES) + [f'year_{year}' for year in range(1, 5)]
+        count = bulk_insert(Event, [{
+            'id': index, 'title': f'{kind.title()} Event {index}', 'description': f'Synthetic {kind} event.',
+            'event_date': self.start + timedelta(days=self.rng.randrange(span + 90)),
+            'start_time': time(10), 'end_time': time(16), 'venue': 'Main Auditorium',
+            'event_type': kind, 'target_audience': self.rng.choice(audiences), 'created_by': 1 + index % self.staff,
+            'is_active': self.rng.random() > 0.1,
+        } for index, kind in ((index, self.rng.choice(kinds)) for index in range(1, count + 1))])
+        rebuild_audiences(db.session.connection())
+        return count
+
+    def transportation(self):
+        route_count = max(2, self.students // 400)
+        routes = []
+        buses = []
+        for index in range(1, route_count + 1):
+            stops = [f'Stop {index}-{stop}' for stop in range(1, 7)] + ['College Campus']
+            minutes = 30 + index
+            routes.append({'id': index, 'route_name': f'Route {index}', 'route_number': f'R{index:03d}',
+                           'starting_point': stops[0], 'ending_point': stops[-1],
+                           'total_distance': 10.0 + index, 'estimated_time': minutes,
+                           'stops': stops_json([(stop, minutes * position // (len(stops) - 1))
+                                                for position, stop in enumerate(stops)]),
+                           'monthly_fee': 150.0, 'term_fee': 450.0, 'is_active': True})
+            for bus in range(2):
+                buses.append({'id': len(buses) + 1, 'bus_number': f'CL-{len(buses) + 1:03d}', 'route_id': index,
+                              'driver_name': ' '.join(self.name()), 'driver_phone': '+10000000000',
+                              'capacity': 50, 'current_occupancy': 0, 'status': 'available'})
+        subscriptions = [{
+            'student_id': student['id'], 'route_id': route_id,
+            'start_date': self.today - timedelta(days=60), 'end_date': self.today + timedelta(days=120),
+            'amount_paid': 450.0, 'is_active': True,
+            'pickup_stop': f'Stop {route_id}-{self.rng.randint(1, 6)}',
+        } for student in self.student_rows if self.rng.random() < 0.3
+          for route_id in [self.rng.randint(1, route_count)]]
+        count = bulk_insert(BusRoute, routes) + bulk_insert(Bus, buses) + bulk_insert(BusSubscription, subscriptions)
+        rebuild_stops(db.session.connection())
+        # Seats go to the earliest subscriptions; the rest are waitlisted
+        rebalance_routes(db.session.connection())
+        return count
+
+    def library(self):
+        resources = []
+        by_class = {}
+        for course in COURSES:
+            for year in range(1, 5):
+                for subject in subjects_for(course, year):
+                    for kind in RESOURCE_TYPES:
+                        resources.append({
+                            'id': len(resources) + 1, 'title': f'{subject} {kind.replace("_", " ").title()}',
+                            'subject': subject, 'course': course, 'year': year, 'semester': year * 2 - 1,
+                            'resource_type': kind, 'author': ' '.join(self.name()),
+                            'description': f'{kind.replace("_", " ").title()} for {subject}.',
+                            'added_by': 1 + len(resources) % self.staff, 'is_available': True,
+                        })
+                        by_class.setdefault((course, year), []).append(len(resources))
+        span = (self.today - self.start).days * 24 * 60
+
+        def accesses():
+            for student in self.student_rows:
+                candidates = by_class[student['course'], student['year']]
+                # One counter row per student and resource
+                for resource_id in self.rng.sample(candidates, min(self.accesses_per_student, len(candidates))):
+                    yield {'student_id': student['id'], 'resource_id': resource_id,
+                           'access_date': datetime.combine(self.start, time()) + timedelta(minutes=self.rng.randrange(span)),
+                           'download_count': 1}
+
+        count = bulk_insert(LibraryResource, resources) + bulk_insert(LibraryAccess, accesses())
+        backfill_daily(db.session.connection())
+        rebuild_popularity(db.session.connection(), today=self.today)
+        return count
+
+def database_config(path):
+    class GeneratedConfig(Config):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.abspath(path)
+    return GeneratedConfig
+
+def generate(path, students=500, months=2, seed=42, log=print, **options):
+    """Create a fresh database at ``path`` filled at the given scale.
+
+    ``options`` are passed on to ``Generator``.
+    """
+    if os.path.exists(path):
+        os.remove(path)
+    class LoadConfig(database_config(path)):
+        # run() sets its own bulk-load pragmas
+        SQLITE_PROFILE = False
+
+    app = create_app(LoadConfig)
+    with app.app_context():
+        Generator(students, months=months, seed=seed, **options).run(log)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--database', default=os.path.join('instance', 'benchmark.db'))
+    parser.add_argument('--students', type=int, default=500)
+    parser.add_argument('--staff', type=int, help='staff accounts (default: one per 60 students)')
+    parser.add_argument('--months', type=int, default=2, help='months of attendance history')
+    parser.add_argument('--classes-per-day', type=int, default=3, help='attendance marks per student per weekday')
+    parser.add_argument('--accesses-per-student', type=int, default=5, help='library access log rows per student')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--today', type=date.fromisoformat, help='reference date (default: today)')
+    parser.add_argument('--hash-method', default='pbkdf2:sha256',
+                        help='werkzeug hash method, e.g. pbkdf2:sha256:1000 for cheap load-test accounts')
+    parser.add_argument('--workers', type=int, help='password hashing processes (default: CPU count)')
+    args = parser.parse_args()
+
+    started = clock.perf_counter()
+    generate(args.database, args.students, args.months, args.seed, staff=args.staff,
+             classes_per_day=args.classes_per_day, accesses_per_student=args.accesses_per_student,
+             today=args.today, hash_method=args.hash_method, workers=args.workers)
+    print(f'Generated {args.database} in {clock.perf_counter() - started:.1f}s')
+
+if __name__ == '__main__':
+    main()
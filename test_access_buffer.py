@@ -0,0 +1,87 @@
+from flask import current_app
+from sqlalchemy import text
+from app import access_buffer, db
+from app.models import LibraryAccess, Student
+from conftest import login
+
+def stored_count(resource):
+    db.session.expire_all()
+    return db.session.query(LibraryAccess.download_count).filter_by(resource_id=resource.id).scalar()
+
+def test_every_click_is_written_through_by_default(client, sample, library_files):
+    resource = sample['resource']
+    url = library_files(resource)
+    login(client, sample['student'])
+    assert client.get(url).status_code == 200
+    client.get(url)
+    assert stored_count(resource) == 3
+    assert LibraryAccess.query.count() == 1
+
+def test_clicks_are_buffered_until_the_batch_is_full(client, sample, library_files):
+    store = current_app.extensions['access_buffer']
+    store.size, store.interval = 3, 3600
+    resource = sample['resource']
+    url = library_files(resource)
+    login(client, sample['student'])
+    client.get(url)
+    client.get(url)
+    assert stored_count(resource) == 1
+    assert access_buffer.stats()['pending_clicks'] == 2
+
+    # Reads add the unflushed clicks to the stored counts
+    assert b'Opened 3 times' in client.get('/student/library').data
+    student = Student.query.filter_by(student_id='STU001').one()
+    assert access_buffer.counts(student.id, [resource.id]) == {resource.id: 3}
+    login(client, sample['staff'])
+    assert b'<td>3</td>' in client.get('/staff/library').data
+
+    login(client, sample['student'])
+    client.get(url)
+    assert stored_count(resource) == 4
+    stats = access_buffer.stats()
+    assert (stats['pending_clicks'], stats['flushes'], stats['flushed_rows'], stats['flushed_clicks']) == (0, 1, 1, 3)
+
+def test_idle_clicks_are_flushed_on_the_interval(client, sample, library_files):
+    store = current_app.extensions['access_buffer']
+    store.size, store.interval = 100, 0.05
+    login(client, sample['student'])
+    client.get(library_files(sample['resource']))
+    assert store.flusher is not None
+    store.flusher.join(timeout=0.5)  # runs until shutdown; just give it time to flush
+    assert store.pending == {}
+    assert stored_count(sample['resource']) == 2
+
+def test_shutdown_stops_the_thread_and_flushes(client, sample, library_files):
+    store = current_app.extensions['access_buffer']
+    store.size = 100
+    login(client, sample['student'])
+    client.get(library_files(sample['resource']))
+    flusher = store.flusher
+    access_buffer.shutdown()
+    assert not flusher.is_alive() and store.flusher is None
+    assert stored_count(sample['resource']) == 2
+    # The next click starts a fresh thread
+    client.get(library_files(sample['resource']))
+    assert store.flusher.is_alive()
+
+def library_access_indexes():
+    return {row[0] for row in db.session.execute(text(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'library_access'"))}
+
+def test_migrations_swap_in_the_unique_counter_index(app, sample):
+    from app.migrations import upgrade
+    # A fresh database runs 0001 as released, then 0013 replaces its index
+    assert 'uq_library_access_student_resource' in library_access_indexes()
+    assert 'ix_library_access_student_resource' not in library_access_indexes()
+
+    # A database from before 0013, with a repeated click row
+    db.session.execute(text('DROP INDEX uq_library_access_student_resource'))
+    db.session.execute(text('CREATE INDEX ix_library_access_student_resource ON library_access (student_id, resource_id)'))
+    db.session.execute(text("DELETE FROM schema_migrations WHERE version = '0013_library_access_unique_counter'"))
+    db.session.add(LibraryAccess(student_id=sample['student'].student.id, resource_id=sample['resource'].id,
+                                 download_count=2))
+    db.session.commit()
+    upgrade(db.engine)
+    assert 'ix_library_access_student_resource' not in library_access_indexes()
+    assert stored_count(sample['resource']) == 3
+    assert LibraryAccess.query.count() == 1
@@ -0,0 +1,181 @@
+from datetime import date, timedelta
+import time
+from app import db
+from app.attendance import add_months, attendance_chart, rebuild_monthly
+from app.models import Attendance, AttendanceMonthly, AttendanceSummary, Student, User
+from conftest import login
+
+def add_section(size):
+    """Insert ``size`` students in bulk and return their ids."""
+    db.session.execute(db.insert(User), [
+        {'username': f'sec{i}', 'email': f'sec{i}@college.edu', 'role': 'student', 'password_hash': 'x'}
+        for i in range(size)
+    ])
+    user_ids = [user_id for (user_id,) in db.session.query(User.id).filter(User.username.like('sec%'))]
+    db.session.execute(db.insert(Student), [
+        {'user_id': user_id, 'student_id': f'SEC{user_id}', 'first_name': 'S', 'last_name': str(user_id),
+         'date_of_birth': date(2004, 1, 1), 'gender': 'Other', 'course': 'Computer Science',
+         'year': 1, 'semester': 1, 'admission_date': date(2024, 8, 1)}
+        for user_id in user_ids
+    ])
+    db.session.commit()
+    return [student_id for (student_id,) in db.session.query(Student.id).filter(Student.student_id.like('SEC%'))]
+
+def test_bulk_marks_section_in_one_request(client, sample):
+    student_ids = add_section(500)
+    login(client, sample['staff'])
+    payload = {
+        'subject': 'Operating Systems',
+        'date': '2024-09-02',
+        'records': [{'student_id': student_id, 'status': 'present'} for student_id in student_ids],
+    }
+
+    started = time.perf_counter()
+    response = client.post('/staff/mark-attendance/bulk', json=payload)
+    elapsed = time.perf_counter() - started
+
+    assert response.status_code == 200
+    assert response.json['saved'] == 500
+    assert {result['result'] for result in response.json['results']} == {'created'}
+    assert elapsed < 1.0
+
+    # Re-marking the same roster updates in place instead of duplicating
+    payload['records'][0]['status'] = 'absent'
+    response = client.post('/staff/mark-attendance/bulk', json=payload)
+    assert {result['result'] for result in response.json['results']} == {'updated'}
+    assert Attendance.query.filter_by(subject='Operating Systems').count() == 500
+    assert Attendance.query.filter_by(subject='Operating Systems', status='absent').count() == 1
+
+def test_bulk_reports_per_row_errors(client, sample):
+    student_id = sample['student'].student.id
+    login(client, sample['staff'])
+    response = client.post('/staff/mark-attendance/bulk', json={
+        'subject': 'Database Systems',
+        'date': '2024-09-02',
+        'records': [
+            {'student_id': student_id, 'status': 'late'},
+            {'student_id': student_id, 'status': 'present'},
+            {'student_id': 99999, 'status': 'present'},
+            {'student_id': student_id, 'status': 'asleep'},
+        ],
+    })
+    results = response.json['results']
+    assert response.json['saved'] == 1
+    assert [result['result'] for result in results] == ['created', 'error', 'error', 'error']
+    assert Attendance.query.filter_by(student_id=student_id, date=date(2024, 9, 2)).one().status == 'late'
+
+def test_bulk_reports_malformed_rows_as_errors(client, sample):
+    student_id = sample['student'].student.id
+    login(client, sample['staff'])
+    response = client.post('/staff/mark-attendance/bulk', json={
+        'subject': 'Database Systems',
+        'date': '2024-09-02',
+        'records': [
+            'not a record',
+            {'student_id': [student_id], 'status': 'present'},
+            {'student_id': {'id': student_id}, 'status': 'present'},
+            {'status': 'present'},
+            {'student_id': student_id, 'status': 'present'},
+        ],
+    })
+    assert response.status_code == 200
+    assert [result['result'] for result in response.json['results']] == ['error'] * 4 + ['created']
+    assert response.json['saved'] == 1
+
+def test_bulk_refuses_malformed_bodies(client, sample):
+    login(client, sample['staff'])
+    for body in [[{'student_id': 1, 'status': 'present'}],
+                 {'subject': 'Networks', 'date': 5, 'records': []},
+                 {'subject': 'Networks', 'date': '02/09/2024', 'records': []}]:
+        assert client.post('/staff/mark-attendance/bulk', json=body).status_code == 400
+
+def test_single_mark_accepts_a_numeric_string_id(client, sample):
+    student_id = sample['student'].student.id
+    login(client, sample['staff'])
+    response = client.post('/staff/mark-attendance', json={
+        'student_id': str(student_id), 'subject': 'Networks', 'date': '2024-09-04', 'status': 'present',
+    })
+    assert response.json == {'success': True}
+    assert Attendance.query.filter_by(student_id=student_id, subject='Networks').one().status == 'present'
+
+def test_marking_maintains_summary(client, sample):
+    student_id = sample['student'].student.id
+    login(client, sample['staff'])
+    for day, status in [('2024-09-02', 'present'), ('2024-09-03', 'late'), ('2024-09-04', 'absent')]:
+        client.post('/staff/mark-attendance/bulk', json={
+            'subject': 'Networks', 'date': day,
+            'records': [{'student_id': student_id, 'status': status}],
+        })
+    # Overwriting a mark moves it between counters instead of adding one
+    client.post('/staff/mark-attendance', json={
+        'student_id': student_id, 'subject': 'Networks', 'date': '2024-09-04', 'status': 'present',
+    })
+
+    summary = AttendanceSummary.query.get((student_id, 'Networks'))
+    assert (summary.total, summary.present, summary.late, summary.absent) == (3, 2, 1, 0)
+
+def test_rebuild_command_backfills_summaries(app, sample):
+    student_id = sample['student'].student.id
+    result = app.test_cli_runner().invoke(args=['rebuild', 'attendance-summary'])
+    assert result.exit_code == 0
+
+    summary = AttendanceSummary.query.get((student_id, 'Database Systems'))
+    assert summary.total == Attendance.query.filter_by(student_id=student_id).count()
+    assert summary.present == Attendance.query.filter_by(student_id=student_id, status='present').count()
+    rollups = AttendanceMonthly.query.filter_by(student_id=student_id).all()
+    assert sum(rollup.total for rollup in rollups) == summary.total
+    assert all(rollup.month.day == 1 for rollup in rollups)
+
+def test_marking_maintains_monthly_rollup(client, sample):
+    student_id = sample['student'].student.id
+    login(client, sample['staff'])
+    for day, status in [('2024-09-27', 'present'), ('2024-09-30', 'absent'), ('2024-10-01', 'late')]:
+        client.post('/staff/mark-attendance/bulk', json={
+            'subject': 'Networks', 'date': day,
+            'records': [{'student_id': student_id, 'status': status}],
+        })
+    client.post('/staff/mark-attendance', json={
+        'student_id': student_id, 'subject': 'Networks', 'date': '2024-09-30', 'status': 'present',
+    })
+
+    september = AttendanceMonthly.query.get((student_id, 'Networks', date(2024, 9, 1)))
+    october = AttendanceMonthly.query.get((student_id, 'Networks', date(2024, 10, 1)))
+    assert (september.total, september.present, september.absent) == (2, 2, 0)
+    assert (october.total, october.late) == (1, 1)
+
+def test_add_months():
+    assert add_months(date(2024, 11, 15), 2) == date(2025, 1, 1)
+    assert add_months(date(2024, 1, 31), -1) == date(2023, 12, 1)
+
+def test_chart_window_and_subject_breakdown(app, sample):
+    student_id = sample['student'].student.id
+    today = date.today()
+    db.session.add(Attendance(student_id=student_id, subject='Networks', date=add_months(today, -8),
+                              status='present', marked_by=sample['exam'].created_by))
+    db.session.flush()
+    rebuild_monthly(db.session.connection())
+
+    data, last_modified = attendance_chart(student_id, 6, by_subject=True)
+    months = {(today - timedelta(days=days)).strftime('%Y-%m') for days in range(1, 11)}
+    assert set(data['months']) == months
+    assert set(data['subjects']) == {'Database Systems'}
+    assert data['subjects']['Database Systems'] == data['percentages']
+    assert last_modified is not None
+    assert len(attendance_chart(student_id, 12)[0]['months']) == len(months) + 1
+
+def test_chart_api_is_conditional(client, sample):
+    rebuild_monthly(db.session.connection())
+    db.session.commit()
+    login(client, sample['student'])
+    response = client.get('/student/api/attendance-chart?months=3&by=subject')
+    assert response.status_code == 200
+    assert response.json['percentages']
+    assert response.headers['ETag'] and response.headers['Last-Modified']
+    assert 'no-cache' in response.headers['Cache-Control']
+
+    repeat = client.get('/student/api/attendance-chart?months=3&by=subject',
+                        headers={'If-None-Match': response.headers['ETag']})
+    assert repeat.status_code == 304 and repeat.data == b''
+    other = client.get('/student/api/attendance-chart?months=3',
+                       headers={'If-None-Match': response.headers['ETag']})
+    assert other.status_code == 200
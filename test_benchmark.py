@@ -0,0 +1,42 @@
+from benchmark import ROUTES, compare, roster, run_contention, run_routes, start_server, summarize
+from generate_data import generate
+
+def stats(**values):
+    base = {'requests': 10, 'errors': 0, 'throughput': 100.0, 'p50': 5.0, 'p95': 10.0, 'p99': 12.0,
+            'mean_queries': 3.0, 'mean_db_ms': 1.0}
+    base.update(values)
+    return base
+
+def test_summarize_percentiles():
+    samples = [{'ms': float(ms), 'status': 200, 'queries': 2, 'db_ms': 0.5} for ms in range(1, 101)]
+    samples[0]['status'] = 500
+    result = summarize(samples, 2.0)
+    assert (result['p50'], result['p95'], result['p99']) == (50.0, 95.0, 99.0)
+    assert result['throughput'] == 50.0 and result['errors'] == 1 and result['mean_queries'] == 2
+
+def test_compare_flags_regressions():
+    baseline = {'route': stats()}
+    assert compare({'route': stats(p95=12.0)}, baseline, 0.25) == []
+    assert len(compare({'route': stats(p95=20.0, mean_queries=4.0)}, baseline, 0.25)) == 2
+    assert compare({'other': stats(p95=99.0)}, baseline, 0.25) == []
+
+def test_benchmark_drives_routes(tmp_path):
+    database = str(tmp_path / 'bench.db')
+    generate(database, students=8, months=1, log=lambda message: None,
+             hash_method='pbkdf2:sha256:1000', workers=1)
+    process, base_url = start_server(database)
+    try:
+        routes = [route for route in ROUTES if route[1] in ('/student/attendance', '/staff/fee-payments')]
+        results = run_routes(base_url, routes, requests=4, concurrency=2, warmup=0, log=lambda line: None)
+        contended = run_contention(base_url, routes[:1], requests=4, concurrency=2,
+                                   student_ids=roster(database, 5), log=lambda line: None)
+    finally:
+        process.terminate()
+        process.join()
+    assert set(results) == {'student /student/attendance', 'staff /staff/fee-payments'}
+    for result in results.values():
+        assert result['errors'] == 0 and result['requests'] == 4
+        assert result['mean_queries'] > 0
+    assert contended['student /student/attendance [writing]']['errors'] == 0
+    writes = contended['staff POST /staff/mark-attendance/bulk (5 rows)']
+    assert writes['requests'] > 0 and writes['errors'] == 0
@@ -0,0 +1,40 @@
+from datetime import date
+from app import counters, db
+from app.instrumentation import track_queries
+from app.models import Event, FeePayment
+from app.staff.routes import count_pending_fee_approvals
+from conftest import login
+
+def test_dashboard_counters_are_cached(client, sample):
+    login(client, sample['principal'])
+    client.get('/staff/dashboard')
+    with track_queries() as tracker:
+        client.get('/staff/dashboard')
+    assert not any('count(' in statement for statement in tracker.statements)
+    assert counters.stats()['hits'] == 4
+
+def test_approval_invalidates_pending_count(client, sample):
+    login(client, sample['principal'])
+    client.get('/staff/dashboard')
+    assert count_pending_fee_approvals() == 1
+
+    payment = FeePayment.query.filter_by(status='pending').first()
+    client.get(f'/staff/approve-payment/{payment.id}/1')
+    assert count_pending_fee_approvals() == 0
+    assert counters.stats()['invalidations'] == 1
+
+def test_rollback_keeps_cached_values(client, sample):
+    login(client, sample['principal'])
+    client.get('/staff/dashboard')
+    staff_id = sample['principal'].staff.id
+    db.session.add(Event(title='Cancelled', description='-', event_date=date.today(),
+                         event_type='other', created_by=staff_id))
+    db.session.flush()
+    db.session.rollback()
+    assert counters.stats()['invalidations'] == 0
+
+def test_cache_stats_are_principal_only(client, sample):
+    login(client, sample['staff'])
+    assert client.get('/staff/api/cache-stats').status_code == 403
+    login(client, sample['principal'])
+    assert set(client.get('/staff/api/cache-stats').json) >= {'hits', 'misses', 'hit_rate'}
@@ -0,0 +1,51 @@
+import pytest
+from sqlalchemy import event, text
+from app import create_app, db
+from app.models import FeePayment
+from conftest import TestConfig, login
+
+@pytest.fixture
+def app(tmp_path):
+    class FileConfig(TestConfig):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + str(tmp_path / 'college.db')
+
+    app = create_app(FileConfig)
+    with app.app_context():
+        yield app
+        db.session.remove()
+        app.extensions['sqlite_reader'].dispose()
+
+def test_profile_pragmas(app):
+    with db.engine.connect() as conn:
+        assert conn.execute(text('PRAGMA journal_mode')).scalar() == 'wal'
+        assert conn.execute(text('PRAGMA synchronous')).scalar() == 1
+        assert conn.execute(text('PRAGMA busy_timeout')).scalar() == 5000
+        assert conn.execute(text('PRAGMA query_only')).scalar() == 0
+    with app.extensions['sqlite_reader'].connect() as conn:
+        assert conn.execute(text('PRAGMA query_only')).scalar() == 1
+
+def test_get_reads_from_reader(app, client, sample):
+    checkouts = []
+    event.listen(app.extensions['sqlite_reader'], 'checkout', lambda *args: checkouts.append(1))
+    login(client, sample['student'])
+    db.session.commit()
+    assert client.get('/student/attendance').status_code == 200
+    assert checkouts
+
+def test_get_that_writes_switches_to_writer(app, client, sample):
+    login(client, sample['principal'])
+    payment = FeePayment.query.filter_by(status='pending').first()
+    db.session.commit()
+    with app.test_request_context(method='GET'):
+        assert db.session.get_bind() is app.extensions['sqlite_reader']
+    response = client.get(f'/staff/approve-payment/{payment.id}/1')
+    assert response.status_code == 302
+    db.session.expire_all()
+    assert db.session.get(FeePayment, payment.id).status == 'level1_approved'
+
+def test_post_uses_writer(app):
+    with app.test_request_context(method='POST'):
+        assert db.session.get_bind() is db.engine
+
+def test_memory_database_is_left_alone():
+    assert 'sqlite_reader' not in create_app(TestConfig).extensions
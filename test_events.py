@@ -0,0 +1,55 @@
+from datetime import date, timedelta
+from app import db
+from app.events import event_feed, parse_audience
+from app.models import Event, EventAudience
+from conftest import login
+
+def add_event(sample, title, audience, days=3, active=True):
+    event = Event(title=title, description='-', event_date=date.today() + timedelta(days=days),
+                  event_type='academic', target_audience=audience, is_active=active,
+                  created_by=sample['principal'].staff.id)
+    db.session.add(event)
+    db.session.flush()
+    return event
+
+def test_parse_audience():
+    assert parse_audience('all') == [('all', '')]
+    assert parse_audience(None) == [('all', '')]
+    assert parse_audience(' Computer  Science ; year_2, Year 3') == [
+        ('course', 'computer science'), ('year', '2'), ('year', '3')]
+
+def test_feed_matches_structured_audiences(client, sample):
+    student = sample['student'].student
+    for title, audience in [('Everyone', 'all'), ('CS', 'computer science'), ('Second years', 'year_2'),
+                            ('Civil', 'Civil'), ('Third years', 'year_3'), ('Science fair', 'Science'),
+                            ('Year twelve', 'year_12')]:
+        add_event(sample, title, audience)
+    add_event(sample, 'Cancelled', 'all', active=False)
+    add_event(sample, 'Last week', 'Computer Science', days=-7)
+    db.session.commit()
+
+    upcoming = {event.title for event in event_feed(student)}
+    # The old substring match also picked up "Science" and "year_12"
+    assert upcoming == {'Everyone', 'CS', 'Second years', 'Sports Day'}
+    assert [event.title for event in event_feed(student, past=True)] == ['Last week']
+
+    login(client, sample['student'])
+    response = client.get('/student/events?when=past')
+    assert b'Last week' in response.data and b'Second years' not in response.data
+
+def test_audience_rows_follow_edits(sample):
+    event = add_event(sample, 'Workshop', 'Computer Science')
+    db.session.commit()
+    assert [(row.kind, row.value) for row in EventAudience.query.filter_by(event_id=event.id)] == [
+        ('course', 'computer science')]
+    event.target_audience = 'Computer Science, year_1'
+    db.session.commit()
+    assert sorted((row.kind, row.value) for row in EventAudience.query.filter_by(event_id=event.id)) == [
+        ('course', 'computer science'), ('year', '1')]
+
+def test_rebuild_audiences(app, sample):
+    db.session.execute(db.delete(EventAudience))
+    db.session.commit()
+    result = app.test_cli_runner().invoke(args=['rebuild', 'event-audience'])
+    assert 'Event audiences rebuilt.' in result.output
+    assert [(row.event_id, row.kind) for row in EventAudience.query] == [(sample['event'].id, 'all')]
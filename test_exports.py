@@ -0,0 +1,42 @@
+import csv
+import gzip
+import io
+import json
+from app.exports import csv_chunks, gzip_chunks
+from conftest import login
+
+def test_attendance_csv_export(client, sample):
+    login(client, sample['staff'])
+    response = client.get('/staff/export/attendance.csv?subject=Database+Systems&status=present')
+    assert response.is_streamed
+    assert response.headers['Content-Disposition'] == 'attachment; filename=attendance.csv'
+    rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    assert rows and {row['status'] for row in rows} == {'present'}
+    assert rows[0]['roll_number'] == sample['student'].student.student_id
+
+def test_fee_payments_ndjson_export_gzipped(client, sample):
+    login(client, sample['staff'])
+    response = client.get('/staff/export/fee-payments.ndjson?status=pending',
+                          headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    lines = gzip.decompress(response.data).decode().splitlines()
+    payment = json.loads(lines[0])
+    assert len(lines) == 1
+    assert payment['status'] == 'pending' and payment['course'] == 'Computer Science'
+
+def test_results_export_filters(client, sample):
+    login(client, sample['staff'])
+    assert len(client.get('/staff/export/results.ndjson').data.splitlines()) == 1
+    assert client.get('/staff/export/results.ndjson?course=Mechanical').data == b''
+    assert client.get('/staff/export/results.xml').status_code == 404
+
+def test_exports_are_staff_only(client, sample):
+    login(client, sample['student'])
+    assert client.get('/staff/export/attendance.csv').status_code == 302
+
+def test_encoders_stream_batch_by_batch():
+    batches = ([(i, 'x')] * 2 for i in range(3))
+    chunks = list(csv_chunks(['id', 'value'], batches))
+    assert chunks[0] == 'id,value\r\n0,x\r\n0,x\r\n'
+    assert len(chunks) == 4
+    assert gzip.decompress(b''.join(gzip_chunks(iter(chunks)))).decode() == ''.join(chunks)
@@ -0,0 +1,177 @@
+import time
+from datetime import date
+from app import db
+from app.fees import approve_payments
+from app.models import FeeLedger, FeePayment, FeeStructure, Student
+from app.staff.routes import count_pending_fee_approvals
+from conftest import login
+
+def add_payments(count, course='Computer Science'):
+    student = Student.query.filter_by(student_id='STU001').one()
+    fee = FeeStructure(course=course, year=1, semester=1, tuition_fee=100.0, total_fee=100.0,
+                       academic_year='2023-24')
+    db.session.add(fee)
+    db.session.flush()
+    db.session.execute(db.insert(FeePayment.__table__), [
+        {'student_id': student.id, 'fee_structure_id': fee.id, 'amount_paid': 100.0,
+         'payment_method': 'online', 'status': 'pending'}
+        for _ in range(count)
+    ])
+    db.session.commit()
+    return fee
+
+def test_batch_approval_reports_each_payment(client, sample):
+    login(client, sample['staff'])
+    pending = FeePayment.query.filter_by(status='pending').one()
+    done = FeePayment(student_id=pending.student_id, fee_structure_id=pending.fee_structure_id,
+                      amount_paid=10.0, payment_method='cash', status='approved')
+    db.session.add(done)
+    db.session.commit()
+    staff_id = sample['staff'].staff.id
+    assert count_pending_fee_approvals() == 1
+
+    response = client.post('/staff/fee-payments/approve',
+                           json={'level': 1, 'payment_ids': [pending.id, done.id, 999999]})
+    assert response.status_code == 200
+    assert response.json['counts'] == {'approved': 1, 'conflict': 1, 'not_found': 1}
+    assert response.json['payments'] == [
+        {'id': pending.id, 'outcome': 'approved', 'status': 'level1_approved'},
+        {'id': done.id, 'outcome': 'conflict', 'status': 'approved'},
+        {'id': 999999, 'outcome': 'not_found', 'status': None},
+    ]
+    db.session.expire_all()
+    assert (pending.status, pending.level1_approver) == ('level1_approved', staff_id)
+    assert pending.level1_approval_date is not None
+    assert count_pending_fee_approvals() == 0
+
+def test_levels_cannot_be_skipped_or_repeated(client, sample):
+    payment = FeePayment.query.filter_by(status='pending').one()
+    principal_id = sample['principal'].staff.id
+    login(client, sample['principal'])
+
+    response = client.post('/staff/fee-payments/approve', json={'level': 2, 'payment_ids': [payment.id]})
+    assert response.json['payments'][0] == {'id': payment.id, 'outcome': 'conflict', 'status': 'pending'}
+
+    # Two approvers racing for the same payment: only the first one wins
+    first, = approve_payments(1, principal_id, [payment.id])
+    second, = approve_payments(1, sample['staff'].staff.id, [payment.id])
+    db.session.commit()
+    assert (first['outcome'], second['outcome']) == ('approved', 'conflict')
+    db.session.expire_all()
+    assert payment.level1_approver == principal_id
+
+    # The single approval link no longer moves an approved payment backwards
+    approve_payments(2, principal_id, [payment.id])
+    db.session.commit()
+    client.get(f'/staff/approve-payment/{payment.id}/1')
+    db.session.expire_all()
+    assert (payment.status, payment.level2_approver) == ('approved', principal_id)
+
+def test_level_two_is_principal_only(client, sample):
+    payment = FeePayment.query.filter_by(status='pending').one()
+    login(client, sample['staff'])
+    response = client.post('/staff/fee-payments/approve', json={'level': 2, 'payment_ids': [payment.id]})
+    assert response.status_code == 403
+    login(client, sample['student'])
+    assert client.post('/staff/fee-payments/approve', json={'level': 1, 'payment_ids': [payment.id]}).status_code == 403
+
+def test_filter_approval_is_one_update(client, sample):
+    fee = add_payments(2000, course='Mechanical')
+    add_payments(5, course='Civil')
+    login(client, sample['principal'])
+
+    response = client.post('/staff/fee-payments/approve', json={'level': 1})
+    assert response.status_code == 400
+
+    started = time.perf_counter()
+    response = client.post('/staff/fee-payments/approve', json={'level': 1, 'course': 'Mechanical'})
+    elapsed = time.perf_counter() - started
+    assert response.json['counts']['approved'] == 2000
+    assert elapsed < 2.0
+    assert FeePayment.query.filter_by(fee_structure_id=fee.id, status='level1_approved').count() == 2000
+    assert FeePayment.query.filter_by(status='pending').count() == 6
+
+    response = client.post('/staff/fee-payments/approve',
+                           data={'level': 2, 'fee_structure_id': fee.id})
+    assert response.status_code == 302
+    assert FeePayment.query.filter_by(fee_structure_id=fee.id, status='approved').count() == 2000
+
+def test_selected_payments_from_the_page(client, sample):
+    add_payments(3)
+    login(client, sample['staff'])
+    page = client.get('/staff/fee-payments?status=pending')
+    assert b'Approve selected at level 1' in page.data
+    ids = [payment_id for (payment_id,) in db.session.query(FeePayment.id).filter_by(status='pending').limit(2)]
+    response = client.post('/staff/fee-payments/approve', data={'level': 1, 'payment_ids': ids})
+    assert response.status_code == 302
+    assert FeePayment.query.filter(FeePayment.id.in_(ids), FeePayment.status == 'level1_approved').count() == 2
+
+def ledger_entry(student, fee):
+    db.session.expire_all()
+    return db.session.get(FeeLedger, (student.id, fee.id))
+
+def test_ledger_follows_payments_and_approvals(client, sample):
+    student = Student.query.filter_by(student_id='STU001').one()
+    fee = FeeStructure.query.filter_by(course='Computer Science', year=2).one()
+    entry = ledger_entry(student, fee)
+    assert (entry.due, entry.paid, entry.approved, entry.outstanding) == (5000, 5000, 0, 0)
+
+    payment = FeePayment.query.filter_by(student_id=student.id).one()
+    payment.amount_paid = 3000.0
+    db.session.commit()
+    assert ledger_entry(student, fee).outstanding == 2000
+
+    login(client, sample['principal'])
+    client.post('/staff/fee-payments/approve', json={'level': 1, 'payment_ids': [payment.id]})
+    client.post('/staff/fee-payments/approve', json={'level': 2, 'payment_ids': [payment.id]})
+    entry = ledger_entry(student, fee)
+    assert (entry.paid, entry.approved, entry.outstanding) == (3000, 3000, 2000)
+
+    db.session.get(FeePayment, payment.id).status = 'rejected'
+    db.session.commit()
+    assert ledger_entry(student, fee).outstanding == 5000
+
+    # Moving on to the next semester owes that semester's fees instead
+    student.semester = 4
+    next_fee = FeeStructure(course='Computer Science', year=2, semester=4, tuition_fee=6000.0,
+                            total_fee=6000.0, academic_year='2023-24')
+    db.session.add(next_fee)
+    db.session.commit()
+    assert ledger_entry(student, next_fee).outstanding == 6000
+    # The rejected payment keeps the old row around
+    assert ledger_entry(student, fee).outstanding == 5000
+
+def test_dues_report_filters_and_rebuild(app, client, sample):
+    fee = FeeStructure(course='Mechanical', year=1, semester=1, tuition_fee=100.0, total_fee=100.0,
+                       academic_year='2023-24')
+    students = [Student(user_id=sample['student'].id, student_id=f'MEC{index:03d}', first_name='M',
+                        last_name=str(index), date_of_birth=date(2003, 1, 1), gender='Male',
+                        course='Mechanical', year=1, semester=1, admission_date=date(2023, 8, 1))
+                for index in range(30)]
+    db.session.add_all(students + [fee])
+    db.session.flush()
+    db.session.add_all([FeePayment(student_id=student.id, fee_structure_id=fee.id, amount_paid=index * 5.0,
+                                   payment_method='cash') for index, student in enumerate(students)])
+    db.session.commit()
+    before = sorted((row.student_id, row.outstanding) for row in FeeLedger.query)
+    result = app.test_cli_runner().invoke(args=['rebuild', 'fee-ledger'])
+    assert 'Fee ledger rebuilt.' in result.output
+    assert sorted((row.student_id, row.outstanding) for row in FeeLedger.query) == before
+
+    login(client, sample['staff'])
+    response = client.get('/staff/fee-dues?course=Mechanical&year=1&min_outstanding=50&per_page=10')
+    assert response.status_code == 200
+    # 100 - 5 * index >= 50 for index 0..10; largest dues first
+    assert response.data.count(b'MEC0') == 10
+    assert b'MEC000' in response.data and b'MEC010' not in response.data
+    assert b'STU001' not in response.data
+
+def test_empty_selection_is_flashed_to_the_form(client, sample):
+    login(client, sample['staff'])
+    response = client.post('/staff/fee-payments/approve', data={'level': '1'})
+    assert response.status_code == 302
+    assert response.headers['Location'].endswith('/staff/fee-payments?status=pending')
+    assert b'Select at least one payment to approve.' in client.get(response.headers['Location']).data
+
+    response = client.post('/staff/fee-payments/approve', json={'level': 1})
+    assert response.status_code == 400 and 'error' in response.json
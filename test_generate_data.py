@@ -0,0 +1,35 @@
+from datetime import date
+from sqlalchemy import create_engine, text
+from werkzeug.security import check_password_hash
+from generate_data import generate, weekdays
+
+TODAY = date(2025, 3, 14)
+
+def build(path, seed=7):
+    generate(str(path), students=12, months=2, seed=seed, log=lambda message: None,
+             today=TODAY, hash_method='pbkdf2:sha256:1000', workers=1)
+    return create_engine(f'sqlite:///{path}')
+
+def snapshot(engine):
+    with engine.connect() as conn:
+        return {
+            table: conn.execute(text(f'SELECT * FROM {table} ORDER BY 1')).all()
+            for table in ('student', 'attendance', 'exam_result', 'fee_payment', 'library_access')
+        }
+
+def test_same_seed_same_data(tmp_path):
+    first = snapshot(build(tmp_path / 'a.db'))
+    assert first == snapshot(build(tmp_path / 'b.db'))
+    assert first != snapshot(build(tmp_path / 'c.db', seed=8))
+
+def test_scale_and_logins(tmp_path):
+    engine = build(tmp_path / 'scale.db')
+    with engine.connect() as conn:
+        days = len(list(weekdays(date(2025, 1, 13), date(2025, 3, 13))))
+        assert conn.execute(text('SELECT count(*) FROM attendance')).scalar() == 12 * days * 3
+        assert conn.execute(text('SELECT sum(total) FROM attendance_summary')).scalar() == 12 * days * 3
+        assert conn.execute(text('SELECT count(*) FROM library_access')).scalar() == 12 * 5
+        hashes = dict(conn.execute(text('SELECT username, password_hash FROM user')).all())
+    assert check_password_hash(hashes['student1'], 'student123')
+    assert check_password_hash(hashes['staff1'], 'staff123')
+    assert check_password_hash(hashes['student12'], 'password123')
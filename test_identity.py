@@ -0,0 +1,87 @@
+import re
+from sqlalchemy import event
+from app import db, identities
+from app.instrumentation import track_queries
+from app.models import User
+from conftest import login
+
+_PROFILE_TABLES = re.compile(r'\bFROM "?(user|student|staff)"?\s')
+
+def _user_queries(tracker):
+    return [statement for statement in tracker.statements if _PROFILE_TABLES.search(statement)]
+
+def test_cached_identity_skips_user_and_profile_queries(client, sample):
+    login(client, sample['student'])
+    client.get('/student/profile')
+    login(client, sample['student'])
+    db.session.expunge_all()
+    with track_queries() as tracker:
+        response = client.get('/student/profile')
+    assert response.status_code == 200
+    assert b'STU001' in response.data
+    assert _user_queries(tracker) == []
+    assert identities.stats()['hits'] == 1
+
+def test_miss_loads_user_and_profile_in_one_query(client, sample):
+    login(client, sample['student'])
+    db.session.expunge_all()
+    with track_queries() as tracker:
+        client.get('/student/profile')
+    assert len(_user_queries(tracker)) == 1
+
+def test_role_change_invalidates_identity(client, sample):
+    login(client, sample['staff'])
+    assert client.get('/staff/dashboard').status_code == 200
+    user = db.session.get(User, sample['staff'].id)
+    user.role = 'student'
+    db.session.commit()
+    login(client, sample['staff'])
+    db.session.expunge_all()
+    assert client.get('/staff/dashboard').status_code == 302
+    assert identities.stats()['invalidations'] == 1
+
+def test_profile_change_invalidates_identity(client, sample):
+    login(client, sample['student'])
+    client.get('/student/profile')
+    sample['student'].student.first_name = 'Alicia'
+    db.session.commit()
+    login(client, sample['student'])
+    db.session.expunge_all()
+    assert b'Alicia' in client.get('/student/profile').data
+
+def test_load_during_invalidation_is_not_cached(app, sample):
+    user_id = sample['student'].id
+    store = app.extensions['identity_cache']
+
+    changes = [user_id]
+
+    def change_during_load(*args):
+        if changes:
+            identities.invalidate(changes.pop())
+
+    event.listen(db.engine, 'before_cursor_execute', change_during_load)
+    try:
+        identities.load(user_id)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', change_during_load)
+    assert user_id not in store.entries
+    identities.load(user_id)
+    assert user_id in store.entries
+
+def test_cache_is_bounded(app, sample):
+    app.extensions['identity_cache'].size = 2
+    for user in ('principal', 'staff', 'student'):
+        identities.load(sample[user].id)
+    assert identities.stats()['entries'] == 2
+    identities.load(sample['student'].id)
+    assert identities.stats()['hits'] == 1
+
+def test_invalidations_keep_nothing_per_user(app, sample):
+    store = app.extensions['identity_cache']
+    store.size = 1
+    identities.invalidate(*range(1000, 2000))
+    for user in ('principal', 'staff', 'student'):
+        identities.load(sample[user].id)
+        identities.invalidate(sample[user].id)
+    # Only the bounded LRU holds anything keyed by user
+    assert sum(len(value) for value in vars(store).values() if isinstance(value, dict)) == 0
@@ -0,0 +1,37 @@
+from app import instrumentation
+from app.instrumentation import percentile
+from conftest import login
+
+def test_server_timing_header(client, sample):
+    login(client, sample['student'])
+    response = client.get('/student/attendance')
+    timing = response.headers['Server-Timing']
+    assert timing.startswith('db;dur=')
+    assert 'tpl;dur=' in timing and 'app;dur=' in timing
+
+    record = instrumentation.recent()[-1]
+    assert record['endpoint'] == 'student.attendance'
+    assert record['queries'] > 0
+    assert record['render_ms'] > 0
+    assert record['total_ms'] >= record['db_ms']
+
+def test_ring_buffer_is_bounded(app, client, sample):
+    app.extensions['instrumentation'] = type(app.extensions['instrumentation'])(maxlen=3)
+    login(client, sample['student'])
+    for _ in range(5):
+        client.get('/student/dashboard')
+    assert len(instrumentation.recent()) == 3
+
+def test_performance_page_is_principal_only(client, sample):
+    login(client, sample['staff'])
+    assert client.get('/staff/performance').status_code == 302
+    login(client, sample['principal'])
+    client.get('/staff/dashboard')
+    response = client.get('/staff/performance')
+    assert response.status_code == 200
+    assert b'staff.dashboard' in response.data
+
+def test_percentile_nearest_rank():
+    values = list(range(1, 101))
+    assert (percentile(values, 0.5), percentile(values, 0.95), percentile(values, 0.99)) == (50, 95, 99)
+    assert percentile([7], 0.99) == 7
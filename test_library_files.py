@@ -0,0 +1,109 @@
+import io
+import pytest
+from flask import current_app
+from app import db
+from app.models import LibraryAccess, LibraryResource
+from conftest import login
+
+CONTENT = bytes(range(256)) * 40
+
+@pytest.fixture
+def paper(app, sample, tmp_path):
+    current_app.config['LIBRARY_FILES_DIR'] = str(tmp_path)
+    (tmp_path / 'paper.pdf').write_bytes(CONTENT)
+    resource = sample['resource']
+    resource.file_path = 'paper.pdf'
+    db.session.commit()
+    return f'/student/library/access/{resource.id}'
+
+def opens():
+    db.session.expire_all()
+    return db.session.query(LibraryAccess.download_count).scalar()
+
+def test_file_with_ranges_and_conditional_get(client, sample, paper):
+    login(client, sample['student'])
+    response = client.get(paper)
+    assert response.status_code == 200 and response.data == CONTENT
+    assert response.headers['Accept-Ranges'] == 'bytes'
+    assert response.mimetype == 'application/pdf'
+    assert 'Database_System_Concepts.pdf' in response.headers['Content-Disposition']
+    assert {'private', 'no-cache'} <= set(response.headers['Cache-Control'].replace(' ', '').split(','))
+    etag = response.headers['ETag']
+    assert not etag.startswith('W/')
+    assert opens() == 2
+
+    # Revalidating the cached copy is not an open
+    assert client.get(paper, headers={'If-None-Match': etag}).status_code == 304
+    assert opens() == 2
+
+    # The viewer fetching the rest of the document is not a new access
+    response = client.get(paper, headers={'Range': 'bytes=1000-1999', 'If-Range': etag})
+    assert response.status_code == 206
+    assert response.data == CONTENT[1000:2000]
+    assert response.headers['Content-Range'] == f'bytes 1000-1999/{len(CONTENT)}'
+    assert opens() == 2
+    assert client.get(paper, headers={'Range': f'bytes={len(CONTENT) + 10}-'}).status_code == 416
+
+    # A stale If-Range gets the whole, changed file
+    with open(current_app.config['LIBRARY_FILES_DIR'] + '/paper.pdf', 'ab') as f:
+        f.write(b'appendix')
+    response = client.get(paper, headers={'Range': 'bytes=0-9', 'If-Range': etag})
+    assert response.status_code == 200 and response.data == CONTENT + b'appendix'
+    assert response.headers['ETag'] != etag
+
+@pytest.mark.parametrize('mode, header, value', [
+    ('x-accel-redirect', 'X-Accel-Redirect', '/protected-library/paper.pdf'),
+    ('x-sendfile', 'X-Sendfile', None),
+])
+def test_offload_to_the_front_proxy(client, sample, paper, mode, header, value):
+    current_app.config['LIBRARY_FILE_OFFLOAD'] = mode
+    login(client, sample['student'])
+    response = client.get(paper)
+    assert response.status_code == 200 and response.data == b''
+    assert response.headers[header] == (value or current_app.config['LIBRARY_FILES_DIR'] + '/paper.pdf')
+    assert opens() == 2
+
+def test_files_stay_behind_authorization(client, sample, paper):
+    login(client, sample['staff'])
+    assert client.get(paper).status_code == 302
+    resource = sample['resource']
+    resource.year = 4
+    db.session.commit()
+    login(client, sample['student'])
+    response = client.get(paper, follow_redirects=True)
+    assert b'not available to you' in response.data
+    resource.year = None
+    resource.file_path = '../paper.pdf'
+    db.session.commit()
+    assert client.get(paper).status_code == 404
+    resource.file_path = 'missing.pdf'
+    db.session.commit()
+    assert client.get(paper).status_code == 404
+    # Refused and failed requests are not opens
+    assert opens() == 1
+
+def test_staff_upload_is_served(client, sample, paper):
+    login(client, sample['staff'])
+    response = client.post('/staff/library/add-resource', data={
+        'title': 'Past Paper 2023', 'subject': 'Database Systems', 'course': 'all', 'year': '',
+        'semester': '', 'resource_type': 'exam_paper', 'author': '', 'description': '',
+        'file': (io.BytesIO(b'%PDF-1.4 past paper'), '../../etc/Paper 2023.PDF'),
+    })
+    assert response.status_code == 302
+    resource = LibraryResource.query.filter_by(title='Past Paper 2023').one()
+    assert resource.file_path.endswith('.pdf') and '/' not in resource.file_path
+    login(client, sample['student'])
+    assert client.get(f'/student/library/access/{resource.id}').data == b'%PDF-1.4 past paper'
+
+def test_failed_upload_leaves_no_file(client, sample, paper, tmp_path, monkeypatch):
+    def fail():
+        raise RuntimeError('database is locked')
+    login(client, sample['staff'])
+    monkeypatch.setattr(db.session, 'commit', fail)
+    with pytest.raises(RuntimeError):
+        client.post('/staff/library/add-resource', data={
+            'title': 'Past Paper 2023', 'subject': 'Database Systems', 'course': 'all', 'year': '',
+            'semester': '', 'resource_type': 'exam_paper', 'author': '', 'description': '',
+            'file': (io.BytesIO(b'%PDF-1.4 past paper'), 'paper.pdf'),
+        })
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['paper.pdf']
@@ -0,0 +1,54 @@
+from app import db
+from app.models import LibraryResource
+from app.search import match_expression
+from conftest import login
+
+def add_resource(sample, **values):
+    fields = dict(subject='Database Systems', course='Computer Science', year=2,
+                  resource_type='notes', added_by=sample['staff'].staff.id)
+    fields.update(values)
+    resource = LibraryResource(**fields)
+    db.session.add(resource)
+    db.session.commit()
+    return resource
+
+def test_search_ranks_title_matches_first(client, sample):
+    add_resource(sample, title='Lecture Notes', description='Normal forms and database concepts')
+    login(client, sample['student'])
+    response = client.get('/student/library?q=concept')
+    body = response.get_data(as_text=True)
+    assert body.index('<mark>Concepts</mark>') < body.index('<mark>concepts</mark>')
+    assert 'Lecture Notes' in body
+
+def test_search_keeps_catalogue_filters(client, sample):
+    add_resource(sample, title='Compiler Concepts', course='Electronics')
+    add_resource(sample, title='Withdrawn Concepts', is_available=False)
+    login(client, sample['student'])
+    body = client.get('/student/library?q=concepts').get_data(as_text=True)
+    assert 'Database System' in body
+    assert 'Compiler' not in body and 'Withdrawn' not in body
+
+def test_index_follows_updates_and_deletes(client, sample):
+    resource = add_resource(sample, title='Relational Algebra')
+    login(client, sample['student'])
+    assert 'Relational' in client.get('/student/library?q=relat').get_data(as_text=True)
+
+    resource.title = 'Query Optimisation'
+    db.session.commit()
+    assert 'Relational' not in client.get('/student/library?q=relat').get_data(as_text=True)
+    assert 'Optimisation' in client.get('/student/library?q=optim').get_data(as_text=True)
+
+    db.session.delete(resource)
+    db.session.commit()
+    assert 'Optimisation' not in client.get('/student/library?q=optim').get_data(as_text=True)
+
+def test_search_text_is_escaped(client, sample):
+    add_resource(sample, title='<script>Joins</script>')
+    login(client, sample['student'])
+    body = client.get('/student/library?q=joins').get_data(as_text=True)
+    assert '&lt;script&gt;<mark>Joins</mark>' in body
+    assert client.get('/student/library?q="AND (').status_code == 200
+
+def test_match_expression():
+    assert match_expression('datab  sys-tems') == '"datab"* "sys"* "tems"*'
+    assert match_expression('"" ()') is None
@@ -0,0 +1,128 @@
+import io
+import time
+import pytest
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.marks import grades_for
+from app.models import ExamResult, ResultSnapshot
+from conftest import login
+from test_attendance import add_section
+
+JSON = {'Accept': 'application/json'}
+
+def upload(client, exam, text, filename='marks.csv', headers=JSON):
+    data = {'file': (io.BytesIO(text.encode()), filename)}
+    return client.post(f'/staff/examinations/{exam.id}/marks', data=data, headers=headers,
+                       content_type='multipart/form-data')
+
+def test_grades_follow_the_scale():
+    scale = [(40, 'D'), (85, 'A'), (0, 'F'), (70, 'B'), (55, 'C')]
+    assert grades_for([100, 85, 84.9, 55, 39.5, 0], scale) == ['A', 'A', 'B', 'C', 'F', 'F']
+
+def test_bulk_upload_grades_and_upserts(client, sample):
+    exam = sample['exam']
+    add_section(400)
+    db.session.execute(db.update(db.metadata.tables['student']).values(year=2, semester=3))
+    db.session.commit()
+    rolls = [roll for (roll,) in db.session.execute(db.text("SELECT student_id FROM student WHERE student_id LIKE 'SEC%'"))]
+    lines = ['student_id,marks,remarks'] + [f'{roll},{index % 101},' for index, roll in enumerate(rolls)]
+    lines.append('STU001,91,Excellent')
+    login(client, sample['staff'])
+
+    started = time.perf_counter()
+    response = upload(client, exam, '\n'.join(lines))
+    elapsed = time.perf_counter() - started
+
+    assert response.status_code == 200
+    assert response.json == {'saved': 401, 'created': 400, 'updated': 1, 'errors': []}
+    assert elapsed < 2.0
+    result = ExamResult.query.filter_by(examination_id=exam.id, student_id=sample['student'].student.id).one()
+    assert (result.marks_obtained, result.grade, result.remarks) == (91, 'A', 'Excellent')
+    assert ExamResult.query.filter_by(examination_id=exam.id).count() == 401
+    # Rankings of the cohort are refreshed with the upload
+    assert ResultSnapshot.query.filter_by(course='Computer Science', year=2, semester=3).count() == 401
+
+    response = upload(client, exam, 'student_id,marks\nSTU001,40\n')
+    assert response.json['updated'] == 1
+    db.session.expire_all()
+    assert (result.marks_obtained, result.grade, result.remarks) == (40, 'D', 'Excellent')
+
+def test_rejected_rows_do_not_block_the_rest(client, sample):
+    login(client, sample['staff'])
+    response = upload(client, sample['exam'], '\n'.join([
+        'Student_ID,Marks',
+        'STU001,abc',
+        'STU999,50',
+        'STU001,101',
+        ',70',
+        'STU001,72',
+        'STU001,73',
+        '',
+    ]))
+    assert response.status_code == 200
+    assert response.json['saved'] == 1
+    assert [(error['line'], error['error']) for error in response.json['errors']] == [
+        (2, "Marks must be a number, got 'abc'"),
+        (3, 'Not on the roster for this examination'),
+        (4, 'Marks must be between 0 and 100'),
+        (5, 'Missing student_id'),
+        (7, 'Duplicate entry in file'),
+    ]
+    assert ExamResult.query.filter_by(student_id=sample['student'].student.id).one().marks_obtained == 72
+
+def test_bad_files_are_refused(client, sample):
+    login(client, sample['staff'])
+    assert upload(client, sample['exam'], 'roll,score\nSTU001,5\n').json == {'error': 'Missing column(s): student_id, marks'}
+    assert upload(client, sample['exam'], 'x', filename='marks.txt').status_code == 400
+    response = upload(client, sample['exam'], 'not a workbook', filename='marks.xlsx')
+    assert response.status_code == 400
+    assert response.json == {'error': 'The file is not a valid XLSX workbook.'}
+
+def test_zip_that_is_not_a_workbook_is_refused(client, sample):
+    import zipfile
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        archive.writestr('a.txt', 'hello')
+    login(client, sample['staff'])
+    data = {'file': (io.BytesIO(buffer.getvalue()), 'marks.xlsx')}
+    response = client.post(f"/staff/examinations/{sample['exam'].id}/marks", data=data, headers=JSON,
+                           content_type='multipart/form-data')
+    assert response.status_code == 400
+    assert response.json == {'error': 'The file is not a valid XLSX workbook.'}
+
+def test_undecodable_csv_is_refused_with_a_message(client, sample):
+    login(client, sample['staff'])
+    data = {'file': (io.BytesIO('student_id,marks,remarks\nSTU001,80,Très bien\n'.encode('latin-1')), 'marks.csv')}
+    response = client.post(f"/staff/examinations/{sample['exam'].id}/marks", data=data,
+                           content_type='multipart/form-data')
+    assert response.status_code == 400
+    assert 'CSV UTF-8' in response.get_data(as_text=True)
+    assert ExamResult.query.filter_by(examination_id=sample['exam'].id).count() == 1
+
+def test_xlsx_upload(client, sample):
+    from openpyxl import Workbook
+    workbook = Workbook()
+    workbook.active.append(['student_id', 'marks'])
+    workbook.active.append(['STU001', 77])
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    login(client, sample['staff'])
+    data = {'file': (io.BytesIO(buffer.getvalue()), 'marks.xlsx')}
+    response = client.post(f"/staff/examinations/{sample['exam'].id}/marks", data=data, headers=JSON,
+                           content_type='multipart/form-data')
+    assert response.json['updated'] == 1
+
+def test_upload_page_lists_rejected_rows(client, sample):
+    login(client, sample['student'])
+    assert upload(client, sample['exam'], 'student_id,marks\n', headers={}).status_code == 302
+    login(client, sample['staff'])
+    assert client.get(f"/staff/examinations/{sample['exam'].id}/marks").status_code == 200
+    page = upload(client, sample['exam'], 'student_id,marks\nSTU404,10\n', headers={}).get_data(as_text=True)
+    assert 'Rejected Rows (1)' in page and 'STU404' in page
+
+def test_results_are_unique_per_student_and_exam(app, sample):
+    db.session.add(ExamResult(examination_id=sample['exam'].id, student_id=sample['student'].student.id,
+                              marks_obtained=1))
+    with pytest.raises(IntegrityError):
+        db.session.flush()
+    db.session.rollback()
@@ -0,0 +1,94 @@
+from datetime import date, datetime, timedelta
+import pytest
+from app import db
+from app.instrumentation import QueryBudgetExceeded, track_queries
+from app.models import *
+from conftest import login
+
+STUDENT_PAGES = [
+    '/student/dashboard',
+    '/student/attendance',
+    '/student/academics',
+    '/student/library',
+    '/student/events',
+    '/student/transportation',
+]
+
+STAFF_PAGES = [
+    '/staff/dashboard',
+    '/staff/examinations',
+    '/staff/fee-payments',
+    '/staff/transportation',
+    '/staff/attendance',
+    '/staff/events',
+    '/staff/library',
+]
+
+def add_rows(sample, count=6):
+    """Give every listing several rows whose relationships point at distinct objects."""
+    student = sample['student'].student
+    for i in range(count):
+        user = User(username=f'teacher{i}', email=f'teacher{i}@college.edu', role='staff', password_hash='x')
+        db.session.add(user)
+        db.session.flush()
+        teacher = Staff(user_id=user.id, employee_id=f'T{i}', first_name='Teacher', last_name=str(i),
+                        department='Science', designation='Lecturer', hire_date=date(2020, 1, 1))
+        route = BusRoute(route_name=f'Route {i}', route_number=f'X{i}', starting_point='A', ending_point='B',
+                         total_distance=5.0, estimated_time=20, monthly_fee=50.0, term_fee=150.0)
+        fee = FeeStructure(course='Computer Science', year=2, semester=i + 1, tuition_fee=100.0,
+                           total_fee=100.0, academic_year='2024-25')
+        db.session.add_all([teacher, route, fee])
+        db.session.flush()
+        exam = Examination(name=f'Test {i}', subject=f'Subject {i}', course='Computer Science', year=2,
+                           semester=3, exam_date=date.today() - timedelta(days=i),
+                           start_time=datetime.strptime('09:00', '%H:%M').time(),
+                           duration_minutes=60, max_marks=50, created_by=teacher.id)
+        db.session.add(exam)
+        db.session.flush()
+        db.session.add_all([
+            ExamResult(examination_id=exam.id, student_id=student.id, marks_obtained=40),
+            Event(title=f'Event {i}', description='Event', event_date=date.today() + timedelta(days=i),
+                  event_type='cultural', target_audience='all', created_by=teacher.id),
+            Event(title=f'Past {i}', description='Event', event_date=date.today() - timedelta(days=i + 1),
+                  event_type='cultural', target_audience='all', created_by=teacher.id),
+            Bus(bus_number=f'B{i}', route_id=route.id, driver_name='Driver', driver_phone='1', capacity=30),
+            BusSubscription(student_id=student.id, route_id=route.id, start_date=date.today(),
+                            end_date=date.today(), amount_paid=150.0, pickup_stop='A'),
+            FeePayment(student_id=student.id, fee_structure_id=fee.id, amount_paid=100.0, payment_method='cash'),
+            LibraryResource(title=f'Notes {i}', subject=f'Subject {i}', course='Computer Science',
+                            resource_type='notes', description='Notes', added_by=teacher.id),
+        ])
+    db.session.commit()
+
+@pytest.mark.parametrize('path', STUDENT_PAGES)
+def test_student_pages_have_no_n_plus_one(client, sample, path):
+    add_rows(sample)
+    login(client, sample['student'])
+    db.session.expunge_all()
+    # SQL_GUARD_RAISE makes the request itself fail on a violation
+    assert client.get(path).status_code == 200
+
+@pytest.mark.parametrize('path', STAFF_PAGES)
+def test_staff_pages_have_no_n_plus_one(client, sample, path):
+    add_rows(sample)
+    login(client, sample['principal'])
+    db.session.expunge_all()
+    assert client.get(path).status_code == 200
+
+def test_guard_flags_lazy_loads_in_a_loop(app, client, sample):
+    add_rows(sample)
+
+    @app.route('/lazy-results')
+    def lazy_results():
+        return ', '.join(result.examination.name for result in ExamResult.query.all())
+
+    db.session.expunge_all()
+    with pytest.raises(QueryBudgetExceeded, match='N\\+1'):
+        client.get('/lazy-results')
+
+def test_track_queries_counts_statements(app, sample):
+    db.session.expunge_all()
+    with track_queries() as tracker:
+        for result in ExamResult.query.all():
+            result.examination.name
+    assert tracker.count == 2
@@ -0,0 +1,82 @@
+from datetime import datetime, timedelta
+from app import db
+from app.models import FeePayment
+from app.pagination import paginate, encode_cursor
+from conftest import login
+
+def add_payments(sample, count, start):
+    student = sample['student'].student
+    structure_id = student.fee_payments[0].fee_structure_id
+    db.session.add_all([
+        FeePayment(student_id=student.id, fee_structure_id=structure_id, amount_paid=100.0,
+                   payment_method='online', payment_date=start + timedelta(minutes=i))
+        for i in range(count)
+    ])
+    db.session.commit()
+
+def walk(query, per_page, during=None):
+    """Collect every id by following next cursors, calling ``during`` after page one."""
+    seen = []
+    page = paginate(query, [FeePayment.payment_date, FeePayment.id], per_page)
+    seen.extend(p.id for p in page.items)
+    if during:
+        during()
+    while page.has_next:
+        page = paginate(query, [FeePayment.payment_date, FeePayment.id], per_page, after=page.next_cursor)
+        seen.extend(p.id for p in page.items)
+    return seen
+
+def test_pages_are_stable_under_inserts(app, sample):
+    add_payments(sample, 60, datetime(2024, 1, 1))
+    expected = [p.id for p in FeePayment.query.order_by(FeePayment.payment_date.desc(), FeePayment.id.desc())]
+
+    # Newer payments arriving mid-walk must not shift or repeat older rows
+    seen = walk(FeePayment.query, 25, during=lambda: add_payments(sample, 10, datetime(2030, 1, 1)))
+    assert seen == expected
+
+def test_previous_page_and_count(app, sample):
+    add_payments(sample, 30, datetime(2024, 1, 1))
+    first = paginate(FeePayment.query, [FeePayment.payment_date, FeePayment.id], 10)
+    second = paginate(FeePayment.query, [FeePayment.payment_date, FeePayment.id], 10, after=first.next_cursor)
+    back = paginate(FeePayment.query, [FeePayment.payment_date, FeePayment.id], 10, before=second.prev_cursor)
+
+    assert first.total == 31
+    assert not first.has_prev
+    assert [p.id for p in back.items] == [p.id for p in first.items]
+    assert not back.has_prev
+
+def test_null_sort_values_on_page_boundaries(app, sample):
+    add_payments(sample, 12, datetime(2024, 1, 1))
+    # Undated payments sort below every dated one and straddle the page breaks
+    db.session.execute(db.update(FeePayment).where(FeePayment.id % 3 == 0).values(payment_date=None))
+    db.session.commit()
+    expected = [p.id for p in FeePayment.query.order_by(
+        FeePayment.payment_date.desc().nulls_last(), FeePayment.id.desc())]
+    assert FeePayment.query.filter(FeePayment.payment_date == None).count() == 4
+
+    for per_page in (2, 3, 5):
+        assert walk(FeePayment.query, per_page) == expected
+        # and back again through the previous cursors
+        page = paginate(FeePayment.query, [FeePayment.payment_date, FeePayment.id], per_page)
+        pages = [page]
+        while page.has_next:
+            page = paginate(FeePayment.query, [FeePayment.payment_date, FeePayment.id], per_page, after=page.next_cursor)
+            pages.append(page)
+        for earlier in reversed(pages[:-1]):
+            page = paginate(FeePayment.query, [FeePayment.payment_date, FeePayment.id], per_page, before=page.prev_cursor)
+            assert [p.id for p in page.items] == [p.id for p in earlier.items]
+
+def test_malformed_cursor_falls_back_to_first_page(app, sample):
+    page = paginate(FeePayment.query, [FeePayment.payment_date, FeePayment.id], 10, after='not-a-cursor')
+    assert not page.has_prev
+    page = paginate(FeePayment.query, [FeePayment.payment_date, FeePayment.id], 10,
+                    after=encode_cursor(['yesterday', 1]))
+    assert not page.has_prev
+
+def test_listing_filters_run_in_sql(client, sample):
+    add_payments(sample, 30, datetime(2024, 1, 1))
+    login(client, sample['principal'])
+    response = client.get('/staff/fee-payments?status=pending&date_from=2024-01-01&date_to=2024-01-01&per_page=10')
+    assert response.status_code == 200
+    assert b'31 payments found' not in response.data
+    assert b'30 payments found' in response.data
@@ -0,0 +1,65 @@
+from werkzeug.security import generate_password_hash
+from app import create_app, db, passwords
+from app.models import User
+from app.passwords import HashingBusy, normalize_method
+from conftest import TestConfig, login
+
+def add_user(password_hash):
+    user = User(username='newstudent', email='new@college.edu', role='student', password_hash=password_hash)
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+def sign_in(client, password='secret'):
+    return client.post('/auth/login', data={'username': 'newstudent', 'password': password})
+
+def test_login_upgrades_outdated_hash(app, client):
+    user = add_user(generate_password_hash('secret', method='pbkdf2:sha256:500'))
+    assert sign_in(client).status_code == 302
+    assert user.password_hash.startswith('pbkdf2:sha256:1000$')
+    assert user.check_password('secret')
+    assert passwords.stats()['rehashed'] == 1
+
+def test_current_hash_is_kept(app, client):
+    user = add_user(passwords.hash('secret'))
+    stored = user.password_hash
+    assert sign_in(client, 'wrong').status_code == 200
+    assert sign_in(client).status_code == 302
+    assert user.password_hash == stored
+    assert passwords.stats()['rehashed'] == 0
+
+def test_full_queue_rejects_login(app, client):
+    add_user(passwords.hash('secret'))
+    pool = app.extensions['password_hasher']
+    pool.timeout = 0
+    while pool.slots.acquire(blocking=False):
+        pass
+    assert sign_in(client).status_code == 503
+    assert passwords.stats()['rejected'] == 1
+
+def test_hashing_runs_in_worker_processes():
+    class PoolConfig(TestConfig):
+        PASSWORD_HASH_WORKERS = 1
+    with create_app(PoolConfig).app_context():
+        password_hash = passwords.hash('secret')
+        assert passwords.verify(password_hash, 'secret')
+        stats = passwords.stats()
+        assert (stats['completed'], stats['queue_depth'], stats['max_queue_depth']) == (2, 0, 1)
+        assert stats['avg_hash_ms'] > 0
+
+def test_password_hash_stats_are_principal_only(client, sample):
+    login(client, sample['staff'])
+    assert client.get('/staff/api/password-hash-stats').status_code == 403
+    login(client, sample['principal'])
+    assert client.get('/staff/api/password-hash-stats').json['method'] == 'pbkdf2:sha256:1000'
+
+def test_normalize_method():
+    assert normalize_method('pbkdf2:sha256:1000') == 'pbkdf2:sha256:1000'
+    assert normalize_method('pbkdf2').startswith('pbkdf2:sha256:')
+    assert normalize_method('scrypt:16384') == 'scrypt:16384:8:1'
+    assert generate_password_hash('x', method='scrypt').startswith(normalize_method('scrypt') + '$')
+
+def test_hash_column_fits_every_method():
+    length = User.__table__.c.password_hash.type.length
+    for method in ('pbkdf2:sha256:600000', 'scrypt:32768:8:1'):
+        assert len(generate_password_hash('x' * 64, method=method)) <= length
@@ -0,0 +1,108 @@
+from datetime import datetime, timedelta
+from flask import current_app
+from app import access_buffer, db
+from app.models import LibraryAccessDaily, LibraryCoAccess, LibraryPopularity, LibraryResource
+from app.popularity import backfill_daily, rebuild_popularity, refresh_popularity
+from conftest import login
+from test_transport import add_students
+
+def add_resource(title, subject='Database Systems', **fields):
+    resource = LibraryResource(title=title, subject=subject, course='Computer Science', year=2, semester=3,
+                               resource_type='notes', added_by=1, **fields)
+    db.session.add(resource)
+    db.session.commit()
+    return resource
+
+def popular(subject=''):
+    db.session.expire_all()
+    return [(row.rank, row.resource.title, row.opens) for row in LibraryPopularity.query.filter_by(
+        course='Computer Science', year=2, window_days=30, subject=subject
+    ).order_by(LibraryPopularity.rank)]
+
+def test_opens_refresh_the_class_list_and_the_page_reads_it(client, sample, library_files):
+    notes = add_resource('SQL Notes')
+    login(client, sample['student'])
+    for _ in range(2):
+        client.get(library_files(notes))
+    client.get(library_files(sample['resource']))
+
+    # Requests only write the counters; the lists wait for the refresh
+    assert popular() == []
+    assert access_buffer.refresh()
+    assert db.session.get(LibraryAccessDaily, (notes.id, 'Computer Science', 2, datetime.utcnow().date())).opens == 2
+    assert popular() == [(1, 'SQL Notes', 2), (2, 'Database System Concepts', 1)]
+    assert popular('Database Systems') == popular()
+
+    page = client.get('/student/library').data
+    assert b'Popular in your class' in page
+    assert page.index(b'SQL Notes</a>') < page.index(b'Database System Concepts</a>')
+
+def test_readers_of_a_resource_see_what_else_they_opened(client, sample, library_files):
+    notes = add_resource('SQL Notes')
+    hidden = add_resource('Withdrawn Notes', is_available=False)
+    first, second = add_students(2, prefix='POP')
+    login(client, first)
+    for resource in (sample['resource'], notes, hidden):
+        client.get(library_files(resource))
+    login(client, second)
+    client.get(library_files(sample['resource']))
+    access_buffer.refresh()
+
+    db.session.expire_all()
+    assert [(row.rank, row.other_id, row.students) for row in LibraryCoAccess.query.filter_by(
+        resource_id=notes.id).order_by(LibraryCoAccess.rank)] == [(1, sample['resource'].id, 1)]
+    page = client.get('/student/library').data.decode()
+    assert 'also opened:' in page
+    assert f'/student/library/access/{notes.id}">SQL Notes</a>' in page
+    assert 'Withdrawn Notes' not in page
+
+def test_refreshes_wait_for_the_interval(client, sample, library_files):
+    store = current_app.extensions['access_buffer']
+    store.refresh_interval = 3600
+    url = library_files(add_resource('SQL Notes'))
+    login(client, sample['student'])
+    client.get(url)
+    assert access_buffer.refresh(force=False)
+    client.get(url)
+    assert not access_buffer.refresh(force=False)
+    assert popular() == [(1, 'SQL Notes', 1)]
+    assert access_buffer.stats()['dirty_classes'] == 1
+    assert access_buffer.refresh()
+    assert popular() == [(1, 'SQL Notes', 2)]
+
+def test_the_background_thread_refreshes(client, sample, library_files):
+    store = current_app.extensions['access_buffer']
+    store.interval, store.refresh_interval = 0.05, 0
+    login(client, sample['student'])
+    client.get(library_files(sample['resource']))
+    assert popular() == []
+    store.flusher.join(timeout=0.5)  # runs until shutdown; just give it time to refresh
+    assert popular() == [(1, 'Database System Concepts', 1)]
+
+def test_rebuild_keeps_rolling_windows(app, sample):
+    notes = add_resource('SQL Notes')
+    today = datetime.utcnow().date()
+    for resource, days_ago, opens in [(notes, 40, 9), (notes, 1, 1), (sample['resource'], 2, 3)]:
+        db.session.add(LibraryAccessDaily(resource_id=resource.id, course='Computer Science', year=2,
+                                          day=today - timedelta(days=days_ago), opens=opens))
+    db.session.add(LibraryAccessDaily(resource_id=notes.id, course='Computer Science', year=2,
+                                      day=today - timedelta(days=400), opens=5))
+    db.session.commit()
+
+    rebuild_popularity(db.session.connection(), today=today)
+    db.session.commit()
+    assert popular() == [(1, 'Database System Concepts', 3), (2, 'SQL Notes', 1)]
+    assert [(row.resource_id, row.opens) for row in LibraryPopularity.query.filter_by(
+        window_days=365, subject='').order_by(LibraryPopularity.rank)] == [(notes.id, 10), (sample['resource'].id, 3)]
+    assert LibraryAccessDaily.query.count() == 3
+
+    # Another class's refresh leaves this one alone
+    refresh_popularity(db.session.connection(), [('Electronics', 1)], today=today)
+    db.session.commit()
+    assert len(popular()) == 2
+
+def test_backfill_counts_opens_on_the_last_access_day(app, sample):
+    backfill_daily(db.session.connection())
+    db.session.commit()
+    row = LibraryAccessDaily.query.one()
+    assert (row.resource_id, row.course, row.year, row.opens) == (sample['resource'].id, 'Computer Science', 2, 1)
@@ -0,0 +1,121 @@
+"""EXPLAIN QUERY PLAN regression suite for the student and staff routes.
+
+Every statement a route sends to the database is captured and planned again;
+the test fails when SQLite falls back to a full table scan that is not listed
+in ALLOWED_SCANS.
+"""
+import re
+import pytest
+from sqlalchemy import event, text
+from app import db
+from conftest import login
+
+STUDENT_ROUTES = [
+    '/student/dashboard',
+    '/student/profile',
+    '/student/attendance',
+    '/student/academics',
+    '/student/library',
+    '/student/library?subject=Database+Systems&type=book',
+    '/student/library?q=datab+concepts',
+    '/student/library/access/{resource}',
+    '/student/events',
+    '/student/events?when=past',
+    '/student/transportation',
+    '/student/transportation?stop=park',
+    '/student/api/attendance-chart?months=12&by=subject',
+]
+
+STAFF_ROUTES = [
+    '/staff/dashboard',
+    '/staff/examinations',
+    '/staff/examinations?course=Computer+Science&year=2&semester=3',
+    '/staff/fee-structure',
+    '/staff/fee-payments',
+    '/staff/fee-payments?status=pending&date_from=2024-01-01',
+    '/staff/fee-dues',
+    '/staff/fee-dues?course=Computer+Science&year=2&min_outstanding=100',
+    '/staff/transportation',
+    '/staff/attendance',
+    '/staff/attendance?course=Computer+Science&year=2',
+    '/staff/events',
+    '/staff/events?date_from=2024-01-01&date_to=2030-12-31',
+    '/staff/library',
+    '/staff/rankings',
+    '/staff/rankings?course=Computer+Science&year=2&semester=3',
+]
+
+# Full scans that are expected, keyed by the URL as listed above; filtered
+# variants of the same page are checked on their own
+ALLOWED_SCANS = {
+    # Fee structures are a short reference list shown in full
+    '/staff/fee-structure': {'fee_structure'},
+    # Unfiltered first pages walk the rowid b-tree in key order up to LIMIT
+    '/staff/transportation': {'bus_route'},
+    '/staff/attendance': {'student'},
+    '/staff/library': {'library_resource'},
+}
+
+SCAN_RE = re.compile(r'^SCAN (\w+)$')
+
+def capture_statements(client, url):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE')):
+            statements.append((statement, parameters))
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        response = client.get(url)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+    assert response.status_code < 400, f'{url} answered {response.status_code}'
+    return statements
+
+def full_scans(statement, parameters):
+    """Return the tables a statement reads without using an index."""
+    tables = set(db.metadata.tables)
+    with db.engine.connect() as conn:
+        plan = conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters).fetchall()
+    # A table walked through an index (``SCAN t USING [COVERING] INDEX i``),
+    # e.g. in key order up to a LIMIT, is not a full scan. A bare ``SCAN t``
+    # reads every row even when a LIMIT stops it early on a lucky page.
+    scanned = set()
+    for row in plan:
+        match = SCAN_RE.match(row[-1])
+        if match:
+            name = re.sub(r'_\d+$', '', match.group(1))
+            if name in tables:
+                scanned.add(name)
+    return scanned
+
+def assert_no_unexpected_scans(client, path, url):
+    statements = capture_statements(client, url)
+    assert statements, f'{url} issued no queries'
+    allowed = ALLOWED_SCANS.get(path, set())
+    for statement, parameters in statements:
+        unexpected = full_scans(statement, parameters) - allowed
+        assert not unexpected, f'{url} scans {sorted(unexpected)}:\n{statement}'
+
+@pytest.mark.parametrize('path', STUDENT_ROUTES)
+def test_student_route_plans(client, sample, path):
+    login(client, sample['student'])
+    url = path.format(resource=sample['resource'].id)
+    assert_no_unexpected_scans(client, path, url)
+
+@pytest.mark.parametrize('path', STAFF_ROUTES)
+def test_staff_route_plans(client, sample, path):
+    login(client, sample['principal'])
+    assert_no_unexpected_scans(client, path, path)
+
+def test_migration_creates_indexes(app):
+    names = {row[0] for row in db.session.execute(text(
+        "SELECT name FROM sqlite_master WHERE type = 'index'"
+    ))}
+    declared = {index.name for table in db.metadata.tables.values() for index in table.indexes}
+    assert declared <= names
+
+def test_limit_does_not_hide_filtered_scans(app):
+    # Stops at LIMIT, but may walk every student to find the matching ones
+    assert full_scans('SELECT * FROM student WHERE first_name = ? ORDER BY id LIMIT 5', ('Alice',)) == {'student'}
@@ -0,0 +1,84 @@
+from datetime import date, datetime
+from app import db
+from app.models import Examination, ExamResult, ResultSnapshot, Student, SubjectTopper, User
+from app.rankings import rebuild_rankings
+from conftest import login
+
+def add_cohort(sample, marks):
+    """Add a classmate per entry of ``marks`` ({subject: marks}) to the sample cohort."""
+    exams = {'Database Systems': sample['exam']}
+    student_ids = [sample['student'].student.id]
+    for index, scores in enumerate(marks):
+        user = User(username=f'classmate{index}', email=f'classmate{index}@college.edu',
+                    role='student', password_hash='x')
+        db.session.add(user)
+        db.session.flush()
+        student = Student(user_id=user.id, student_id=f'STU1{index:02d}', first_name='Class', last_name=str(index),
+                          date_of_birth=date(2003, 1, 1), gender='Other', course='Computer Science',
+                          year=2, semester=3, admission_date=date(2023, 8, 1))
+        db.session.add(student)
+        db.session.flush()
+        student_ids.append(student.id)
+        for subject, obtained in scores.items():
+            if subject not in exams:
+                exams[subject] = Examination(name='Mid-Term', subject=subject, course='Computer Science', year=2,
+                                             semester=3, exam_date=date.today(),
+                                             start_time=datetime.strptime('10:00', '%H:%M').time(),
+                                             duration_minutes=60, max_marks=100,
+                                             created_by=sample['exam'].created_by)
+                db.session.add(exams[subject])
+                db.session.flush()
+            db.session.add(ExamResult(examination_id=exams[subject].id, student_id=student.id,
+                                      marks_obtained=obtained))
+    db.session.commit()
+    return student_ids
+
+def test_ranks_percentiles_and_toppers(app, sample):
+    # The sample student scored 85 in Database Systems only
+    sample_id, first, second, third = add_cohort(sample, [
+        {'Database Systems': 95},
+        {'Database Systems': 85},
+        {'Database Systems': 60, 'Networks': 90},
+    ])
+    assert rebuild_rankings(db.session.connection()) == 4
+    standings = {snapshot.student_id: snapshot for snapshot in ResultSnapshot.query}
+
+    assert [standings[student_id].rank for student_id in (first, sample_id, second, third)] == [1, 2, 2, 4]
+    assert standings[first].percentile == 100.0
+    assert standings[third].percentile == 25.0
+    assert standings[third].percentage == 75.0 and standings[third].subjects == 2
+    assert {snapshot.cohort_size for snapshot in standings.values()} == {4}
+
+    toppers = {(topper.subject, topper.student_id) for topper in SubjectTopper.query}
+    assert toppers == {('Database Systems', first), ('Networks', third)}
+
+def test_rebuild_is_scoped_to_a_cohort(app, sample):
+    rebuild_rankings(db.session.connection())
+    db.session.add(ResultSnapshot(student_id=sample['student'].student.id, course='Mechanical', year=1,
+                                  semester=1, obtained_marks=1, total_marks=1, subjects=1, percentage=100,
+                                  rank=1, percentile=100, cohort_size=1))
+    db.session.flush()
+    rebuild_rankings(db.session.connection(), 'Computer Science', 2, 3)
+    assert ResultSnapshot.query.count() == 2
+
+def test_academics_shows_semester_totals_and_rank(client, sample):
+    add_cohort(sample, [{'Database Systems': 95}])
+    client.application.test_cli_runner().invoke(args=['rebuild', 'rankings'])
+    login(client, sample['student'])
+    page = client.get('/student/academics').get_data(as_text=True)
+    assert 'Year 2 - Semester 3' in page
+    assert '85.0%' in page
+    assert 'Rank 2 of 2' in page
+
+def test_staff_rankings_page(client, sample):
+    add_cohort(sample, [{'Database Systems': 95}])
+    login(client, sample['student'])
+    assert client.get('/staff/rankings').status_code == 302
+    login(client, sample['staff'])
+    assert 'not been computed' in client.get('/staff/rankings').get_data(as_text=True)
+
+    response = client.post('/staff/rankings/rebuild', data={})
+    assert response.status_code == 302
+    page = client.get('/staff/rankings').get_data(as_text=True)
+    assert 'Computer Science' in page and 'Subject Toppers' in page
+    assert page.index('STU100') < page.index('STU001')
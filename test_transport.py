@@ -0,0 +1,183 @@
+import os
+import threading
+from datetime import date
+from app import create_app, db
+from app.models import Bus, BusRoute, BusStop, BusSubscription, Student, User
+from app.transport import parse_stops, rebalance_routes, route_stops
+from conftest import TestConfig, login
+
+def add_students(count, prefix='TRN'):
+    """Student accounts without a bus pass."""
+    users = [User(username=f'{prefix.lower()}{index}', email=f'{prefix.lower()}{index}@college.edu',
+                  role='student', password_hash='x') for index in range(count)]
+    db.session.add_all(users)
+    db.session.flush()
+    db.session.add_all([Student(user_id=user.id, student_id=f'{prefix}{index:03d}', first_name='T',
+                                last_name=str(index), date_of_birth=date(2003, 1, 1), gender='Male',
+                                course='Computer Science', year=2, semester=3, admission_date=date(2023, 8, 1))
+                        for index, user in enumerate(users)])
+    db.session.commit()
+    return users
+
+def subscribe(client, user, route, stop='City'):
+    login(client, user)
+    return client.post('/student/transportation/subscribe', data={
+        'route_id': route.id, 'pickup_stop': stop, 'plan': 'monthly'
+    }, headers={'Accept': 'application/json'})
+
+def bus_state(bus):
+    db.session.expire_all()
+    allocated = BusSubscription.query.filter_by(bus_id=bus.id, is_active=True, seat_status='allocated').count()
+    return bus.current_occupancy, allocated
+
+def test_full_buses_waitlist_and_cancel_promotes(client, sample):
+    route = sample['route']
+    bus = Bus.query.one()
+    bus.capacity = 2
+    db.session.commit()
+    rebalance_routes(db.session.connection())  # seats the fixture's subscription
+    db.session.commit()
+    first, second, third = add_students(3)
+
+    assert subscribe(client, first, route).json['bus'] == 'CL-001'
+    response = subscribe(client, second, route)
+    assert response.status_code == 201
+    assert (response.json['seat_status'], response.json['waitlist_position']) == ('waitlisted', 1)
+    assert subscribe(client, third, route).json['waitlist_position'] == 2
+    assert bus_state(bus) == (2, 2)
+    assert subscribe(client, first, route).status_code == 409
+
+    login(client, third)
+    assert b'Waitlist #2' in client.get('/student/transportation').data
+
+    login(client, first)
+    seat = BusSubscription.query.filter_by(student_id=first.student.id, is_active=True).one()
+    assert client.post(f'/student/transportation/{seat.id}/cancel').status_code == 302
+    assert bus_state(bus) == (2, 2)
+    promoted = BusSubscription.query.filter_by(student_id=second.student.id).one()
+    assert (promoted.seat_status, promoted.bus_id) == ('allocated', bus.id)
+    # Cancelling frees the (student, route) pair for a new subscription
+    assert subscribe(client, first, route).json['waitlist_position'] == 2
+
+def test_riders_from_one_stop_share_a_bus(client, sample):
+    route = sample['route']
+    db.session.add(Bus(bus_number='CL-002', route_id=route.id, driver_name='Sam', driver_phone='2', capacity=40))
+    db.session.commit()
+    rebalance_routes(db.session.connection())
+    db.session.commit()
+    park_street = BusSubscription.query.one().bus.bus_number
+    students = add_students(4)
+
+    buses = [subscribe(client, user, route, stop).json['bus']
+             for user, stop in zip(students, ['City', 'Park Street', 'City', 'Park Street'])]
+    assert buses[1] == buses[3] == park_street
+    assert buses[0] == buses[2] != park_street
+
+def test_rebalance_repairs_counts_and_empties_buses_in_maintenance(app, client, sample):
+    route = sample['route']
+    bus = Bus.query.one()
+    spare = Bus(bus_number='CL-002', route_id=route.id, driver_name='Sam', driver_phone='2', capacity=2)
+    db.session.add(spare)
+    db.session.commit()
+    for user in add_students(3):
+        subscribe(client, user, route)
+    bus.status = 'maintenance'
+    bus.current_occupancy = 17
+    db.session.commit()
+
+    result = app.test_cli_runner().invoke(args=['rebuild', 'bus-allocation', '--route', str(route.id)])
+    assert '2 seats allocated, 2 waitlisted' in result.output
+    assert bus_state(bus) == (0, 0)
+    assert bus_state(spare) == (2, 2)
+
+    bus.status = 'available'
+    db.session.commit()
+    login(client, sample['staff'])
+    response = client.post(f'/staff/bus-routes/{route.id}/rebalance', follow_redirects=True)
+    assert b'4 seats allocated, 0 waitlisted, 0 riders moved' in response.data
+    assert bus_state(bus) == (2, 2)
+
+def test_concurrent_subscribers_never_overbook(tmp_path):
+    class FileConfig(TestConfig):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(tmp_path, 'transport.db')
+        SQL_GUARD_RAISE = False
+
+    app = create_app(FileConfig)
+    with app.app_context():
+        route = BusRoute(route_name='Rush', route_number='R900', starting_point='A', ending_point='B',
+                         total_distance=5.0, estimated_time=20, stops='["A", "B"]', monthly_fee=10.0, term_fee=30.0)
+        db.session.add(route)
+        db.session.flush()
+        db.session.add_all([Bus(bus_number=f'RS-{index}', route_id=route.id, driver_name='D', driver_phone='1',
+                                capacity=3) for index in range(2)])
+        users = add_students(16, prefix='RSH')
+        route_id, user_ids = route.id, [user.id for user in users]
+        db.session.remove()
+
+    barrier = threading.Barrier(len(user_ids))
+    statuses = []
+
+    def rider(user_id):
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = str(user_id)
+        barrier.wait()
+        response = client.post('/student/transportation/subscribe', data={
+            'route_id': route_id, 'pickup_stop': 'A'
+        }, headers={'Accept': 'application/json'})
+        statuses.append(response.status_code)
+
+    threads = [threading.Thread(target=rider, args=(user_id,)) for user_id in user_ids]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    with app.app_context():
+        assert statuses == [201] * len(user_ids)
+        for bus in Bus.query:
+            assert bus_state(bus) == (3, 3)
+        assert BusSubscription.query.filter_by(seat_status='waitlisted').count() == len(user_ids) - 6
+        db.session.remove()
+        db.engine.dispose()
+
+def test_added_route_gets_ordered_stops(client, sample):
+    login(client, sample['staff'])
+    assert b'Route Number' in client.get('/staff/bus-routes/add').data
+    form = {'route_name': 'Lake Route', 'route_number': 'R002', 'starting_point': 'Lake', 'ending_point': 'Campus',
+            'total_distance': '8', 'estimated_time': '25', 'monthly_fee': '90', 'term_fee': '250',
+            'stops': 'Lake View | 0\n  Park   Avenue | 12\n\nCampus | 25\n'}
+    assert client.post('/staff/bus-routes/add', data=dict(form, stops='Lake | soon')).status_code == 400
+    assert client.post('/staff/bus-routes/add', data=form).status_code == 302
+
+    route = BusRoute.query.filter_by(route_number='R002').one()
+    assert [(stop.sequence, stop.name, stop.name_key, stop.offset_minutes) for stop in route.bus_stops] == [
+        (1, 'Lake View', 'lake view', 0), (2, 'Park Avenue', 'park avenue', 12), (3, 'Campus', 'campus', 25)]
+    assert parse_stops(route.stops) == [('Lake View', 0), ('Park Avenue', 12), ('Campus', 25)]
+
+    # Editing the JSON replaces the rows, and the cached stop list with them
+    assert route_stops(route.id) == ('Lake View', 'Park Avenue', 'Campus')
+    route.stops = '["Lake View", "Campus"]'
+    db.session.commit()
+    assert route_stops(route.id) == ('Lake View', 'Campus')
+    assert BusStop.query.filter_by(route_id=route.id).count() == 2
+
+def test_routes_filtered_by_stop_prefix(app, client, sample):
+    db.session.add(BusRoute(route_name='Lake Route', route_number='R002', starting_point='Lake', ending_point='Campus',
+                            total_distance=8.0, estimated_time=25, stops='["Lake View", "Parkside"]',
+                            monthly_fee=90.0, term_fee=250.0))
+    db.session.commit()
+    login(client, sample['student'])
+
+    page = client.get('/student/transportation?stop=PARK')
+    assert b'City Route' in page.data and b'Lake Route' in page.data
+    assert b'<mark>Parkside</mark>' in page.data
+    page = client.get('/student/transportation?stop=park+street')
+    assert b'City Route' in page.data and b'Lake Route' not in page.data
+    assert b'No available route stops' in client.get('/student/transportation?stop=harbour').data
+
+    db.session.execute(db.delete(BusStop))
+    db.session.commit()
+    result = app.test_cli_runner().invoke(args=['rebuild', 'bus-stops'])
+    assert 'Bus stops rebuilt.' in result.output
+    assert BusStop.query.count() == 5